@@ -0,0 +1,342 @@
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional
+
+import tools
+import profiling
+
+# ==============================================================
+# Batch runner: validate many files through a bounded worker queue
+# ==============================================================
+# Usage:
+#   python batch.py incoming/ "partners/*.csv" --table customer_orders --workers 4
+#   python batch.py --manifest nightly.csv --output-dir reports/nightly
+#
+# A manifest is either a JSON list of {"file_path": ..., "table_name": ...} objects
+# or a CSV with 'file_path' and optional 'table_name' columns. Each file gets its
+# own report in --output-dir; a summary table is printed at the end.
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.xls') + tools.PARQUET_EXTENSIONS + tools.ARROW_IPC_EXTENSIONS
+DEFAULT_OUTPUT_DIR = "batch_reports"
+MAX_JOB_ATTEMPTS = 2 # Solo runs that crash a worker before a job is given up
+
+
+def _is_partitioned_dataset(path: str) -> bool:
+    """A directory with hive-style 'key=value' subdirectories is one columnar dataset, not a folder of files."""
+    return any(entry.is_dir() and '=' in entry.name for entry in os.scandir(path)) and tools.get_columnar_format(path) is not None
+
+
+def expand_inputs(inputs: List[str], recursive: bool = False) -> List[str]:
+    """Expands directories and glob patterns into a sorted, de-duplicated list of input paths."""
+    paths = []
+    for item in inputs:
+        matches = sorted(glob.glob(item, recursive=True)) if glob.has_magic(item) else [item]
+        if not matches:
+            logging.warning(f"No files match '{item}'.")
+        for path in matches:
+            if os.path.isdir(path) and not _is_partitioned_dataset(path):
+                pattern = os.path.join(path, "**", "*") if recursive else os.path.join(path, "*")
+                paths.extend(p for p in sorted(glob.glob(pattern, recursive=recursive))
+                             if os.path.isfile(p) and p.lower().endswith(SUPPORTED_EXTENSIONS))
+            elif os.path.exists(path):
+                paths.append(path)
+            else:
+                logging.warning(f"Input '{path}' does not exist.")
+    seen = set()
+    return [p for p in paths if not (os.path.abspath(p) in seen or seen.add(os.path.abspath(p)))]
+
+
+def load_manifest(manifest_path: str) -> List[Dict[str, Optional[str]]]:
+    """Reads (file_path, table_name) jobs from a JSON or CSV manifest; relative paths are resolved against the manifest."""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, "r", newline="") as f:
+        if manifest_path.lower().endswith(".json"):
+            entries = json.load(f)
+        else:
+            entries = list(csv.DictReader(f))
+    jobs = []
+    for entry in entries:
+        file_path = (entry.get("file_path") or "").strip()
+        if not file_path:
+            continue
+        jobs.append({
+            "file_path": file_path if os.path.isabs(file_path) else os.path.join(base_dir, file_path),
+            "table_name": (entry.get("table_name") or "").strip() or None
+        })
+    return jobs
+
+
+def drop_duplicate_jobs(jobs: List[Dict[str, Optional[str]]]) -> List[Dict[str, Optional[str]]]:
+    """Keeps the first of any jobs naming the same file and table; a repeat would redo the run and overwrite its report."""
+    seen, unique = set(), []
+    for job in jobs:
+        key = (os.path.abspath(job["file_path"]), job["table_name"])
+        if key in seen:
+            logging.warning(f"Skipping duplicate job: '{job['file_path']}' against '{job['table_name']}'.")
+            continue
+        seen.add(key)
+        unique.append(job)
+    return unique
+
+
+def report_path_for(output_dir: str, file_path: str, table_name: Optional[str] = None) -> str:
+    """Unique report path per job: the base name plus a short hash of the absolute path and the target table."""
+    base_name = os.path.basename(os.path.normpath(file_path))
+    key = f"{os.path.abspath(file_path)}\0{table_name or ''}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(output_dir, f"{base_name}.{digest}.json")
+
+
+def _input_size(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+    return os.path.getsize(path)
+
+
+def _init_worker(memory_limit_mb: Optional[int]) -> None:
+    if memory_limit_mb:
+        try:
+            import resource
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            logging.warning(f"Could not apply a {memory_limit_mb} MB memory limit to the worker: {e}")
+
+
+def _overall_status(report: Dict[str, Any]) -> str:
+    """Worst validation status across the report's sheets."""
+    sheets = report.get("sheet_validation_results")
+    statuses = [s.get("validation_summary", {}).get("status") for s in sheets.values()] if sheets is not None \
+        else [report.get("validation_summary", {}).get("status")]
+    for status in ("Error", "Failed", "Skipped", "Partial", "Passed with Warnings", "Passed"):
+        if status in statuses:
+            return status
+    return "Unknown"
+
+
+def run_job(job: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Validates one file in a worker process and returns a summary row for it."""
+    import main # The LLM client is created lazily, on the first LLM call in this worker
+
+    started = time.perf_counter()
+    result = {"file_path": job["file_path"], "table_name": job["table_name"], "report_path": job["report_path"],
+              "size_bytes": job["size_bytes"], "status": "Error", "sheets": 0, "rows": 0, "error": None}
+    try:
+        report = main.run_multi_sheet_validation(
+            file_path=job["file_path"],
+            db_url=options["db_url"],
+            user_provided_table_name=job["table_name"],
+            memory_budget=options["memory_budget"],
+            incremental=options["incremental"],
+            resume=options["resume"],
+            output_path=job["report_path"],
+            trace=options.get("trace", False),
+            batch_final_analysis=options.get("batch_final_analysis", False),
+            deadline_s=options["deadline_s"] if options.get("deadline_s") is not None else main.VALIDATION_RUN_DEADLINE_S,
+            sample_rows=options.get("sample_rows"),
+            sample_method=options.get("sample_method") or "uniform",
+            statistical_profile=options["statistical_profile"] if options.get("statistical_profile") is not None else main.STATISTICAL_PROFILE,
+            profile=options.get("profile"),
+            profile_stages=options.get("profile_stages"),
+            print_report=False
+        )
+        if report is None:
+            result["error"] = "Validation aborted; see the worker log."
+        else:
+            sheets = report.get("sheet_validation_results")
+            sheet_reports = list(sheets.values()) if sheets is not None else [report]
+            result["status"] = _overall_status(report)
+            result["sheets"] = len(sheet_reports)
+            result["rows"] = sum(s.get("total_rows_checked") or 0 for s in sheet_reports)
+            result["error"] = next((s["error"] for s in sheet_reports if s.get("error")), None)
+            if options["markdown"]:
+                import build_md
+                with open(os.path.splitext(job["report_path"])[0] + ".md", "w") as f:
+                    f.write(build_md.create_validation_markdown(report))
+    except MemoryError:
+        result["error"] = "Worker ran out of memory (see --memory-limit-mb)."
+    except Exception as e:
+        logging.error(f"Batch job for '{job['file_path']}' failed: {e}", exc_info=True)
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_batch(
+    jobs: List[Dict[str, Optional[str]]],
+    output_dir: str,
+    options: Dict[str, Any],
+    workers: int = 2,
+    memory_limit_mb: Optional[int] = None,
+    max_inflight_mb: Optional[int] = None,
+    tasks_per_worker: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Runs jobs on a process pool with at most `workers` files in flight, and (with
+    `max_inflight_mb`) at most that many MB of input in flight; a single file larger
+    than the budget still runs, alone. Each worker's address space is capped at
+    `memory_limit_mb`. If a worker dies, the pool is rebuilt and the jobs that were
+    in flight are rerun one at a time; a job is reported as failed once it has taken
+    down a worker on its own MAX_JOB_ATTEMPTS times.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    queue = [{**job, "report_path": report_path_for(output_dir, job["file_path"], job["table_name"]),
+              "size_bytes": _input_size(job["file_path"]), "attempts": 0, "isolated": False} for job in jobs]
+    queue.reverse() # pop() from the end keeps submission in input order
+    budget_bytes = max_inflight_mb * 1024 * 1024 if max_inflight_mb else None
+    pool_kwargs = {"max_workers": workers, "initializer": _init_worker, "initargs": (memory_limit_mb,)}
+    if tasks_per_worker:
+        pool_kwargs["max_tasks_per_child"] = tasks_per_worker
+
+    results = []
+    pool = ProcessPoolExecutor(**pool_kwargs)
+    in_flight = {}
+    try:
+        while queue or in_flight:
+            inflight_bytes = sum(job["size_bytes"] for job in in_flight.values())
+            while queue and len(in_flight) < workers:
+                job = queue[-1]
+                if in_flight and (job["isolated"] or any(j["isolated"] for j in in_flight.values())):
+                    break
+                if budget_bytes and in_flight and inflight_bytes + job["size_bytes"] > budget_bytes:
+                    break
+                queue.pop()
+                job["attempts"] += 1
+                in_flight[pool.submit(run_job, job, options)] = job
+                inflight_bytes += job["size_bytes"]
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            finished = [f for f in done if not isinstance(f.exception(), BrokenProcessPool)]
+            for future in finished:
+                in_flight.pop(future)
+                result = future.result()
+                logging.info(f"[{len(results) + 1}/{len(jobs)}] {result['status']}: {result['file_path']}")
+                results.append(result)
+            if len(finished) == len(done):
+                continue
+
+            # Every job of a broken pool fails, so the culprit is unknown: rerun those jobs
+            # alone, and only count an attempt against a job that took a worker down by itself
+            broken = list(in_flight.values())
+            in_flight.clear()
+            pool.shutdown(wait=False, cancel_futures=True)
+            pool = ProcessPoolExecutor(**pool_kwargs)
+            for job in broken:
+                if not job["isolated"]:
+                    job["isolated"] = True
+                    job["attempts"] -= 1
+                elif job["attempts"] >= MAX_JOB_ATTEMPTS:
+                    results.append({
+                        "file_path": job["file_path"], "table_name": job["table_name"], "report_path": None,
+                        "size_bytes": job["size_bytes"], "status": "Error", "sheets": 0, "rows": 0,
+                        "seconds": None, "error": "Worker process died (out of memory?)."
+                    })
+                    logging.error(f"[{len(results)}/{len(jobs)}] Worker died on '{job['file_path']}' {job['attempts']} times.")
+                    continue
+                logging.warning(f"Worker died while '{job['file_path']}' was in flight; requeueing it to run alone.")
+                queue.append(job)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return results
+
+
+def format_summary(results: List[Dict[str, Any]], wall_seconds: float) -> str:
+    """Plain-text table of per-file outcomes followed by throughput totals."""
+    header = ("Status", "Sheets", "Rows", "MB", "Seconds", "Rows/s", "File")
+    rows = []
+    for r in sorted(results, key=lambda r: r["file_path"]):
+        mb = r["size_bytes"] / (1024 * 1024)
+        seconds = r.get("seconds")
+        rows.append((
+            r["status"], str(r["sheets"]), str(r["rows"]), f"{mb:.2f}",
+            f"{seconds:.1f}" if seconds is not None else "-",
+            f"{r['rows'] / seconds:,.0f}" if seconds else "-",
+            r["file_path"] + (f"  ({r['error']})" if r.get("error") else "")
+        ))
+    widths = [max(len(header[i]), *(len(row[i]) for row in rows)) if rows else len(header[i]) for i in range(len(header) - 1)]
+    lines = ["  ".join(h.ljust(w) for h, w in zip(header, widths)) + "  " + header[-1]]
+    lines.append("-" * (sum(widths) + 2 * len(widths) + len(header[-1])))
+    for row in rows:
+        lines.append("  ".join(v.ljust(w) for v, w in zip(row, widths)) + "  " + row[-1])
+
+    outcomes = {}
+    for r in results:
+        outcomes[r["status"]] = outcomes.get(r["status"], 0) + 1
+    total_mb = sum(r["size_bytes"] for r in results) / (1024 * 1024)
+    total_rows = sum(r["rows"] for r in results)
+    lines.append("")
+    lines.append(f"Files: {len(results)}  |  " + ", ".join(f"{k}: {v}" for k, v in sorted(outcomes.items())))
+    if wall_seconds > 0:
+        lines.append(
+            f"Wall time: {wall_seconds:.1f}s  |  {len(results) / wall_seconds * 60:.1f} files/min  |  "
+            f"{total_mb / wall_seconds:.2f} MB/s  |  {total_rows / wall_seconds:,.0f} rows/s"
+        )
+    return "\n".join(lines)
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Validate many files against database tables.")
+    parser.add_argument("inputs", nargs="*", help="Files, directories or glob patterns to validate.")
+    parser.add_argument("--manifest", help="JSON or CSV manifest of file_path/table_name pairs.")
+    parser.add_argument("--table", help="Target table for inputs that do not name one in the manifest.")
+    parser.add_argument("--db-url", default=os.getenv("DB_URL", "sqlite:///database/sample_data.db"))
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Directory for per-file reports.")
+    parser.add_argument("--recursive", action="store_true", help="Search input directories recursively.")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="Files validated concurrently.")
+    parser.add_argument("--memory-limit-mb", type=int, help="Address-space limit per worker process (Unix).")
+    parser.add_argument("--max-inflight-mb", type=int, help="Cap on the total input size being validated at once.")
+    parser.add_argument("--tasks-per-worker", type=int, help="Replace each worker process after this many files.")
+    parser.add_argument("--memory-budget", action="store_true", help="Run each file in memory-budget mode.")
+    parser.add_argument("--incremental", action="store_true", help="Reuse stored results for unchanged sheets.")
+    parser.add_argument("--resume", action="store_true", help="Resume each file's run from its checkpoints.")
+    parser.add_argument("--markdown", action="store_true", help="Also write a Markdown report per file.")
+    parser.add_argument("--trace", action="store_true", help="Record per-stage spans; writes trace files next to each report.")
+    parser.add_argument("--batch-final-analysis", action="store_true", help="Request the final analysis of several sheets of a workbook at once.")
+    parser.add_argument("--deadline", type=float, help="Seconds per file before its LLM stages are cancelled and a partial report is written.")
+    parser.add_argument("--sample-rows", type=int, help="Check a sample of this many rows per sheet (escalates to all rows when violations are frequent).")
+    parser.add_argument("--sample-method", default="uniform", help="uniform, stratified or stratified:<file column> (with --sample-rows).")
+    parser.add_argument("--statistical-profile", action="store_true", default=None,
+                        help="Add a statistical profile to the reports (default: STATISTICAL_PROFILE).")
+    parser.add_argument("--profile", choices=profiling.PROFILE_MODES, help="Profile each file; writes profiles next to each report.")
+    parser.add_argument("--profile-stages", help="Comma-separated stages to profile (default: the whole run), e.g. deep_validation,final_analysis.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    jobs = load_manifest(args.manifest) if args.manifest else []
+    jobs += [{"file_path": path, "table_name": None} for path in expand_inputs(args.inputs, args.recursive)]
+    for job in jobs:
+        job["table_name"] = job["table_name"] or args.table
+    if not jobs:
+        parser.error("No input files found.")
+    missing_table = [job["file_path"] for job in jobs if not job["table_name"]]
+    if missing_table:
+        # Workers cannot prompt for a table interactively
+        parser.error(f"No target table for {len(missing_table)} file(s), e.g. '{missing_table[0]}'. Use --table or a manifest.")
+    jobs = drop_duplicate_jobs(jobs)
+
+    options = {"db_url": args.db_url, "memory_budget": args.memory_budget, "incremental": args.incremental,
+               "resume": args.resume, "markdown": args.markdown, "trace": args.trace,
+               "batch_final_analysis": args.batch_final_analysis, "profile": args.profile,
+               "deadline_s": args.deadline, "sample_rows": args.sample_rows, "sample_method": args.sample_method,
+               "statistical_profile": args.statistical_profile,
+               "profile_stages": [s.strip() for s in args.profile_stages.split(",") if s.strip()] if args.profile_stages else None}
+    logging.info(f"Validating {len(jobs)} file(s) with {args.workers} worker(s); reports go to '{args.output_dir}'.")
+    started = time.perf_counter()
+    results = run_batch(jobs, args.output_dir, options, workers=max(1, args.workers),
+                        memory_limit_mb=args.memory_limit_mb, max_inflight_mb=args.max_inflight_mb,
+                        tasks_per_worker=args.tasks_per_worker)
+    print(format_summary(results, time.perf_counter() - started))
+    return 1 if any(r["status"] == "Error" for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
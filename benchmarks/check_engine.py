@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import platform
+import statistics
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import tools
+import tracing
+import synthetic_data
+
+# ==============================================================
+# Check engine benchmark: scaling and regressions
+# ==============================================================
+# Usage:
+#   python benchmarks/check_engine.py --rows 1k,10k,100k,1M --save-baseline benchmarks/baseline.json
+#   python benchmarks/check_engine.py --rows 1k,10k,100k,1M --baseline benchmarks/baseline.json
+#
+# For each table and size, generates a frame (see synthetic_data.py) and times
+# tools.extract_schema_from_df, tools.validate_data_types and
+# tools.run_data_quality_checks (median of --repeats), with per-check totals from
+# their tracing spans. Peak memory per stage is measured in a separate tracemalloc
+# pass so it does not skew the timings. The scaling exponent per stage is the
+# log-log slope of time over rows (1.0 = linear).
+#
+# With --baseline, exits 1 when a stage is slower, or peaks higher, than the
+# baseline by more than --tolerance (ignoring differences under a few ms / MB).
+# Baselines are per machine: save one on the machine that runs the comparison.
+
+DEFAULT_SIZES = "1k,10k,100k"
+DEFAULT_TABLES = "customer_orders,products"
+DEFAULT_ERROR_RATES = {"null_rate": 0.01, "duplicate_pk_rate": 0.001, "type_corruption_rate": 0.0, "check_violation_rate": 0.01}
+REGRESSION_TOLERANCE = 0.25
+MIN_TIME_DIFF_MS = 5.0
+MIN_MEMORY_DIFF_MB = 1.0
+STAGES = ("extract_schema", "validate_data_types", "run_data_quality_checks")
+
+
+def _run_stage(stage: str, df, db_schema: Dict[str, Any], engine, table_name: str, workers: Optional[int]):
+    if stage == "extract_schema":
+        return tools.extract_schema_from_df(df, "benchmark.csv", None)
+    if stage == "validate_data_types":
+        return tools.validate_data_types(df, db_schema, max_workers=workers)
+    return tools.run_data_quality_checks(df, db_schema, engine, table_name, max_workers=workers)
+
+
+def benchmark_size(engine, table_name: str, rows: int, error_rates: Dict[str, float],
+                   repeats: int = 3, workers: Optional[int] = None, measure_memory: bool = True) -> List[Dict[str, Any]]:
+    """Times each stage on one generated frame; returns one result row per stage."""
+    db_schema, check_constraints = synthetic_data.load_table(engine, table_name)
+    df, injected = synthetic_data.generate_frame(db_schema, check_constraints, rows, **error_rates)
+    results = []
+    for stage in STAGES:
+        walls, cpus, checks = [], [], {}
+        for _ in range(max(1, repeats)):
+            tracer = tracing.Tracer(track_memory=False)
+            with tracing.activate(tracer):
+                started, cpu_started = time.perf_counter(), time.process_time()
+                _run_stage(stage, df, db_schema, engine, table_name, workers)
+                walls.append((time.perf_counter() - started) * 1000)
+                cpus.append((time.process_time() - cpu_started) * 1000)
+            for name, totals in tracer.summary().items():
+                if name.startswith("check."):
+                    checks.setdefault(name, []).append(totals["wall_ms"])
+
+        peak_mb = None
+        if measure_memory:
+            started_tracemalloc = not tracemalloc.is_tracing()
+            if started_tracemalloc:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            baseline_bytes = tracemalloc.get_traced_memory()[0]
+            _run_stage(stage, df, db_schema, engine, table_name, workers)
+            peak_mb = round((tracemalloc.get_traced_memory()[1] - baseline_bytes) / 2**20, 2)
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+        wall_ms = statistics.median(walls)
+        results.append({
+            "table": table_name,
+            "rows": rows,
+            "stage": stage,
+            "wall_ms": round(wall_ms, 2),
+            "cpu_ms": round(statistics.median(cpus), 2),
+            "rows_per_second": round(rows / (wall_ms / 1000)) if wall_ms else None,
+            "peak_mb": peak_mb,
+            "checks_ms": {name: round(statistics.median(times), 2) for name, times in sorted(checks.items())},
+        })
+    logging.info(f"{table_name} @ {rows:,} rows: injected {json.dumps(injected)}")
+    return results
+
+
+def scaling_exponents(results: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Least-squares slope of log(wall_ms) over log(rows) per table and stage."""
+    series: Dict[str, List[tuple]] = {}
+    for r in results:
+        if r["wall_ms"] > 0:
+            series.setdefault(f"{r['table']}/{r['stage']}", []).append((math.log(r["rows"]), math.log(r["wall_ms"])))
+    exponents = {}
+    for key, points in series.items():
+        if len({x for x, _ in points}) < 2:
+            continue
+        mean_x = statistics.mean(x for x, _ in points)
+        mean_y = statistics.mean(y for _, y in points)
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / sum((x - mean_x) ** 2 for x, _ in points)
+        exponents[key] = round(slope, 2)
+    return exponents
+
+
+def compare_to_baseline(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regression messages for stages slower or heavier than the baseline beyond `tolerance`."""
+    base_rows = {(r["table"], r["rows"], r["stage"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        base = base_rows.get((r["table"], r["rows"], r["stage"]))
+        if base is None:
+            continue
+        label = f"{r['table']} {r['stage']} @ {r['rows']:,} rows"
+        if r["wall_ms"] > base["wall_ms"] * (1 + tolerance) and r["wall_ms"] - base["wall_ms"] > MIN_TIME_DIFF_MS:
+            regressions.append(f"{label}: {r['wall_ms']:.1f} ms vs baseline {base['wall_ms']:.1f} ms")
+        if r["peak_mb"] is not None and base.get("peak_mb") is not None \
+                and r["peak_mb"] > base["peak_mb"] * (1 + tolerance) and r["peak_mb"] - base["peak_mb"] > MIN_MEMORY_DIFF_MB:
+            regressions.append(f"{label}: peak {r['peak_mb']:.1f} MB vs baseline {base['peak_mb']:.1f} MB")
+    return regressions
+
+
+def format_results(results: List[Dict[str, Any]], exponents: Dict[str, float]) -> str:
+    lines = [f"{'table':<16} {'stage':<24} {'rows':>12} {'wall ms':>10} {'cpu ms':>10} {'rows/s':>12} {'peak MB':>9}"]
+    for r in results:
+        peak = f"{r['peak_mb']:.1f}" if r["peak_mb"] is not None else "-"
+        lines.append(f"{r['table']:<16} {r['stage']:<24} {r['rows']:>12,} {r['wall_ms']:>10.1f} {r['cpu_ms']:>10.1f} "
+                     f"{r['rows_per_second'] or 0:>12,} {peak:>9}")
+    if exponents:
+        lines.append("scaling (time ~ rows^k):")
+        lines += [f"  {key:<42} k={k:.2f}" for key, k in sorted(exponents.items())]
+    return "\n".join(lines)
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the check engine on synthetic data.")
+    parser.add_argument("--rows", default=DEFAULT_SIZES, help="Comma-separated sizes, e.g. 1k,10k,100k,1M,50M.")
+    parser.add_argument("--tables", default=DEFAULT_TABLES, help="Comma-separated table names.")
+    parser.add_argument("--db-url", help="Reflect the tables from this database instead of the built-in DDL.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--workers", type=int, help="Column check threads (default: tools.COLUMN_CHECK_WORKERS).")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass.")
+    for rate, default in DEFAULT_ERROR_RATES.items():
+        parser.add_argument(f"--{rate.replace('_', '-')}", type=float, default=default)
+    parser.add_argument("--output", help="Write the results as JSON.")
+    parser.add_argument("--baseline", help="Compare against this results file; exit 1 on regressions.")
+    parser.add_argument("--save-baseline", help="Write the results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+    sizes = [synthetic_data.parse_row_count(s) for s in args.rows.split(",") if s.strip()]
+    engine = tools.get_engine(args.db_url) if args.db_url else synthetic_data.builtin_engine(tables)
+    error_rates = {rate: getattr(args, rate) for rate in DEFAULT_ERROR_RATES}
+
+    results = []
+    for table_name in tables:
+        for rows in sizes:
+            results += benchmark_size(engine, table_name, rows, error_rates, args.repeats, args.workers, not args.no_memory)
+    exponents = scaling_exponents(results)
+    print(format_results(results, exponents))
+
+    document = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "error_rates": error_rates,
+        "results": results,
+        "scaling_exponents": exponents,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(document, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"FAIL: {len(regressions)} regression(s) against {args.baseline}:")
+            for message in regressions:
+                print(f"  {message}")
+            return 1
+        print(f"OK: no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
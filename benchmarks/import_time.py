@@ -0,0 +1,81 @@
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# ==============================================================
+# Import-time budget for main.py
+# ==============================================================
+# Usage: python benchmarks/import_time.py [--budget-ms 1000] [--runs 5]
+#
+# Imports main in fresh interpreters with -X importtime and fails (exit 1) if the
+# median cumulative import time is over budget, or if importing main pulled in
+# the LLM stack, which must stay lazy (see main.get_client).
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_IMPORT_BUDGET_MS = float(os.getenv("MAIN_IMPORT_BUDGET_MS", "1000"))
+LAZY_MODULES = ("openai", "httpx", "tiktoken")
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure_import(module: str = "main") -> dict:
+    """Imports `module` in a fresh interpreter; returns its cumulative import time, slowest dependencies and loaded lazy modules."""
+    probe = f"import sys, json; import {module}; print(json.dumps([m for m in {list(LAZY_MODULES)!r} if m in sys.modules]))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    total_us, top_level = None, []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative_us, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if name == module and indent == 1:
+            total_us = cumulative_us
+        elif indent == 3:
+            top_level.append((cumulative_us, name)) # Direct imports of the measured module
+    return {
+        "total_ms": (total_us or 0) / 1000,
+        "slowest": [{"module": name, "ms": round(us / 1000, 1)} for us, name in sorted(top_level, reverse=True)[:8]],
+        "lazy_modules_loaded": json.loads(proc.stdout.strip().splitlines()[-1]),
+    }
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check main.py's import time against a budget.")
+    parser.add_argument("--budget-ms", type=float, default=MAIN_IMPORT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default="main")
+    args = parser.parse_args(argv)
+
+    runs = [measure_import(args.module) for _ in range(max(1, args.runs))]
+    median_ms = statistics.median(r["total_ms"] for r in runs)
+    loaded = sorted({m for r in runs for m in r["lazy_modules_loaded"]})
+
+    print(f"import {args.module}: median {median_ms:.0f} ms over {len(runs)} runs (budget {args.budget_ms:.0f} ms)")
+    print("slowest direct imports (last run):")
+    for entry in runs[-1]["slowest"]:
+        print(f"  {entry['ms']:8.1f} ms  {entry['module']}")
+
+    failed = False
+    if median_ms > args.budget_ms:
+        print(f"FAIL: import time is over budget by {median_ms - args.budget_ms:.0f} ms")
+        failed = True
+    if loaded:
+        print(f"FAIL: importing {args.module} loaded modules that must stay lazy: {', '.join(loaded)}")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
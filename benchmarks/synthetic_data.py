@@ -0,0 +1,258 @@
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import inspect
+from typing import Dict, Any, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import tools
+import setup_database
+
+# ==============================================================
+# Synthetic data for benchmarks, driven by table schemas
+# ==============================================================
+# Usage:
+#   python benchmarks/synthetic_data.py orders.parquet --table customer_orders --rows 50M \
+#       --null-rate 0.01 --duplicate-pk-rate 0.001 --type-corruption-rate 0.001 --check-violation-rate 0.01
+#
+# Schemas come from the DDL in setup_database.py (customer_orders, products) or are
+# reflected from any database with --db-url. Columns are generated from their SQL
+# type and CHECK constraints; the error rates then inject the violations the check
+# engine looks for:
+#   null_rate             nulls in every column (violations in NOT NULL columns)
+#   duplicate_pk_rate     primary key values copied from other rows
+#   type_corruption_rate  non-parseable strings in numeric and DATE/TIMESTAMP columns
+#   check_violation_rate  values just outside simple CHECK bounds (e.g. Quantity > 0)
+# Files are written in chunks (CSV or Parquet), so sizes are not bounded by memory.
+
+ERROR_RATES = ("null_rate", "duplicate_pk_rate", "type_corruption_rate", "check_violation_rate")
+DEFAULT_CHUNK_ROWS = 1_000_000
+BASE_DATE = np.datetime64("2020-01-01")
+CORRUPT_VALUES = np.array(["n/a", "ERR", "#VALUE!", "twelve", "?"], dtype=object)
+_CHECK_PATTERN = r'["`]?{column}["`]?\s*(>=|<=|>|<)\s*(-?\d+(\.\d+)?)'
+
+
+def parse_row_count(text: str) -> int:
+    """Parses '1000', '10k', '1.5M' or '50M' into a row count."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kKmM]?)\s*", text)
+    if not match:
+        raise ValueError(f"Invalid row count: '{text}'")
+    scale = {"": 1, "k": 1_000, "m": 1_000_000}[match.group(2).lower()]
+    return int(float(match.group(1)) * scale)
+
+
+def builtin_engine(tables: Optional[List[str]] = None) -> sqlalchemy.engine.Engine:
+    """An engine on a temporary SQLite database created from setup_database.TABLE_DDL (no rows)."""
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench-db-"), "bench.db")
+    engine = sqlalchemy.create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        for name, ddl in setup_database.TABLE_DDL.items():
+            if tables is None or name in tables:
+                conn.exec_driver_sql(ddl)
+    return engine
+
+
+def load_table(engine: sqlalchemy.engine.Engine, table_name: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Reflects a table's schema and CHECK constraints, as the validator sees them."""
+    db_schema = tools.get_db_schema(engine, table_name)
+    if db_schema is None:
+        raise ValueError(f"Table '{table_name}' does not exist.")
+    try:
+        check_constraints = inspect(engine).get_check_constraints(table_name)
+    except NotImplementedError:
+        check_constraints = []
+    return db_schema, check_constraints
+
+
+def _column_kind(column: str, sql_type: str) -> str:
+    base = sql_type.split("(")[0].upper()
+    if any(t in base for t in ("INT", "SERIAL")):
+        return "integer"
+    if any(t in base for t in ("REAL", "FLOAT", "DOUBLE", "NUMERIC", "DECIMAL")):
+        return "float"
+    if "BOOL" in base:
+        return "boolean"
+    if "DATE" in base or "TIME" in base or "date" in column.lower():
+        return "date" # TEXT date columns (as in the sample tables) get ISO strings too
+    return "text"
+
+
+def _check_bounds(column: str, check_constraints: List[Dict[str, Any]]) -> Tuple[Optional[float], Optional[float], bool, bool]:
+    """Lower/upper bounds (and whether each is strict) from simple CHECK constraints on the column."""
+    low = high = None
+    low_strict = high_strict = False
+    for constraint in check_constraints:
+        match = re.match(_CHECK_PATTERN.format(column=re.escape(column)), constraint.get("sqltext", "").strip(), re.IGNORECASE)
+        if not match:
+            continue
+        operator, value = match.group(1), float(match.group(2))
+        if operator in (">", ">="):
+            low, low_strict = value, operator == ">"
+        else:
+            high, high_strict = value, operator == "<"
+    return low, high, low_strict, high_strict
+
+
+def _numeric_values(rng, rows: int, integer: bool, low, high, low_strict, high_strict) -> np.ndarray:
+    step = 1 if integer else 0.01
+    start = (low + step if low_strict else low) if low is not None else (1 if integer else 0.0)
+    stop = (high - step if high_strict else high) if high is not None else start + 1000
+    if integer:
+        return rng.integers(int(np.ceil(start)), int(np.floor(stop)) + 1, size=rows)
+    return np.round(rng.uniform(start, stop, size=rows), 2)
+
+
+def generate_frame(
+    db_schema: Dict[str, Any],
+    check_constraints: List[Dict[str, Any]],
+    rows: int,
+    seed: int = 0,
+    row_offset: int = 0,
+    null_rate: float = 0.0,
+    duplicate_pk_rate: float = 0.0,
+    type_corruption_rate: float = 0.0,
+    check_violation_rate: float = 0.0
+) -> Tuple[pd.DataFrame, Dict[str, Dict[str, int]]]:
+    """
+    Generates `rows` rows for `db_schema` with the given error rates.
+
+    Primary keys are unique from `row_offset` on (so chunks of one file do not
+    collide) before duplicates are injected. Returns the frame and the injected
+    counts per column and error type.
+    """
+    rng = np.random.default_rng(seed)
+    data, injected = {}, {}
+
+    def pick(rate: float) -> np.ndarray:
+        return rng.random(rows) < rate if rate > 0 else np.zeros(rows, dtype=bool)
+
+    for column, details in db_schema.items():
+        kind = _column_kind(column, details["type"])
+        counts = {}
+        if details["primary_key"]:
+            prefix = re.sub(r"[^A-Z]", "", column.upper())[:4] or "ID"
+            ids = np.arange(row_offset, row_offset + rows)
+            values = ids + 1 if kind == "integer" else np.char.add(prefix, np.char.zfill(ids.astype(str), 9)).astype(object)
+            duplicates = np.flatnonzero(pick(duplicate_pk_rate))
+            if len(duplicates):
+                values[duplicates] = values[rng.integers(0, rows, size=len(duplicates))]
+            counts["duplicate_pk"] = len(duplicates)
+        elif kind in ("integer", "float"):
+            low, high, low_strict, high_strict = _check_bounds(column, check_constraints)
+            values = _numeric_values(rng, rows, kind == "integer", low, high, low_strict, high_strict)
+            if low is not None or high is not None:
+                violations = pick(check_violation_rate)
+                offsets = rng.integers(1, 100, size=int(violations.sum()))
+                values[violations] = (low - offsets) if low is not None else (high + offsets)
+                counts["check_violation"] = int(violations.sum())
+        elif kind == "date":
+            values = (BASE_DATE + rng.integers(0, 2000, size=rows)).astype(str).astype(object)
+        elif kind == "boolean":
+            values = rng.random(rows) < 0.5
+        else:
+            pool = max(10, rows // 10)
+            prefix = re.sub(r"[^A-Z]", "", column.upper())[:4] or "VAL"
+            values = np.char.add(prefix, np.char.zfill(rng.integers(0, pool, size=rows).astype(str), 6)).astype(object)
+
+        # TEXT date columns accept any string, so only typed columns are corrupted
+        typed = kind in ("integer", "float") or (kind == "date" and "TEXT" not in details["type"].upper())
+        if typed and type_corruption_rate > 0:
+            corrupt = pick(type_corruption_rate)
+            values = values.astype(object)
+            values[corrupt] = CORRUPT_VALUES[rng.integers(0, len(CORRUPT_VALUES), size=int(corrupt.sum()))]
+            counts["type_corruption"] = int(corrupt.sum())
+        if null_rate > 0:
+            nulls = pick(null_rate)
+            if kind in ("integer", "boolean") and values.dtype != object:
+                values = values.astype(object)
+            values[nulls] = None if values.dtype == object else np.nan
+            counts["null"] = int(nulls.sum())
+
+        series = pd.Series(values, name=column)
+        if series.dtype == object and kind in ("integer", "float") and not counts.get("type_corruption"):
+            series = pd.to_numeric(series) # Nulls only: numeric with NaN, as a file reader would give
+        data[column] = series
+        injected[column] = counts
+    return pd.DataFrame(data), injected
+
+
+def write_synthetic_file(
+    output_path: str,
+    db_schema: Dict[str, Any],
+    check_constraints: List[Dict[str, Any]],
+    rows: int,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    seed: int = 0,
+    **error_rates
+) -> Dict[str, Dict[str, int]]:
+    """Writes `rows` generated rows to a .csv or .parquet file chunk by chunk; returns the injected counts."""
+    is_parquet = output_path.endswith((".parquet", ".pq"))
+    writer, arrow_schema = None, None
+    totals: Dict[str, Dict[str, int]] = {}
+    try:
+        for chunk_index, offset in enumerate(range(0, rows, chunk_rows)):
+            df, injected = generate_frame(
+                db_schema, check_constraints, min(chunk_rows, rows - offset),
+                seed=seed + chunk_index, row_offset=offset, **error_rates
+            )
+            for column, counts in injected.items():
+                for error, count in counts.items():
+                    totals.setdefault(column, {}).setdefault(error, 0)
+                    totals[column][error] += count
+            if is_parquet:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                # Columns that carry corrupted values are written as strings in every chunk
+                for column in df.columns:
+                    if df[column].dtype == object:
+                        df[column] = df[column].map(lambda v: v if v is None else str(v))
+                table = pa.Table.from_pandas(df, schema=arrow_schema, preserve_index=False)
+                if writer is None:
+                    arrow_schema = table.schema
+                    writer = pq.ParquetWriter(output_path, arrow_schema)
+                writer.write_table(table)
+            else:
+                df.to_csv(output_path, mode="w" if offset == 0 else "a", header=offset == 0, index=False)
+    finally:
+        if writer is not None:
+            writer.close()
+    return totals
+
+
+def main_cli(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Write a synthetic CSV/Parquet file for a table schema.")
+    parser.add_argument("output", help="Output file (.csv or .parquet).")
+    parser.add_argument("--table", default="customer_orders")
+    parser.add_argument("--db-url", help="Reflect the table from this database instead of the built-in DDL.")
+    parser.add_argument("--rows", default="100k", help="Row count, e.g. 1000, 10k, 50M.")
+    parser.add_argument("--chunk-rows", type=parse_row_count, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--seed", type=int, default=0)
+    for rate in ERROR_RATES:
+        parser.add_argument(f"--{rate.replace('_', '-')}", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    engine = tools.get_engine(args.db_url) if args.db_url else builtin_engine([args.table])
+    db_schema, check_constraints = load_table(engine, args.table)
+    started = time.perf_counter()
+    injected = write_synthetic_file(
+        args.output, db_schema, check_constraints, parse_row_count(args.rows),
+        chunk_rows=args.chunk_rows, seed=args.seed, **{rate: getattr(args, rate) for rate in ERROR_RATES}
+    )
+    print(f"Wrote {parse_row_count(args.rows):,} rows to {args.output} in {time.perf_counter() - started:.1f}s")
+    for column, counts in injected.items():
+        if any(counts.values()):
+            print(f"  {column}: " + ", ".join(f"{error}={count:,}" for error, count in counts.items() if count))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -132,6 +132,10 @@ def _render_single_report_md(data: dict) -> str:
     else:
         md_parts.append(f"**Drift Detected:** `{drift.get('detected', 'false')}`")
         md_parts.append(f"**Analysis:** {drift.get('analysis', 'N/A')}")
+        # Exact changes against the latest stored schema version
+        for change_type, changes in drift.get('changes', {}).items():
+            md_parts.append(f"\n**{change_type.replace('_', ' ').title()}:**")
+            md_parts.append("\n".join(f"- `{json.dumps(change, default=str)}`" if isinstance(change, dict) else f"- `{change}`" for change in changes))
 
     # --- 10. Dynamic Validation Rules (Table format) ---
     md_parts.append("\n--- \n## 7. Inferred Validation Rules")
@@ -0,0 +1,100 @@
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# ==============================================================
+# Run and stage deadlines
+# ==============================================================
+# Usage:
+#   with deadlines.limit(300, "run"):                   # run_multi_sheet_validation(deadline_s=300)
+#       with deadlines.limit(deadlines.stage_seconds("final_analysis"), "final_analysis"):
+#           deadlines.remaining()    # seconds to the nearest enclosing deadline, or None
+#           deadlines.check()        # raises DeadlineExceeded once it has passed
+#           deadlines.sleep(60)      # raises at once if the deadline comes first
+#
+# Per-stage budgets come from STAGE_DEADLINES_S, e.g.
+#   "schema_analysis=60,dynamic_rules=30,final_analysis=90,final_analysis_batch=180"
+# A stage's deadline starts when the stage starts and never extends an enclosing
+# (run) deadline. Deadlines live in a context variable, so work submitted with
+# tracing.run_in_context inherits them.
+#
+# Only waits can be cut short: LLM streams are closed and HTTP reads time out at
+# the deadline (main.get_llm_streaming_response), while the deterministic checks
+# always run to completion.
+
+
+class DeadlineExceeded(TimeoutError):
+    def __init__(self, scope: str, seconds: float):
+        super().__init__(f"{scope} deadline of {seconds:g}s exceeded")
+        self.scope = scope
+        self.seconds = seconds
+
+
+_deadline = contextvars.ContextVar("deadline", default=None) # (monotonic time, scope, seconds)
+
+
+def _parse_stage_seconds(text: Optional[str]) -> Dict[str, float]:
+    stages = {}
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        stage, _, seconds = item.partition("=")
+        try:
+            stages[stage.strip()] = float(seconds)
+        except ValueError:
+            raise ValueError(f"STAGE_DEADLINES_S: expected stage=seconds pairs, got '{item.strip()}'.")
+    return stages
+
+
+STAGE_DEADLINES_S = _parse_stage_seconds(os.getenv("STAGE_DEADLINES_S"))
+
+
+def stage_seconds(stage: Optional[str]) -> Optional[float]:
+    return STAGE_DEADLINES_S.get(stage)
+
+
+@contextmanager
+def limit(seconds: Optional[float], scope: str):
+    """Runs the block under a deadline `seconds` from now (None: no deadline of its own)."""
+    if seconds is None:
+        yield
+        return
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None and outer[0] <= at:
+        yield # The enclosing deadline comes first
+        return
+    token = _deadline.set((at, scope, seconds))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    current = _deadline.get()
+    return None if current is None else max(0.0, current[0] - time.monotonic())
+
+
+def expired() -> Optional[DeadlineExceeded]:
+    """The error for the current deadline if it has passed, else None."""
+    current = _deadline.get()
+    if current is not None and time.monotonic() >= current[0]:
+        return DeadlineExceeded(current[1], current[2])
+    return None
+
+
+def check() -> None:
+    error = expired()
+    if error is not None:
+        raise error
+
+
+def sleep(seconds: float) -> None:
+    """time.sleep, unless the deadline comes first: then raises DeadlineExceeded without waiting."""
+    current = _deadline.get()
+    if current is not None and time.monotonic() + seconds >= current[0]:
+        raise DeadlineExceeded(current[1], current[2])
+    time.sleep(seconds)
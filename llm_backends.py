@@ -0,0 +1,379 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from types import SimpleNamespace
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional, Iterator
+
+import run_checkpoints
+
+# ==============================================================
+# Pluggable LLM backends: live, record, replay and a local stub server
+# ==============================================================
+# main.get_client() picks the backend from LLM_BACKEND:
+#   azure   (default) the live Azure OpenAI deployment
+#   record  the live deployment; every streamed response is saved to LLM_CASSETTE_DIR
+#   replay  serves saved responses offline, no credentials or network needed
+#   stub    starts the stub server below in-process and talks to it through the
+#           real openai/httpx client (HTTP, SSE streaming, 429 handling included)
+#
+# Cassettes are one JSON file per prompt, keyed by a hash of the messages and
+# sampling parameters (not the deployment, so recordings replay under any name).
+# A replay miss raises, or with LLM_REPLAY_FALLBACK=stub answers like the stub.
+# LLM_REPLAY_TIMING=recorded replays the recorded chunk timing instead of instantly.
+#
+# The stub server can also run on its own (point AZURE_ENDPOINT at it):
+#   python llm_backends.py --port 8790 --latency-ms 400 --chunk-ms 20 --rate-limit-every 5
+# It answers from a cassette directory when given one, otherwise with minimal
+# valid JSON for each pipeline stage. GET /stats returns its request counters.
+# When asked for usage (stream_options.include_usage) it ends the stream with
+# token counts, estimating tokens as 4 characters and simulating the provider's
+# prompt cache: prefixes of 1024+ tokens seen before count as cached, in
+# 128-token blocks (--prompt-cache 0 turns this off). --reject-parameters
+# "response_format,stream_options" answers requests that send those with a 400,
+# like a deployment or API version that does not support them.
+
+BACKENDS = ("azure", "record", "replay", "stub")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "azure").lower()
+CASSETTE_DIR = os.getenv("LLM_CASSETTE_DIR", "llm_cassettes")
+REPLAY_FALLBACK = os.getenv("LLM_REPLAY_FALLBACK", "error").lower()
+REPLAY_TIMING = os.getenv("LLM_REPLAY_TIMING", "none").lower()
+KEY_PARAMETERS = ("messages", "temperature", "top_p", "frequency_penalty", "presence_penalty", "response_format")
+STUB_DEFAULTS = {"latency_ms": 200.0, "chunk_ms": 10.0, "chunk_chars": 16, "rate_limit_every": 0,
+                 "rate_limit_rate": 0.0, "retry_after_seconds": 1.0, "seed": 0, "prompt_cache": 1,
+                 "reject_parameters": ""}
+CHARS_PER_TOKEN = 4
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+
+def cassette_key(request: Dict[str, Any]) -> str:
+    """Hash of the request fields that determine the response."""
+    material = {k: request.get(k) for k in KEY_PARAMETERS if request.get(k) is not None}
+    return hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+_BATCH_SHEET_HEADER = re.compile(r'^### Sheet: ("(?:[^"\\]|\\.)*")$', re.MULTILINE)
+
+
+def default_stub_response(messages: List[Dict[str, str]]) -> str:
+    """Minimal valid JSON for the pipeline stage the prompt belongs to."""
+    prompt = next((m["content"] for m in messages if m.get("role") == "user"), "") # Not a follow-up
+    if "**Semantic Mapping**" in prompt: # Wording unique to prompts.SCHEMA_ANALYSIS_PROMPT
+        return json.dumps({
+            "columns_missing_from_file": [], "columns_extra_in_file": [], "naming_mismatches": {},
+            "analysis": {"context": "Stub response.", "reasoning": "", "recommendation": []}
+        })
+    if "infer potential validation rules" in prompt:
+        return json.dumps([])
+    analysis = {
+        "validation_summary": {"status": "Stub", "details": "Stub LLM response."},
+        "data_quality_score": {}, "triage_plan": [], "append_upsert_suggestion": {},
+        "schema_drift": {}, "root_cause_analysis": {}, "overall_analysis": {}
+    }
+    if "one key per sheet name" in prompt: # prompts.BATCH_ANALYSIS_PROMPT
+        return json.dumps({json.loads(name): analysis for name in _BATCH_SHEET_HEADER.findall(prompt)})
+    return json.dumps(analysis)
+
+
+def _chunk(content: Optional[str]) -> SimpleNamespace:
+    """A streamed chunk shaped like openai's ChatCompletionChunk (the fields the pipeline reads)."""
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=content), finish_reason=None)])
+
+
+def _split(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), max(1, size))] or [""]
+
+
+class CassetteStore:
+    """Prompt/response recordings, one JSON file per cassette key."""
+
+    def __init__(self, directory: str = CASSETTE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path_for(key)) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def save(self, key: str, request: Dict[str, Any], chunks: List[str], offsets_ms: List[float]) -> None:
+        run_checkpoints.write_json_atomic(self.path_for(key), {
+            "key": key,
+            "model": request.get("model"),
+            "messages": request.get("messages"),
+            "chunks": chunks,
+            "chunk_offsets_ms": offsets_ms,
+            "recorded_at": time.time(),
+        })
+
+
+class _Completions:
+    def __init__(self, create):
+        self.create = create
+
+
+class _ChatClient:
+    """Exposes `create` as client.chat.completions.create, the only API the pipeline uses."""
+
+    def __init__(self, create):
+        self.chat = SimpleNamespace(completions=_Completions(create))
+
+
+class RecordingClient(_ChatClient):
+    """Wraps a live client and saves every fully consumed streamed response."""
+
+    def __init__(self, inner, store: CassetteStore):
+        self.inner = inner
+        self.store = store
+        super().__init__(self._create)
+
+    def _create(self, **request):
+        stream = self.inner.chat.completions.create(**request) # Errors (e.g. 429) surface here, as with the live client
+        return self._record(request, stream)
+
+    def _record(self, request: Dict[str, Any], stream) -> Iterator:
+        chunks, offsets_ms = [], []
+        started = time.perf_counter()
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                    offsets_ms.append(round((time.perf_counter() - started) * 1000, 2))
+                yield chunk
+        finally:
+            close = getattr(stream, "close", None) # The caller stopped early (e.g. an off-format response)
+            if close is not None:
+                close()
+        try:
+            self.store.save(cassette_key(request), request, chunks, offsets_ms)
+        except OSError as e:
+            logging.warning(f"Could not save the LLM recording: {e}")
+
+
+class ReplayClient(_ChatClient):
+    """Serves recorded responses offline."""
+
+    def __init__(self, store: CassetteStore, fallback: str = REPLAY_FALLBACK, timing: str = REPLAY_TIMING):
+        self.store = store
+        self.fallback = fallback
+        self.timing = timing
+        super().__init__(self._create)
+
+    def _create(self, **request):
+        key = cassette_key(request)
+        entry = self.store.load(key)
+        if entry is None:
+            if self.fallback != "stub":
+                raise LookupError(f"No recorded LLM response for this prompt (cassette {key[:12]} in '{self.store.directory}').")
+            logging.warning(f"No recorded LLM response (cassette {key[:12]}); answering with the stub response.")
+            entry = {"chunks": _split(default_stub_response(request.get("messages") or []), STUB_DEFAULTS["chunk_chars"]),
+                     "chunk_offsets_ms": []}
+        return self._replay(entry)
+
+    def _replay(self, entry: Dict[str, Any]) -> Iterator:
+        offsets = entry.get("chunk_offsets_ms") or []
+        started = time.perf_counter()
+        for index, content in enumerate(entry["chunks"]):
+            if self.timing == "recorded" and index < len(offsets):
+                delay = offsets[index] / 1000 - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            yield _chunk(content)
+
+
+# --- Stub server (OpenAI / Azure OpenAI chat completions, streaming) ---
+class StubState:
+    def __init__(self, settings: Dict[str, Any], store: Optional[CassetteStore]):
+        self.settings = {**STUB_DEFAULTS, **settings}
+        self.store = store
+        self.random = random.Random(self.settings["seed"])
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._cached_prefixes = set()
+
+    def admit(self) -> bool:
+        """Counts the request; False if it should get a 429."""
+        with self.lock:
+            self.requests += 1
+            every, rate = int(self.settings["rate_limit_every"]), float(self.settings["rate_limit_rate"])
+            limited = (every > 0 and self.requests % every == 0) or (rate > 0 and self.random.random() < rate)
+            if limited:
+                self.rate_limited += 1
+            return not limited
+
+    def prompt_usage(self, messages: List[Dict[str, str]]) -> tuple:
+        """(prompt_tokens, cached_tokens) for a request, caching its prefix blocks for the next ones."""
+        text = "".join(f"{m.get('role')}\n{m.get('content')}\n" for m in messages)
+        prompt_tokens = len(text) // CHARS_PER_TOKEN
+        cached_chars = 0
+        if self.settings["prompt_cache"]:
+            block = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+            digest = hashlib.sha256()
+            with self.lock:
+                for end in range(block, len(text) + 1, block):
+                    digest.update(text[end - block:end].encode("utf-8"))
+                    if end < CACHE_MIN_TOKENS * CHARS_PER_TOKEN:
+                        continue
+                    key = digest.copy().hexdigest()
+                    if key in self._cached_prefixes:
+                        cached_chars = end
+                    self._cached_prefixes.add(key)
+        cached_tokens = cached_chars // CHARS_PER_TOKEN
+        with self.lock:
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+        return prompt_tokens, cached_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"requests": self.requests, "rate_limited": self.rate_limited,
+                    "in_flight": self.in_flight, "max_in_flight": self.max_in_flight,
+                    "prompt_tokens": self.prompt_tokens, "cached_tokens": self.cached_tokens, "settings": self.settings}
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        logging.debug("llm stub: " + format % args)
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(HTTPStatus.OK, self.state.stats())
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        if not self.path.split("?")[0].endswith("/chat/completions"):
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": {"message": "Not found"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        state, settings = self.state, self.state.settings
+        if not state.admit():
+            retry_after = settings["retry_after_seconds"]
+            self._send_json(HTTPStatus.TOO_MANY_REQUESTS,
+                            {"error": {"code": "429", "message": f"Rate limit exceeded. Retry after {retry_after} seconds."}},
+                            {"Retry-After": str(retry_after)})
+            return
+        rejected = [name for name in settings["reject_parameters"].split(",") if name.strip() and name.strip() in request]
+        if rejected:
+            self._send_json(HTTPStatus.BAD_REQUEST,
+                            {"error": {"code": "BadRequest", "message": f"Unrecognized request argument supplied: {rejected[0].strip()}"}})
+            return
+
+        entry = state.store.load(cassette_key(request)) if state.store is not None else None
+        chunks = entry["chunks"] if entry else _split(default_stub_response(request.get("messages") or []), int(settings["chunk_chars"]))
+        with state.lock:
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        try:
+            time.sleep(settings["latency_ms"] / 1000) # Time to first token
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            created, model = int(time.time()), request.get("model", "stub")
+
+            def send(choices, usage=None):
+                event = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created, "model": model, "choices": choices}
+                if usage is not None:
+                    event["usage"] = usage
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            send([]) # Azure opens with a chunk that has no choices (content filter results)
+            for index, content in enumerate(chunks):
+                if index and settings["chunk_ms"]:
+                    time.sleep(settings["chunk_ms"] / 1000)
+                send([{"index": 0, "delta": {"content": content}, "finish_reason": None}])
+            send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (request.get("stream_options") or {}).get("include_usage"):
+                prompt_tokens, cached_tokens = state.prompt_usage(request.get("messages") or [])
+                completion_tokens = sum(len(c) for c in chunks) // CHARS_PER_TOKEN
+                send([], {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens,
+                          "prompt_tokens_details": {"cached_tokens": cached_tokens}})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logging.debug("llm stub: client disconnected mid-stream")
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, cassette_dir: Optional[str] = None, **settings):
+    """Starts the stub server on a daemon thread; returns (server, base URL). server.state holds its counters."""
+    state = StubState(settings, CassetteStore(cassette_dir) if cassette_dir else None)
+    handler = type("BoundStubRequestHandler", (StubRequestHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    url = f"http://{host}:{server.server_address[1]}"
+    logging.info(f"LLM stub server listening on {url} ({state.settings})")
+    return server, url
+
+
+def stub_settings_from_env() -> Dict[str, Any]:
+    """Stub settings from LLM_STUB_* variables (e.g. LLM_STUB_LATENCY_MS, LLM_STUB_RATE_LIMIT_EVERY)."""
+    settings = {}
+    for name, default in STUB_DEFAULTS.items():
+        value = os.getenv(f"LLM_STUB_{name.upper()}")
+        if value is not None:
+            settings[name] = type(default)(value)
+    return settings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stub of the Azure OpenAI streaming chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--cassette-dir", help="Answer from these recordings when the prompt matches.")
+    for name, default in STUB_DEFAULTS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=stub_settings_from_env().get(name, default))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server, url = start_stub_server(args.host, args.port, args.cassette_dir,
+                                    **{name: getattr(args, name) for name in STUB_DEFAULTS})
+    print(f"Set AZURE_ENDPOINT={url} (any API_KEY) to use the stub. Ctrl-C to stop.")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
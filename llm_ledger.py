@@ -0,0 +1,114 @@
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+# ==============================================================
+# Per-run ledger of LLM calls
+# ==============================================================
+# Usage:
+#   ledger = llm_ledger.LLMLedger()
+#   with llm_ledger.activate(ledger), ledger.labelled(sheet="Orders"):
+#       ...                              # main.get_llm_streaming_response records each call
+#   report["llm_usage"] = ledger.to_dict()
+#
+# One entry per LLM call: stage, sheet, model, input/cached/output tokens, time to
+# first token and duration. Token counts come from the provider's usage chunk
+# (stream_options.include_usage) when it sends one, else from the local tiktoken
+# estimate ("usage_source": "estimate", no cached count). `cached_tokens` is the
+# prompt prefix the provider served from its prompt cache. `routing` is the
+# routing decision that picked the deployment and, with a price for it,
+# `cost_usd` the estimated cost of the call (see llm_routing.py).
+
+_active_ledger = contextvars.ContextVar("llm_ledger", default=None)
+
+
+class LLMLedger:
+    def __init__(self):
+        self.calls: List[Dict[str, Any]] = []
+        self.labels: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def labelled(self, **labels):
+        """Adds `labels` (e.g. sheet=...) to the calls recorded inside the block."""
+        previous = self.labels
+        self.labels = {**previous, **labels}
+        try:
+            yield self
+        finally:
+            self.labels = previous
+
+    def record(self, **entry) -> None:
+        with self._lock:
+            self.calls.append({**self.labels, **entry})
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Totals for the run, per stage and per deployment; cache_hit_rate is over
+        calls with provider usage, cost_usd over calls to priced deployments.
+        """
+        def totals(calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+            reported = [c for c in calls if c.get("cached_tokens") is not None]
+            reported_input = sum(c.get("input_tokens") or 0 for c in reported)
+            cached = sum(c["cached_tokens"] for c in reported)
+            return {
+                "calls": len(calls),
+                "input_tokens": sum(c.get("input_tokens") or 0 for c in calls),
+                "cached_tokens": cached,
+                "output_tokens": sum(c.get("output_tokens") or 0 for c in calls),
+                "cache_hit_rate": round(cached / reported_input, 3) if reported_input else None,
+                "duration_ms": round(sum(c.get("duration_ms") or 0 for c in calls), 1),
+                "cost_usd": round(sum(c.get("cost_usd") or 0 for c in calls), 6),
+            }
+
+        with self._lock:
+            calls = list(self.calls)
+        by_stage: Dict[str, List[Dict[str, Any]]] = {}
+        by_deployment: Dict[str, List[Dict[str, Any]]] = {}
+        for call in calls:
+            by_stage.setdefault(call.get("stage") or "unknown", []).append(call)
+            by_deployment.setdefault(call.get("model") or "unknown", []).append(call)
+        return {
+            **totals(calls),
+            "budget_fallbacks": sum(1 for c in calls if (c.get("routing") or {}).get("configured")),
+            "by_stage": {stage: totals(stage_calls) for stage, stage_calls in by_stage.items()},
+            "by_deployment": {model: totals(model_calls) for model, model_calls in by_deployment.items()},
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self.calls)
+        return {"summary": self.summary(), "calls": calls}
+
+
+def record(**entry) -> None:
+    """Records a call on the active ledger (no-op without one)."""
+    ledger = _active_ledger.get()
+    if ledger is not None:
+        ledger.record(**entry)
+
+
+def current() -> Optional[LLMLedger]:
+    return _active_ledger.get()
+
+
+@contextmanager
+def labelled(**labels):
+    """LLMLedger.labelled on the active ledger (no-op without one)."""
+    ledger = _active_ledger.get()
+    if ledger is None:
+        yield None
+        return
+    with ledger.labelled(**labels):
+        yield ledger
+
+
+@contextmanager
+def activate(ledger: Optional[LLMLedger]):
+    """Makes `ledger` the active ledger for this context (None disables recording)."""
+    token = _active_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _active_ledger.reset(token)
@@ -0,0 +1,138 @@
+import os
+import logging
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+# ==============================================================
+# Per-stage model routing with per-run latency and cost budgets
+# ==============================================================
+# Usage:
+#   router = llm_routing.Router.from_env(default_deployment=DEPLOYMENT_NAME)
+#   decision = router.route("final_analysis", llm_ledger.current())
+#   ... call decision["deployment"]; record decision with the call in the ledger
+#
+# Configured from the environment:
+#   LLM_STAGE_DEPLOYMENTS    stage=deployment pairs; unlisted stages use DEPLOYMENT_NAME, e.g.
+#                            "final_analysis=gpt-4.1,final_analysis_batch=gpt-4.1,schema_analysis=gpt-4.1-mini"
+#   LLM_FALLBACK_DEPLOYMENT  used for every stage once a budget is spent (default: DEPLOYMENT_NAME)
+#   LLM_RUN_COST_BUDGET_USD  estimated spend of one run (unset: no limit)
+#   LLM_RUN_LATENCY_BUDGET_S time one run spends in LLM calls (unset: no limit)
+#   LLM_MODEL_PRICES         USD per 1M tokens as deployment=input/output[/cached_input], e.g.
+#                            "gpt-4.1=2.00/8.00/0.50,gpt-4.1-nano=0.10/0.40/0.025"
+#
+# Spend and latency are read from the run's LLM ledger (llm_ledger.py), which is
+# what makes the budgets per run. A budget is spent once the calls so far reach
+# it; the call in flight is not cut short. Calls to deployments without a price
+# have no cost and do not count against the cost budget.
+#
+# Each decision is {"deployment", "reason"}: reason is "stage" (configured for
+# the stage), "default", or the budget that forced the fallback ("cost_budget",
+# "latency_budget"), which then also names the `configured` deployment.
+
+BUDGET_REASONS = ("cost_budget", "latency_budget")
+
+
+def _parse_pairs(text: Optional[str], variable: str) -> Dict[str, str]:
+    pairs = {}
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        if not name.strip() or not value.strip():
+            raise ValueError(f"{variable}: expected name=value pairs, got '{item.strip()}'.")
+        pairs[name.strip()] = value.strip()
+    return pairs
+
+
+def parse_prices(text: Optional[str]) -> Dict[str, Tuple[float, float, float]]:
+    """LLM_MODEL_PRICES as {deployment: (input, output, cached_input)} USD per 1M tokens."""
+    prices = {}
+    for deployment, value in _parse_pairs(text, "LLM_MODEL_PRICES").items():
+        try:
+            parts = [float(part) for part in value.split("/")]
+        except ValueError:
+            parts = []
+        if len(parts) not in (2, 3):
+            raise ValueError(f"LLM_MODEL_PRICES: expected input/output[/cached_input] for '{deployment}', got '{value}'.")
+        prices[deployment] = (parts[0], parts[1], parts[2] if len(parts) == 3 else parts[0])
+    return prices
+
+
+def _optional_float(variable: str) -> Optional[float]:
+    value = os.getenv(variable)
+    return float(value) if value else None
+
+
+class Router:
+    def __init__(
+        self,
+        default_deployment: str,
+        stage_deployments: Optional[Dict[str, str]] = None,
+        fallback_deployment: Optional[str] = None,
+        cost_budget_usd: Optional[float] = None,
+        latency_budget_s: Optional[float] = None,
+        prices: Optional[Dict[str, Tuple[float, float, float]]] = None
+    ):
+        self.default_deployment = default_deployment
+        self.stage_deployments = dict(stage_deployments or {})
+        self.fallback_deployment = fallback_deployment or default_deployment
+        self.cost_budget_usd = cost_budget_usd
+        self.latency_budget_s = latency_budget_s
+        self.prices = dict(prices or {})
+        self._unpriced_warned = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, default_deployment: str) -> "Router":
+        return cls(
+            default_deployment,
+            stage_deployments=_parse_pairs(os.getenv("LLM_STAGE_DEPLOYMENTS"), "LLM_STAGE_DEPLOYMENTS"),
+            fallback_deployment=os.getenv("LLM_FALLBACK_DEPLOYMENT") or None,
+            cost_budget_usd=_optional_float("LLM_RUN_COST_BUDGET_USD"),
+            latency_budget_s=_optional_float("LLM_RUN_LATENCY_BUDGET_S"),
+            prices=parse_prices(os.getenv("LLM_MODEL_PRICES"))
+        )
+
+    def cost_usd(self, deployment: str, input_tokens: Optional[int], cached_tokens: Optional[int],
+                 output_tokens: Optional[int]) -> Optional[float]:
+        """Estimated cost of one call, or None without a price for `deployment`."""
+        price = self.prices.get(deployment)
+        if price is None or input_tokens is None:
+            return None
+        cached = cached_tokens or 0
+        return round(((input_tokens - cached) * price[0] + cached * price[2] + (output_tokens or 0) * price[1]) / 1_000_000, 6)
+
+    def spent_budget(self, ledger) -> Optional[str]:
+        """The first budget the calls in `ledger` have used up, or None."""
+        if ledger is None or (self.cost_budget_usd is None and self.latency_budget_s is None):
+            return None
+        summary = ledger.summary()
+        if self.cost_budget_usd is not None and summary["cost_usd"] >= self.cost_budget_usd:
+            return "cost_budget"
+        if self.latency_budget_s is not None and summary["duration_ms"] >= self.latency_budget_s * 1000:
+            return "latency_budget"
+        return None
+
+    def route(self, stage: Optional[str], ledger=None) -> Dict[str, Any]:
+        """The deployment for a call of `stage`, given the run's calls so far in `ledger`."""
+        configured = self.stage_deployments.get(stage)
+        decision = {"deployment": configured or self.default_deployment, "reason": "stage" if configured else "default"}
+        spent = self.spent_budget(ledger)
+        if spent and decision["deployment"] != self.fallback_deployment:
+            logging.info(f"LLM {stage}: {spent.replace('_', ' ')} spent; using '{self.fallback_deployment}' instead of '{decision['deployment']}'.")
+            decision = {"deployment": self.fallback_deployment, "reason": spent, "configured": decision["deployment"]}
+        if self.cost_budget_usd is not None and decision["deployment"] not in self.prices:
+            with self._lock:
+                if decision["deployment"] not in self._unpriced_warned:
+                    self._unpriced_warned.add(decision["deployment"])
+                    logging.warning(f"No LLM_MODEL_PRICES entry for '{decision['deployment']}'; its calls do not count against the cost budget.")
+        return decision
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "default": self.default_deployment,
+            "stages": self.stage_deployments,
+            "fallback": self.fallback_deployment,
+            "cost_budget_usd": self.cost_budget_usd,
+            "latency_budget_s": self.latency_budget_s,
+        }
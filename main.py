@@ -1,23 +1,36 @@
 import logging
 import os
-import glob
 import pandas as pd
+import numpy as np
 import json
+import hashlib
+import contextlib
 import sqlalchemy
 import time # Added
-import httpx # Added
-import openai # Added
-import tiktoken # Added
+import threading
 from dotenv import load_dotenv # Added
-from openai import AzureOpenAI # Added
 from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 import tools
 import prompts
+import sharded_csv
+import schema_history
+import schema_drift
+import result_cache
+import run_checkpoints
+import tracing
+import profiling
+import streaming_json
+import llm_ledger
+import llm_routing
+import deadlines
+import sampling
+import data_profile
 
-# --- 1. NEW: Load .env and Set Up Logging ---
+# --- 1. NEW: Load .env ---
+# Logging is configured by the entry point (see the bottom of this file), not on import.
 load_dotenv() # Load environment variables from .env file
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- 2. NEW: Azure Credentials from your new code ---
 # These are now loaded directly from your .env file
@@ -25,28 +38,145 @@ API_VERSION = os.getenv("API_VERSION", "2024-02-01") # Added default
 AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT") 
 API_KEY = os.getenv("API_KEY") 
 DEPLOYMENT_NAME = os.getenv("DEPLOYMENT_NAME", "gpt-4.1-nano") # Added default/getter
+RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv("LLM_RATE_LIMIT_BACKOFF_SECONDS", "60"))
+# Start deep validation as soon as the LLM's column mapping has streamed in. Set to 0
+# to run it after the schema analysis on the pipeline thread (e.g. to profile it).
+OVERLAP_DEEP_VALIDATION = os.getenv("OVERLAP_DEEP_VALIDATION", "1") != "0"
+# Structured outputs: "json_schema" sends each stage's JSON schema, "json_object"
+# only asks for JSON, "none" sends neither. "auto" starts with json_schema and steps
+# down for the rest of the process when the deployment rejects it. (Only object
+# responses can be constrained; the dynamic rules list relies on the local repair.)
+LLM_RESPONSE_FORMAT = os.getenv("LLM_RESPONSE_FORMAT", "auto")
+RESPONSE_FORMATS = ("json_schema", "json_object", "none")
+# Follow-up requests for fields that were missing or invalid after the local repair
+LLM_REPAIR_ATTEMPTS = int(os.getenv("LLM_REPAIR_ATTEMPTS", "1"))
+# Ask for the usage chunk at the end of each stream (token and cached-prefix counts
+# for the run's LLM ledger). Dropped automatically if the API version rejects it.
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "1") != "0"
+# Batched final analysis (opt-in, run_multi_sheet_validation(batch_final_analysis=True)):
+# the sheets of a workbook share analysis requests of up to this many estimated
+# tokens of sheet inputs, and at most this many sheets each (bounds the response).
+FINAL_ANALYSIS_BATCH_TOKENS = int(os.getenv("FINAL_ANALYSIS_BATCH_TOKENS", "6000"))
+FINAL_ANALYSIS_BATCH_MAX_SHEETS = int(os.getenv("FINAL_ANALYSIS_BATCH_MAX_SHEETS", "8"))
+# Longest wait for the LLM endpoint: connecting, and each read of the stream. A run
+# or stage deadline (see deadlines.py) shortens it to the time left.
+LLM_CALL_TIMEOUT_S = float(os.getenv("LLM_CALL_TIMEOUT_S", "120"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "10"))
+# Default deadline of a validation run in seconds (unset: none); per-stage
+# deadlines are set with STAGE_DEADLINES_S (see deadlines.py).
+VALIDATION_RUN_DEADLINE_S = float(os.getenv("VALIDATION_RUN_DEADLINE_S")) if os.getenv("VALIDATION_RUN_DEADLINE_S") else None
+# Add a `statistical_profile` section (see data_profile.py) to each sheet report
+# (off unless set to 1). It is computed on a worker thread while the schema
+# analysis streams.
+STATISTICAL_PROFILE = os.getenv("STATISTICAL_PROFILE", "0") == "1"
+# Per-stage deployments, fallback and run budgets (LLM_STAGE_DEPLOYMENTS etc., see llm_routing.py)
+_router = llm_routing.Router.from_env(DEPLOYMENT_NAME)
 
-# --- 3. NEW: Global Client with SSL verification disabled ---
-# This REPLACES the old client and the need for config.py
-# The `verify=False` is the likely fix for your previous connection error.
-try:
-    if not all([AZURE_ENDPOINT, API_KEY, DEPLOYMENT_NAME]):
-        raise ValueError("AZURE_ENDPOINT, API_KEY, or DEPLOYMENT_NAME is not set in .env file.")
-    
-    # Create a re-usable httpx client with SSL verification disabled
-    http_client = httpx.Client(verify=False)
-    
-    client = AzureOpenAI(
-        api_version=API_VERSION,
-        azure_endpoint=AZURE_ENDPOINT,
-        api_key=API_KEY,
-        http_client=http_client, # Pass the custom httpx client
-    )
-    logging.info(f"Successfully initialized AzureOpenAI client for endpoint: {AZURE_ENDPOINT}")
-    logging.info(f"Using Deployment: {DEPLOYMENT_NAME}")
-except Exception as e:
-    logging.critical(f"Failed to initialize AzureOpenAI client: {e}. Check your .env file.")
-    exit(1) # Exit if client fails to initialize
+# --- 3. LLM Client (created on first use) ---
+# openai, httpx and tiktoken are imported only when the first LLM call or token
+# count needs them, so importing this module (UI, batch and shard workers, the
+# job service) stays cheap and never fails on missing credentials.
+_client = None
+_encoding = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the shared LLM client, creating it on first use. LLM_BACKEND selects
+    the live deployment, record, replay or the local stub (see llm_backends.py).
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import llm_backends
+                backend = llm_backends.LLM_BACKEND
+                if backend not in llm_backends.BACKENDS:
+                    raise RuntimeError(f"Unknown LLM_BACKEND '{backend}'; expected one of {llm_backends.BACKENDS}.")
+                if backend == "replay":
+                    _client = llm_backends.ReplayClient(llm_backends.CassetteStore(llm_backends.CASSETTE_DIR))
+                    logging.info(f"Replaying recorded LLM responses from '{llm_backends.CASSETTE_DIR}'")
+                    return _client
+
+                endpoint, api_key = AZURE_ENDPOINT, API_KEY
+                if backend == "stub":
+                    _, endpoint = llm_backends.start_stub_server(**llm_backends.stub_settings_from_env())
+                    api_key = api_key or "stub"
+                if not all([endpoint, api_key, DEPLOYMENT_NAME]):
+                    raise RuntimeError("AZURE_ENDPOINT, API_KEY, or DEPLOYMENT_NAME is not set in .env file.")
+                import httpx
+                from openai import AzureOpenAI
+
+                # Create a re-usable httpx client with SSL verification disabled
+                timeout = httpx.Timeout(LLM_CALL_TIMEOUT_S, connect=LLM_CONNECT_TIMEOUT_S)
+                http_client = httpx.Client(verify=False, timeout=timeout)
+                _client = AzureOpenAI(
+                    api_version=API_VERSION,
+                    azure_endpoint=endpoint,
+                    api_key=api_key,
+                    http_client=http_client, # Pass the custom httpx client
+                    timeout=timeout,
+                )
+                logging.info(f"Successfully initialized AzureOpenAI client for endpoint: {endpoint}")
+                logging.info(f"Using Deployment: {DEPLOYMENT_NAME}")
+                if backend == "record":
+                    _client = llm_backends.RecordingClient(_client, llm_backends.CassetteStore(llm_backends.CASSETTE_DIR))
+                    logging.info(f"Recording LLM responses to '{llm_backends.CASSETTE_DIR}'")
+    return _client
+
+
+def set_client(client) -> None:
+    """Injects the client used for LLM calls (any object with the openai chat.completions API)."""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def set_router(router: llm_routing.Router) -> None:
+    """Replaces the stage-to-deployment router configured from the environment."""
+    global _router
+    _router = router
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    # Checked by name and status so an injected client need not raise openai's exception types
+    return type(e).__name__ == "RateLimitError" or getattr(e, "status_code", None) == 429
+
+
+def _is_unsupported_parameter(e: Exception, parameter: str) -> bool:
+    return getattr(e, "status_code", None) == 400 and parameter in str(e)
+
+
+_response_format_mode = "json_schema" if LLM_RESPONSE_FORMAT == "auto" else LLM_RESPONSE_FORMAT
+_stream_usage = LLM_STREAM_USAGE
+
+
+def get_response_format(stage: str, shape: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The response_format to request for a stage's shape, or None to send none."""
+    if _response_format_mode not in RESPONSE_FORMATS:
+        raise RuntimeError(f"Unknown LLM_RESPONSE_FORMAT '{LLM_RESPONSE_FORMAT}'; expected auto or one of {RESPONSE_FORMATS}.")
+    if _response_format_mode == "none" or shape.get("type", dict) is not dict:
+        return None
+    if _response_format_mode == "json_object":
+        return {"type": "json_object"}
+    return {"type": "json_schema", "json_schema": {"name": stage, "schema": streaming_json.json_schema(shape), "strict": False}}
+
+
+def _step_down_response_format(response_format: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """After the deployment rejected `response_format` (auto mode): the next weaker one, also used by later calls."""
+    global _response_format_mode
+    _response_format_mode = "json_object" if response_format["type"] == "json_schema" else "none"
+    logging.warning(f"The deployment does not support response_format '{response_format['type']}'; using '{_response_format_mode}'.")
+    return {"type": "json_object"} if _response_format_mode == "json_object" else None
 
 
 # --- 4. System Prompts (UPDATED) ---
@@ -69,12 +199,27 @@ Do not chat. Provide *only* the requested JSON analysis.
 SYSTEM_PROMPT_INTERACTIVE = """
 You are a helpful database expert. Your job is to analyze a file schema, compare it to database tables, and ask the user to select the correct one.
 """
+# --- 5. Expected JSON Shapes of the LLM Responses ---
+# Checked member by member while the response streams (see streaming_json.py).
+SCHEMA_ANALYSIS_SHAPE = {
+    "type": dict,
+    "keys": {"columns_missing_from_file": list, "columns_extra_in_file": list, "naming_mismatches": dict, "analysis": dict},
+}
+DYNAMIC_RULES_SHAPE = {"type": list, "items": dict}
+FINAL_ANALYSIS_SHAPE = {
+    "type": dict,
+    "keys": {
+        "validation_summary": dict, "data_quality_score": dict, "triage_plan": list, "append_upsert_suggestion": dict,
+        "schema_drift": dict, "root_cause_analysis": dict, "overall_analysis": dict,
+    },
+}
+
 def count_tokens(system_prompt, user_prompt, full_response):
     """
     Counts input, output, and total tokens for the API call using tiktoken.
     """
     try:
-        encoding = tiktoken.get_encoding("cl100k_base")
+        encoding = _get_encoding()
         
         system_tokens = len(encoding.encode(system_prompt))
         user_tokens = len(encoding.encode(user_prompt))
@@ -97,121 +242,552 @@ def count_tokens(system_prompt, user_prompt, full_response):
         print(f"An error occurred during token counting: {e}")
         return 0, 0, 0 # Return 0 if counting fails
 # --- 6. NEW: API Calling Function (From your code, with fixes) ---
-def get_llm_streaming_response(system_prompt: str, user_prompt: str, max_retries: int = 3) -> Optional[str]:
+def get_llm_streaming_response(
+    system_prompt: str, user_prompt: str, max_retries: int = 3,
+    parser: Optional[streaming_json.IncrementalJSONParser] = None,
+    response_format: Optional[Dict[str, Any]] = None,
+    followup: Optional[List[Dict[str, str]]] = None,
+    stage: Optional[str] = None
+) -> Optional[str]:
     """
-    Calls the Azure OpenAI API with streaming and retries on RateLimitError.
-    This uses the global 'client' and 'DEPLOYMENT_NAME'.
+    Calls the Azure OpenAI API with streaming and retries on RateLimitError, up to
+    `max_retries` requests. Retrying without a parameter the deployment rejected
+    (response_format in auto mode, stream_options) does not use up an attempt.
+    This uses the shared client (see get_client) and the deployment the router
+    picks for `stage` (see llm_routing.py; 'DEPLOYMENT_NAME' unless configured).
+
+    With a `parser`, each chunk is fed to it as it arrives. If the response goes
+    off-format, the stream is closed right away and StreamFormatError is raised.
+    `response_format` is sent as is (see get_response_format); `followup`
+    messages are appended after the user prompt. Each call is recorded under
+    `stage` in the active LLM ledger (see llm_ledger.py).
+
+    Under a deadline (see deadlines.py), each request times out at the time left,
+    a stream still running at the deadline is closed, and rate-limit backoff that
+    would outlast it is skipped; all of these raise DeadlineExceeded.
     """
-    for attempt in range(max_retries):
-        try:
-            logging.info(f"Sending prompt to LLM (Attempt {attempt + 1}/{max_retries})...")
-            response = client.chat.completions.create(
-                stream=True,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.0,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0,
-                model=DEPLOYMENT_NAME,
-            )
+    global _stream_usage
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}] + (followup or [])
+    routing = _router.route(stage, llm_ledger.current())
+    deployment = routing["deployment"]
+    with tracing.span("llm_call", stage=stage, model=deployment, routing=routing["reason"], prompt_chars=sum(len(m["content"]) for m in messages)) as call_span:
+        if followup:
+            call_span.set(repair=True)
+        attempt = 0 # Rate-limited requests so far
+        rate_limit_error = None
+        while attempt < max_retries:
+            started = time.perf_counter()
+            try:
+                deadlines.check()
+                logging.info(f"Sending prompt to LLM (Attempt {attempt + 1}/{max_retries})...")
+                call_span.set(attempts=attempt + 1)
+                request = {"response_format": response_format} if response_format is not None else {}
+                if _stream_usage:
+                    request["stream_options"] = {"include_usage": True}
+                client = get_client()
+                time_left = deadlines.remaining()
+                if time_left is not None:
+                    request["timeout"] = min(LLM_CALL_TIMEOUT_S, time_left)
+                    if hasattr(client, "with_options"):
+                        client = client.with_options(max_retries=0) # openai's own retries would outlast the deadline
+                response = client.chat.completions.create(
+                    stream=True,
+                    messages=messages,
+                    temperature=0.0,
+                    top_p=1.0,
+                    frequency_penalty=0.0,
+                    presence_penalty=0.0,
+                    model=deployment,
+                    **request
+                )
 
-            full_response = ""
-            for chunk in response:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    full_response += chunk.choices[0].delta.content
-            
-            # Call the helper function to count and log tokens
-            count_tokens(system_prompt, user_prompt, full_response)
-                    
-            return full_response
+                chunks, usage, first_token_ms = [], None, None
+                if parser is not None:
+                    parser.reset()
+                try:
+                    for chunk in response:
+                        usage = getattr(chunk, "usage", None) or usage # Sent on a last chunk without choices
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if first_token_ms is None:
+                                first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                            chunks.append(chunk.choices[0].delta.content)
+                            if parser is not None:
+                                parser.feed(chunks[-1])
+                        deadlines.check()
+                finally:
+                    close = getattr(response, "close", None) # Drops the connection if we stopped early
+                    if close is not None:
+                        close()
+                full_response = "".join(chunks)
+
+                # Call the helper function to count and log tokens
+                input_tokens, output_tokens, _ = count_tokens(
+                    system_prompt, "".join(m["content"] for m in messages[1:]), full_response
+                )
+                cached_tokens = None
+                if usage is not None:
+                    input_tokens, output_tokens = usage.prompt_tokens, usage.completion_tokens
+                    details = getattr(usage, "prompt_tokens_details", None)
+                    cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+                call_span.set(response_chars=len(full_response), input_tokens=input_tokens, output_tokens=output_tokens,
+                              cached_tokens=cached_tokens)
+                llm_ledger.record(
+                    stage=stage, model=deployment, routing=routing, attempts=attempt + 1, repair=bool(followup),
+                    input_tokens=input_tokens, cached_tokens=cached_tokens, output_tokens=output_tokens,
+                    cost_usd=_router.cost_usd(deployment, input_tokens, cached_tokens, output_tokens),
+                    usage_source="provider" if usage is not None else "estimate",
+                    first_token_ms=first_token_ms, duration_ms=round((time.perf_counter() - started) * 1000, 1)
+                )
+                return full_response
         
-        except openai.RateLimitError as e:
-            sleep_time = 60 * (attempt + 1)
-            logging.warning(f"Rate limit hit. Retrying in 60s... ({attempt + 1}/{max_retries})")
-            time.sleep(60)
-            
-        except Exception as e:
-            # Log other errors and break the loop (no retry)
-            logging.error(f"An error occurred during the AI call: {e}", exc_info=True)
-            return None 
+            except deadlines.DeadlineExceeded as e:
+                logging.warning(f"LLM {stage}: cancelled, {e}.")
+                call_span.set(failed=type(e).__name__)
+                llm_ledger.record(stage=stage, model=deployment, routing=routing, attempts=attempt + 1, repair=bool(followup),
+                                  failed=type(e).__name__, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+                raise
+            except streaming_json.StreamFormatError as e:
+                logging.error(f"LLM response went off-format; stopped reading it: {e}")
+                call_span.set(failed=type(e).__name__, response_chars=e.received_chars)
+                llm_ledger.record(stage=stage, model=deployment, routing=routing, attempts=attempt + 1, repair=bool(followup),
+                                  failed=type(e).__name__, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+                raise
+            except Exception as e:
+                # A request that timed out at the deadline, or a backoff that would outlast it
+                overdue = deadlines.expired()
+                if overdue is None and _is_rate_limit_error(e):
+                    rate_limit_error = e
+                    if attempt + 1 >= max_retries:
+                        break
+                    logging.warning(f"Rate limit hit. Retrying in {RATE_LIMIT_BACKOFF_SECONDS:g}s... ({attempt + 1}/{max_retries})")
+                    try:
+                        deadlines.sleep(RATE_LIMIT_BACKOFF_SECONDS)
+                        attempt += 1
+                        continue
+                    except deadlines.DeadlineExceeded as sleep_error:
+                        overdue = sleep_error
+                if overdue is not None:
+                    logging.warning(f"LLM {stage}: cancelled, {overdue} ({type(e).__name__}).")
+                    call_span.set(failed=type(overdue).__name__)
+                    llm_ledger.record(stage=stage, model=deployment, routing=routing, attempts=attempt + 1, repair=bool(followup),
+                                      failed=type(overdue).__name__, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+                    raise overdue from e
+                if response_format is not None and LLM_RESPONSE_FORMAT == "auto" and _is_unsupported_parameter(e, "response_format"):
+                    response_format = _step_down_response_format(response_format)
+                    continue
+                if _stream_usage and _is_unsupported_parameter(e, "stream_options"):
+                    logging.warning("The API version does not support stream_options; token usage will be estimated.")
+                    _stream_usage = False
+                    continue
+                # Log other errors and break the loop (no retry)
+                logging.error(f"An error occurred during the AI call: {e}", exc_info=True)
+                call_span.set(failed=type(e).__name__)
+                llm_ledger.record(stage=stage, model=deployment, routing=routing, attempts=attempt + 1, repair=bool(followup),
+                                  failed=type(e).__name__)
+                return None 
 
-    logging.error("Max retries exceeded for RateLimitError. Giving up.")
-    return None
+        failed = type(rate_limit_error).__name__ if rate_limit_error is not None else "NoAttempts"
+        logging.error(f"Max retries ({max_retries}) exceeded for {failed}. Giving up.")
+        call_span.set(failed=failed)
+        llm_ledger.record(stage=stage, model=deployment, routing=routing, attempts=max_retries, repair=bool(followup),
+                          failed=failed)
+        return None
 
-# --- 7. Schema History Functions (Unchanged) ---
-SCHEMA_HISTORY_DIR = "schema_history"
-NUM_HISTORICAL_SCHEMAS_TO_LOAD = 3
+
+def get_llm_json_response(
+    system_prompt: str, user_prompt: str, shape: Dict[str, Any],
+    on_member: Optional[Callable[[Any, Any], None]] = None, stage: str = "response"
+) -> Optional[Any]:
+    """
+    Streams a JSON response, checking it against `shape` as it arrives and passing
+    each top-level member to `on_member(key, value)` as soon as it is complete.
+
+    Whatever parses is kept (see IncrementalJSONParser.salvage); fields that are
+    still missing or invalid are re-requested on their own, up to
+    LLM_REPAIR_ATTEMPTS times, instead of re-running the whole prompt. Returns the
+    value (fields that never came back are left out), or None if the call failed;
+    raises StreamFormatError if no usable JSON came back at all, and
+    DeadlineExceeded past the stage's deadline (STAGE_DEADLINES_S) or the run's.
+    """
+    is_list = shape.get("type", dict) is list
+    value, failures, followup, first_response = None, {}, [], None
+    with deadlines.limit(deadlines.stage_seconds(stage), stage): # Covers the repairs too
+        for repair in range(LLM_REPAIR_ATTEMPTS + 1):
+            requested = None if is_list or not failures else set(failures) # A repair may repeat fields that were fine
+            request_shape = shape if requested is None else streaming_json.subshape(shape, list(failures))
+
+            def on_requested_member(key, value):
+                if on_member is not None and (requested is None or key in requested):
+                    on_member(key, value)
+
+            parser = streaming_json.IncrementalJSONParser(request_shape, on_requested_member)
+            try:
+                response_text = get_llm_streaming_response(
+                    system_prompt, user_prompt, parser=parser,
+                    response_format=get_response_format(stage, request_shape), followup=followup, stage=stage
+                )
+            except streaming_json.StreamFormatError:
+                response_text = parser.text()
+            except deadlines.DeadlineExceeded as e:
+                if value is None:
+                    raise
+                logging.warning(f"LLM {stage}: repair cancelled, {e}; keeping the fields received so far.")
+                break
+            if response_text is None:
+                if value is None:
+                    return None
+                break # Keep what the earlier response gave
+
+            part, failures = parser.salvage()
+            if is_list:
+                value = part if part is not None else value
+                if parser.invalid:
+                    logging.warning(f"LLM {stage}: dropped {len(parser.invalid)} invalid item(s).")
+            elif part:
+                value = {**(value or {}), **{k: v for k, v in part.items() if requested is None or k in requested}}
+            if not failures:
+                break
+            if first_response is None:
+                first_response = response_text or "(empty response)"
+            if repair < LLM_REPAIR_ATTEMPTS:
+                logging.warning(f"LLM {stage}: re-requesting {', '.join(map(str, failures))} ({failures})")
+                expected_types = {} if is_list else {
+                    key: field["type"] for key, field in streaming_json.json_schema(streaming_json.subshape(shape, list(failures)))["properties"].items()
+                }
+                followup = [
+                    {"role": "assistant", "content": first_response},
+                    {"role": "user", "content": prompts.get_repair_prompt(failures, expected_types)},
+                ]
+
+    if failures:
+        if not value:
+            raise streaming_json.StreamFormatError(f"No usable JSON for {stage}: {failures}", len(first_response or ""))
+        logging.warning(f"LLM {stage}: fields still missing after repair: {failures}")
+    return value
+
+# --- 7. Schema History Functions ---
+# History lives in an indexed SQLite store (see schema_history.py); legacy
+# JSON files in SCHEMA_HISTORY_DIR are imported the first time the store is created.
+SCHEMA_HISTORY_DIR = schema_history.SCHEMA_HISTORY_DIR
+NUM_HISTORICAL_SCHEMAS_TO_LOAD = 10 # Drift is diffed locally, so more versions cost no prompt tokens
 
 def save_schema_to_history(table_name: str, file_schema: Dict[str, Any]):
-    # ... (code is identical to previous version) ...
     try:
-        safe_table_name = "".join(c if c.isalnum() else "_" for c in table_name)
-        os.makedirs(SCHEMA_HISTORY_DIR, exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%dT%H%M%SZ')
-        filename = f"{safe_table_name}_schema_{timestamp}.json"
-        filepath = os.path.join(SCHEMA_HISTORY_DIR, filename)
-        schema_to_save = {"columns": file_schema.get("columns", {})}
-        with open(filepath, 'w') as f:
-            json.dump(schema_to_save, f, indent=2)
-        logging.info(f"Saved current schema to history: {filepath}")
+        schema_to_save = {"columns": file_schema.get("columns", {}), "total_rows": file_schema.get("total_rows")}
+        content_hash = schema_history.save_schema(table_name, schema_to_save)
+        logging.info(f"Saved current schema to history for '{table_name}' (content {content_hash[:12]}).")
     except Exception as e:
         logging.error(f"Error saving schema to history for table '{table_name}': {e}")
 
 
 def load_historical_schemas(table_name: str, num_history: int) -> List[Dict[str, Any]]:
-    # ... (code is identical to previous version) ...
     historical_schemas = []
     try:
-        safe_table_name = "".join(c if c.isalnum() else "_" for c in table_name)
-        search_pattern = os.path.join(SCHEMA_HISTORY_DIR, f"{safe_table_name}_schema_*.json")
-        history_files = sorted(glob.glob(search_pattern), reverse=True)
-        files_to_load = history_files[:num_history]
-        logging.info(f"Found {len(history_files)} historical schemas for '{table_name}'. Loading the latest {len(files_to_load)}.")
-        for file in files_to_load:
-            try:
-                with open(file, 'r') as f:
-                    schema_data = json.load(f)
-                    historical_schemas.append(schema_data)
-            except Exception as e:
-                logging.warning(f"Error loading historical schema file '{file}': {e}")
+        historical_schemas = schema_history.load_schemas(table_name, num_history)
+        logging.info(f"Loaded the latest {len(historical_schemas)} historical schemas for '{table_name}'.")
     except Exception as e:
-        logging.error(f"Error searching for historical schemas for table '{table_name}': {e}")
+        logging.error(f"Error loading historical schemas for table '{table_name}': {e}")
     return historical_schemas
 
+# --- 7.5. Incremental Re-validation ---
+# Bump VALIDATOR_VERSION whenever a change to the checks or report layout should
+# invalidate stored sheet results. Prompt templates and the deployment are hashed
+# in as well, so editing a prompt or switching models invalidates them too.
+VALIDATOR_VERSION = "2"
+
+def get_validator_version() -> str:
+    templates = [
+        SYSTEM_PROMPT_INSIGHT, prompts.SCHEMA_ANALYSIS_PROMPT, prompts.DYNAMIC_RULES_PROMPT,
+        prompts.ANALYSIS_PROMPT, prompts.BATCH_ANALYSIS_PROMPT, prompts.REPAIR_PROMPT, DEPLOYMENT_NAME or "", LLM_RESPONSE_FORMAT,
+        json.dumps(_router.stage_deployments, sort_keys=True)
+    ]
+    digest = hashlib.sha256("\0".join(templates).encode('utf-8')).hexdigest()[:16]
+    return f"{VALIDATOR_VERSION}-{digest}"
+
+
+def get_target_schema_version(db_url: str, table_name: str) -> Optional[str]:
+    engine = tools.get_engine(db_url)
+    db_schema = tools.get_cached_db_schema(db_url, table_name)
+    if db_schema is None:
+        return None
+    try:
+        check_constraints = sqlalchemy.inspect(engine).get_check_constraints(table_name)
+    except NotImplementedError:
+        check_constraints = []
+    return result_cache.schema_version(db_schema, check_constraints)
+
 # --- 8. Core Validation Logic (UPDATED) ---
 
+def report_progress(progress_callback: Optional[Callable[[Dict[str, Any]], None]], event: str, **fields):
+    """Sends a progress event to the caller's callback; a failing callback never stops validation."""
+    if progress_callback is None:
+        return
+    try:
+        progress_callback({"event": event, "at": datetime.now(timezone.utc).isoformat(), **fields})
+    except Exception as e:
+        logging.warning(f"Progress callback failed on '{event}': {e}")
+
+
 # --- Constants (Unchanged) ---
 FILE_PATH = "ironclad.xlsx" 
 TABLE_NAME = None 
 DB_URL = "sqlite:///database/sample_data.db"
+# Report key holding the final-analysis inputs of a sheet whose analysis was deferred
+PENDING_FINAL_ANALYSIS = "pending_final_analysis"
+
+
+def mark_missing_stage(report: Dict[str, Any], stage: str, reason: str) -> None:
+    """
+    Records a stage that did not finish (e.g. an LLM stage cancelled at its
+    deadline) under the sheet report's `missing_stages`. Without the final
+    analysis, the validation summary is counted from the deterministic checks
+    and marked Partial.
+    """
+    report.setdefault("missing_stages", {})[stage] = reason
+    if stage == "final_analysis":
+        severities = [v.get("severity", "medium") for v in report.get("data_quality_issues") or []]
+        report["validation_summary"] = {
+            "status": "Partial",
+            "details": f"The final analysis did not finish ({reason}); the counts are from the deterministic checks only.",
+            "high_severity_issues": severities.count("high"),
+            "medium_severity_issues": severities.count("medium"),
+            "low_severity_issues": severities.count("low"),
+            "type_mismatches": len(report.get("data_type_mismatch") or []),
+        }
+
+
+def apply_final_analysis(base_report: Dict[str, Any], llm_analysis_json: Dict[str, Any]) -> None:
+    """Merges the LLM's final analysis into a sheet's base report."""
+    # Drift facts are computed locally; only take the LLM's narrative for them
+    llm_drift = llm_analysis_json.pop("schema_drift", None)
+    base_report.update(llm_analysis_json)
+    schema_drift_result = base_report.get("schema_drift") or {}
+    if schema_drift_result.get("detected") and isinstance(llm_drift, dict) and llm_drift.get("analysis"):
+        schema_drift_result["analysis"] = llm_drift["analysis"]
+
+
+def request_final_analysis(base_report: Dict[str, Any], analysis_inputs: Dict[str, Any]) -> None:
+    """
+    Step 7 for one sheet: asks the LLM for the final analysis of `analysis_inputs`
+    (the arguments of prompts.get_analysis_prompt) and merges it into `base_report`.
+    Raises ValueError if the call failed.
+    """
+    # Use the NEW prompt function
+    analysis_prompt = prompts.get_analysis_prompt(**analysis_inputs)
+    try:
+        # This is the SMALL JSON from the LLM
+        llm_analysis_json = get_llm_json_response(
+            SYSTEM_PROMPT_INSIGHT, analysis_prompt, FINAL_ANALYSIS_SHAPE, stage="final_analysis"
+        )
+    except streaming_json.StreamFormatError as e:
+        logging.error(f"Failed to parse JSON from final analysis: {e}")
+        # If it fails, we still have the base report with raw data
+        base_report["validation_summary"] = {"status": "Error", "details": "LLM analysis parsing failed."}
+        return
+    if llm_analysis_json is None:
+        raise ValueError("Failed to get final analysis from LLM.")
+    apply_final_analysis(base_report, llm_analysis_json)
+
+
+def _estimate_tokens(text: str) -> int:
+    try:
+        return len(_get_encoding().encode(text))
+    except Exception:
+        return len(text) // 4
+
+
+def plan_final_analysis_batches(
+    pending: Dict[str, Dict[str, Any]],
+    token_budget: int = FINAL_ANALYSIS_BATCH_TOKENS,
+    max_sheets: int = FINAL_ANALYSIS_BATCH_MAX_SHEETS
+) -> List[List[str]]:
+    """
+    Splits the sheets of `pending` (sheet name -> final-analysis inputs), in order,
+    into batches whose formatted inputs stay within `token_budget` estimated
+    tokens and `max_sheets` sheets. A sheet over the budget gets a batch of its own.
+    """
+    batches, batch, batch_tokens = [], [], 0
+    for sheet_name, inputs in pending.items():
+        tokens = _estimate_tokens(prompts.get_batch_sheet_input(sheet_name, **inputs))
+        if batch and (batch_tokens + tokens > token_budget or len(batch) >= max_sheets):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(sheet_name)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def run_batched_final_analysis(
+    reports: Dict[str, Dict[str, Any]],
+    token_budget: int = FINAL_ANALYSIS_BATCH_TOKENS,
+    max_sheets: int = FINAL_ANALYSIS_BATCH_MAX_SHEETS
+) -> None:
+    """
+    Fills in the deferred final analysis of `reports` (sheet name -> report with
+    PENDING_FINAL_ANALYSIS), several sheets per LLM request: each batch returns
+    one analysis object per sheet name, which is merged into that sheet's report.
+
+    Sheets missing from the batch response, or whose object lacks a key of
+    FINAL_ANALYSIS_SHAPE, fall back to their own request (as without batching).
+    A sheet whose fallback fails too gets an Error summary and an `error` key;
+    one cancelled at the deadline gets a Partial summary (see mark_missing_stage).
+    """
+    pending = {sheet_name: report.pop(PENDING_FINAL_ANALYSIS) for sheet_name, report in reports.items()}
+    for batch in plan_final_analysis_batches(pending, token_budget, max_sheets):
+        results = {}
+        if len(batch) > 1:
+            batch_shape = {"type": dict, "keys": {sheet_name: dict for sheet_name in batch}}
+            batch_prompt = prompts.get_batch_analysis_prompt({sheet_name: pending[sheet_name] for sheet_name in batch})
+            try:
+                with tracing.span("final_analysis_batch", sheets=len(batch)), llm_ledger.labelled(sheets=batch):
+                    results = get_llm_json_response(
+                        SYSTEM_PROMPT_INSIGHT, batch_prompt, batch_shape, stage="final_analysis_batch"
+                    ) or {}
+            except streaming_json.StreamFormatError as e:
+                logging.error(f"Failed to parse JSON from batched final analysis: {e}")
+            except deadlines.DeadlineExceeded as e:
+                logging.warning(f"Batched final analysis cancelled: {e}")
+                for sheet_name in batch:
+                    mark_missing_stage(reports[sheet_name], "final_analysis", str(e))
+                continue
+
+        for sheet_name in batch:
+            analysis = results.get(sheet_name)
+            invalid = [key for key, expected in FINAL_ANALYSIS_SHAPE["keys"].items()
+                       if not isinstance(analysis, dict) or not isinstance(analysis.get(key), expected)]
+            if not invalid:
+                apply_final_analysis(reports[sheet_name], analysis)
+                continue
+            if len(batch) > 1:
+                logging.warning(f"Batched final analysis unusable for sheet '{sheet_name}' ({', '.join(invalid)}); requesting it on its own.")
+            try:
+                with llm_ledger.labelled(sheet=sheet_name):
+                    request_final_analysis(reports[sheet_name], pending[sheet_name])
+            except deadlines.DeadlineExceeded as e:
+                logging.warning(f"Final analysis cancelled for sheet '{sheet_name}': {e}")
+                mark_missing_stage(reports[sheet_name], "final_analysis", str(e))
+            except Exception as e:
+                logging.error(f"Final analysis failed for sheet '{sheet_name}': {e}")
+                reports[sheet_name]["validation_summary"] = {"status": "Error", "details": str(e)}
+                reports[sheet_name]["error"] = str(e)
 
 def run_validation_for_sheet(
     df: pd.DataFrame,
     file_path: str,
     sheet_name: Optional[str],
     db_url: str,
-    user_provided_table_name: Optional[str]
+    user_provided_table_name: Optional[str],
+    pruned_columns: Optional[Dict[str, Dict[str, Any]]] = None,
+    column_loader: Optional[Callable[[List[str]], pd.DataFrame]] = None,
+    parse_failures: Optional[Dict[str, Dict[str, Any]]] = None,
+    memory_budget: bool = False,
+    memory_profile: Optional[List[Dict[str, Any]]] = None,
+    file_schema: Optional[Dict[str, Any]] = None,
+    deep_validator: Optional[Callable[[Dict[str, str], Dict[str, Any], str], tuple]] = None,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+    defer_final_analysis: bool = False,
+    sample_info: Optional[Dict[str, Any]] = None,
+    full_loader: Optional[Callable[[List[str]], tuple]] = None,
+    escalate_rate: float = sampling.SAMPLING_ESCALATE_RATE,
+    statistical_profile: bool = STATISTICAL_PROFILE,
+    profile_sketches: Optional[Dict[str, Dict[str, Any]]] = None
 ) -> (Dict[str, Any], Dict[str, Any], Optional[str]):
     """
     Runs the validation process for a single DataFrame (representing a sheet).
     This version now uses the new streaming API function.
+
+    `pruned_columns` are file columns that were not loaded into `df` (schema-only
+    details). If the LLM maps one of them to a DB column, `column_loader` is
+    called to read just those columns before deep validation.
+
+    `parse_failures` are type conversion failures already captured by the CSV
+    reader (keyed by file column); they go straight into `data_type_mismatch`.
+
+    With `memory_budget`, `df` is renamed in place, trimmed to the checked columns
+    and downcast before the quality checks. Per-stage peak memory is appended to
+    `memory_profile` (when tracemalloc is tracing) and returned in the report.
+
+    A precomputed `file_schema` and a `deep_validator(naming_mismatches, db_schema,
+    table_name, sampled) -> (type_violations, dq_violations)` let callers that never
+    hold the whole sheet in memory (sharded CSV mode) reuse the pipeline; `df` is
+    then None.
+
+    `progress_callback` receives a 'stage' event as each step starts, and an
+    'llm_partial' event for each top-level key of the schema analysis as it
+    streams in; with an active tracer (see tracing.py) each step is also
+    recorded as a span.
+
+    With `sample_info` (see sampling.py), `df` is a sample read from the file
+    (or, with a `deep_validator`, the validator checks one when `sampled`), so
+    schema extraction, the type and quality checks and the statistical profile
+    all see the same rows. Row-count violations then carry a `sampled` rate with
+    its confidence interval and estimated count, and the report a `sampling`
+    section whose `populations` says which sections describe the sample; if any
+    sampled violation rate reaches `escalate_rate`, the checks (and profile) are
+    run again on all rows, read with `full_loader(late_columns) -> (df,
+    parse_failures)`, for exact counts (sampling.escalated).
+
+    With `statistical_profile`, the report gets a `statistical_profile` section
+    (summaries, approximate quantiles, histograms, cardinality and outlier counts
+    per file column, see data_profile.py), computed from all rows of `df`
+    alongside the schema analysis. Callers without `df` pass the merged
+    `profile_sketches` of their chunks instead.
+
+    With `defer_final_analysis`, Step 7 makes no LLM call: the inputs of the
+    final analysis are left in the report under PENDING_FINAL_ANALYSIS for
+    run_batched_final_analysis to fill in together with other sheets.
+
+    LLM stages cancelled at their deadline (see deadlines.py) are listed in the
+    report's `missing_stages`: without the schema analysis the checks use the
+    exact column-name comparison (or the column mapping, if it streamed in
+    before the cancellation), and without the final analysis the validation
+    summary is counted from the checks and marked Partial.
     """
     sheet_report = {}
+    missing_stages = {}
     target_table_name = user_provided_table_name
     schema_analysis_json = {}
     inferred_table_name_sheet = None
+    stages = tracing.SpanSequence(sheet=sheet_name)
 
     try:
         sheet_display_name = sheet_name if sheet_name is not None else "CSV Data"
         logging.info(f"---  Starting Validation for Sheet: '{sheet_display_name}' ---")
 
         # --- Step 1 (Sheet): Extract Schema (Unchanged) ---
-        file_schema = tools.extract_schema_from_df(df, file_path, sheet_name)
+        report_progress(progress_callback, "stage", sheet=sheet_name, stage="schema_extraction")
+        stages.start("schema_extraction")
+        if df is not None:
+            tools.drop_blank_rows(df) # Checked rows; shards apply the same filter (sharded_csv._check_shard)
+        if file_schema is None:
+            with tools.memory_stage(memory_profile, "schema_extraction") as stage:
+                file_schema = tools.extract_schema_from_df(df, file_path, sheet_name, extra_columns=pruned_columns)
+                stage["frame_mb"] = tools.frame_memory_mb(df) if memory_profile is not None else None
         if "error" in file_schema or not file_schema.get("columns"):
             raise ValueError(f"Schema extraction failed for sheet '{sheet_display_name}'")
+        tracing.current_span().set(rows=file_schema.get("total_rows"), columns=len(file_schema["columns"]))
+
+        # --- Step 1.5 (Sheet): Statistical Profile ---
+        def build_statistical_profile(frame: Optional[pd.DataFrame]):
+            with tracing.span("statistical_profile", sheet=sheet_name):
+                try:
+                    return data_profile.summarize(profile_sketches if frame is None else data_profile.sketch_frame(frame))
+                except Exception as e:
+                    logging.warning(f"Statistical profile failed: {e}")
+                    return {"error": str(e)}
+
+        profile_future = None
+        if statistical_profile and (df is not None or profile_sketches is not None):
+            if memory_budget:
+                # The checks rename and downcast `df` in place, so profile it first
+                profile_future = Future()
+                profile_future.set_result(build_statistical_profile(df))
+            else:
+                profile_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="statistical-profile")
+                profile_future = profile_executor.submit(tracing.run_in_context(build_statistical_profile), df)
+                profile_executor.shutdown(wait=False) # The thread finishes the profile and exits
 
         # --- Step 2 (Sheet): Determine Table Name (UPDATED) ---
         if target_table_name is not None:
@@ -220,7 +796,8 @@ def run_validation_for_sheet(
 
         else:
             logging.warning(f"No table name provided. Fetching all table names for user selection...")
-            engine = sqlalchemy.create_engine(db_url)
+            stages.start("table_selection")
+            engine = tools.get_engine(db_url)
             
             # We still need all_schemas to get the table names
             all_schemas = tools.get_all_table_schemas(engine)
@@ -260,51 +837,149 @@ def run_validation_for_sheet(
 
         # --- Step 3 (Sheet): LLM Schema Analysis (UPDATED) ---
         logging.info(f"--- [Sheet '{sheet_display_name}'] Step 2: LLM Schema Analysis ---")
-        engine = sqlalchemy.create_engine(db_url)
-        db_schema = tools.get_db_schema(engine, target_table_name)
+        report_progress(progress_callback, "stage", sheet=sheet_name, stage="schema_analysis")
+        stages.start("schema_analysis")
+        engine = tools.get_engine(db_url)
+        db_schema = tools.get_cached_db_schema(db_url, target_table_name)
         if db_schema is None:
             raise ValueError(f"Database table '{target_table_name}' does not exist.")
 
         raw_comparison = tools.compare_schemas(file_schema, db_schema)
         schema_prompt = prompts.get_schema_analysis_prompt(
             db_schema=db_schema, file_schema=file_schema, raw_comparison=raw_comparison,
-            target_table_name=target_table_name, source_file_name=os.path.basename(file_path)
+            target_table_name=target_table_name, source_file_name=os.path.basename(os.path.normpath(file_path))
         )
         
-        schema_response_str = get_llm_streaming_response(SYSTEM_PROMPT_INSIGHT, schema_prompt)
-        if schema_response_str is None:
-            raise ValueError("Failed to get schema analysis from LLM.")
-        
-        try:
-            schema_analysis_json = json.loads(schema_response_str)
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse JSON from schema analysis: {e}\nRaw response: {schema_response_str}")
-            raise ValueError("LLM did not return valid JSON for schema analysis.")
-            
-        logging.info(f"LLM Schema Analysis: Complete")
-
-        # --- Step 4 (Sheet): Deep Validation (Unchanged) ---
-        logging.info(f"--- [Sheet '{sheet_display_name}'] Step 3: Deep Validation ---")
-        naming_mismatches = schema_analysis_json.get("naming_mismatches", {})
-        mapped_df = df.rename(columns=naming_mismatches)
-        type_violations = tools.validate_data_types(mapped_df, db_schema)
-        dq_violations = tools.run_data_quality_checks(mapped_df, db_schema, engine, target_table_name)
+        def check_frame(frame: pd.DataFrame, naming_mismatches: Dict[str, str], mapped_parse_failures, stage: Dict[str, Any]):
+            if memory_budget:
+                # Rename in place (no second frame) and keep only the columns that get checked
+                frame.rename(columns=naming_mismatches, inplace=True)
+                frame.drop(columns=[c for c in frame.columns if c not in db_schema], inplace=True)
+                mapped_df = frame
+                # Type check first, so mismatches report the file's dtypes rather than the downcast ones
+                type_violations = tools.validate_data_types(mapped_df, db_schema, parse_failures=mapped_parse_failures)
+                tools.optimize_dataframe_memory(mapped_df)
+                stage["frame_mb"] = tools.frame_memory_mb(mapped_df)
+            else:
+                mapped_df = frame.rename(columns=naming_mismatches)
+                type_violations = tools.validate_data_types(mapped_df, db_schema, parse_failures=mapped_parse_failures)
+            dq_violations = tools.run_data_quality_checks(mapped_df, db_schema, engine, target_table_name)
+            return type_violations, dq_violations
+
+        def deep_validate(naming_mismatches: Dict[str, str]):
+            frame = df
+            late_columns = [c for c in naming_mismatches if pruned_columns and c in pruned_columns and c not in frame.columns]
+            if late_columns and column_loader is not None:
+                logging.info(f"Loading pruned columns mapped by the LLM: {late_columns}")
+                frame = frame.join(column_loader(late_columns))
+            mapped_parse_failures = {naming_mismatches.get(c, c): v for c, v in (parse_failures or {}).items()}
+            with tools.memory_stage(memory_profile, "deep_validation") as stage:
+                if deep_validator is not None:
+                    type_violations, dq_violations = deep_validator(naming_mismatches, db_schema, target_table_name, sample_info is not None)
+                else:
+                    type_violations, dq_violations = check_frame(frame, naming_mismatches, mapped_parse_failures, stage)
+                if sample_info is None:
+                    return type_violations, dq_violations
+
+                estimates = dict(sample_info)
+                estimates.update(sampling.estimate_violation_rates(type_violations + dq_violations, sample_info))
+                estimates["escalate_rate"] = escalate_rate
+                estimates["escalated"] = estimates["max_sampled_rate"] >= escalate_rate
+                tracing.current_span().set(sampled=True, max_sampled_rate=estimates["max_sampled_rate"], escalated=estimates["escalated"])
+                sampling_report.update(estimates)
+                if not estimates["escalated"]:
+                    return type_violations, dq_violations
+
+                logging.warning(f"Sampled violation rate {estimates['max_sampled_rate']:.2%} reaches {escalate_rate:.2%}; checking all {estimates['rows_total']} rows.")
+                with tracing.span("escalated_checks", rows=estimates["rows_total"]):
+                    if deep_validator is not None:
+                        return deep_validator(naming_mismatches, db_schema, target_table_name, False)
+                    full_frame, full_parse_failures = full_loader(late_columns)
+                    tools.drop_blank_rows(full_frame)
+                    escalation["rows"] = len(full_frame)
+                    if profile_future is not None and profile_sketches is None:
+                        escalation["statistical_profile"] = build_statistical_profile(full_frame) # Before the checks modify the frame
+                    mapped_full_failures = {naming_mismatches.get(c, c): v for c, v in (full_parse_failures or {}).items()}
+                    return check_frame(full_frame, naming_mismatches, mapped_full_failures, stage)
+
+        def deep_validate_overlapped(naming_mismatches: Dict[str, str]):
+            with tracing.span("deep_validation", sheet=sheet_name, rows=file_schema.get("total_rows"), overlapped=True):
+                return deep_validate(naming_mismatches)
+
+        # Deep validation only needs the column mapping, so it starts on a worker
+        # thread as soon as 'naming_mismatches' streams in, while the LLM is still
+        # writing the rest of the analysis.
+        overlapped_validation = tracing.run_in_context(deep_validate_overlapped)
+        early = {}
+        sampling_report = {}
+        escalation = {}
+
+        def on_schema_member(key, value):
+            report_progress(progress_callback, "llm_partial", sheet=sheet_name, stage="schema_analysis", key=key, value=value)
+            if key == "naming_mismatches" and OVERLAP_DEEP_VALIDATION and not early:
+                logging.info(f"Column mapping received; starting deep validation while the analysis streams.")
+                report_progress(progress_callback, "stage", sheet=sheet_name, stage="deep_validation")
+                early["naming_mismatches"] = value
+                early["executor"] = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deep-validation")
+                overlap_scope.callback(early["executor"].shutdown)
+                early["future"] = early["executor"].submit(overlapped_validation, value)
+
+        with contextlib.ExitStack() as overlap_scope: # Waits for an overlapped validation, even on errors
+            try:
+                schema_analysis = get_llm_json_response(
+                    SYSTEM_PROMPT_INSIGHT, schema_prompt, SCHEMA_ANALYSIS_SHAPE, on_member=on_schema_member, stage="schema_analysis"
+                )
+            except streaming_json.StreamFormatError as e:
+                logging.error(f"Failed to parse JSON from schema analysis: {e}")
+                raise ValueError("LLM did not return valid JSON for schema analysis.")
+            except deadlines.DeadlineExceeded as e:
+                # Keep the deterministic part: the exact-name comparison, less any mapping that streamed in
+                naming_mismatches = early.get("naming_mismatches", {})
+                logging.warning(f"Schema analysis cancelled ({e}); continuing with {'the streamed column mapping' if early else 'exact column names'}.")
+                missing_stages["schema_analysis"] = str(e)
+                schema_analysis = {
+                    "columns_missing_from_file": [c for c in raw_comparison["columns_missing_from_file"] if c not in naming_mismatches.values()],
+                    "columns_extra_in_file": [c for c in raw_comparison["columns_extra_in_file"] if c not in naming_mismatches],
+                    "naming_mismatches": naming_mismatches,
+                }
+            if schema_analysis is None:
+                raise ValueError("Failed to get schema analysis from LLM.")
+            schema_analysis_json = schema_analysis
+            logging.info(f"LLM Schema Analysis: Complete")
+
+            # --- Step 4 (Sheet): Deep Validation (Unchanged) ---
+            logging.info(f"--- [Sheet '{sheet_display_name}'] Step 3: Deep Validation ---")
+            if early:
+                # The mapping that was validated is the one reported (a repeated key cannot replace it)
+                schema_analysis_json["naming_mismatches"] = early["naming_mismatches"]
+                stages.start("deep_validation_wait")
+                type_violations, dq_violations = early["future"].result()
+            else:
+                report_progress(progress_callback, "stage", sheet=sheet_name, stage="deep_validation")
+                stages.start("deep_validation", rows=file_schema.get("total_rows"))
+                type_violations, dq_violations = deep_validate(schema_analysis_json.get("naming_mismatches", {}))
         logging.info(f"Deep validation: Complete")
 
         # --- Step 4.5 (Sheet): Infer Dynamic Rules (UPDATED) ---
         logging.info(f"--- [Sheet '{sheet_display_name}'] Step 4.5: Inferring Dynamic Rules ---")
+        report_progress(progress_callback, "stage", sheet=sheet_name, stage="dynamic_rules")
+        stages.start("dynamic_rules")
         dynamic_rules = []
         try:
             dynamic_rules_prompt = prompts.get_dynamic_rules_prompt(file_schema)
-            dynamic_rules_str = get_llm_streaming_response(SYSTEM_PROMPT_INSIGHT, dynamic_rules_prompt)
-            if dynamic_rules_str:
-                dynamic_rules = json.loads(dynamic_rules_str)
+            dynamic_rules = get_llm_json_response(
+                SYSTEM_PROMPT_INSIGHT, dynamic_rules_prompt, DYNAMIC_RULES_SHAPE, stage="dynamic_rules"
+            ) or []
             logging.info(f"LLM Dynamic Rules: Complete")
+        except deadlines.DeadlineExceeded as e:
+            logging.warning(f"Dynamic rules cancelled: {e}")
+            missing_stages["dynamic_rules"] = str(e)
         except Exception as e:
             logging.warning(f"Could not generate dynamic rules: {e}")
             dynamic_rules = [{"error": "Failed to generate dynamic rules"}]
 
         logging.info(f"--- [Sheet '{sheet_display_name}'] Step 5: Assembling Violation Summary ---")
+        stages.start("sheet_report")
         def _create_violation_summary(types, dq):
             summary = {
                 "type_mismatch_summary": [
@@ -312,23 +987,31 @@ def run_validation_for_sheet(
                         for v in types
                     ],
                 "data_quality_issue_summary": [
-                    {"column": v["column"], "check": v["check"], "count": v["count"], "severity": v.get("severity", "medium")}
+                    {"column": v["column"], "check": v["check"], "count": v.get("count", v.get("total_duplicate_records")), "severity": v.get("severity", "medium")}
                         for v in dq
                     ]
             }
             return summary
 
         violations_summary = _create_violation_summary(type_violations, dq_violations)
+        rows_checked = file_schema.get("total_rows")
+        if sampling_report and not sampling_report["escalated"]:
+            # The counts are those of the sample
+            violations_summary["sampling"] = {k: sampling_report[k] for k in ("method", "rows_sampled", "rows_total")}
+            if df is None:
+                rows_checked = sampling_report["rows_sampled"]
+        elif sampling_report:
+            rows_checked = escalation.get("rows", sampling_report["rows_total"])
 
 # --- [NEW] Step 6: Build Base Report (Python) ---
         logging.info(f"--- [Sheet '{sheet_display_name}'] Step 6: Building Base Report ---")
-        file_metadata = {"file_name": os.path.basename(file_path), "sheet_name": sheet_name, "total_rows": file_schema.get("total_rows")}
+        file_metadata = {"file_name": os.path.basename(os.path.normpath(file_path)), "sheet_name": sheet_name, "total_rows": file_schema.get("total_rows")}
 
         # This is our final JSON object, assembled in Python for free
         base_report = {
             "file_name": file_metadata.get("file_name"),
             "sheet_name": file_metadata.get("sheet_name"),
-            "total_rows_checked": file_metadata.get("total_rows"),
+            "total_rows_checked": rows_checked,
             "validated_at": datetime.now(timezone.utc).isoformat(),
 
             # Dump the raw, detailed violation lists directly
@@ -345,41 +1028,55 @@ def run_validation_for_sheet(
             "root_cause_analysis": {},
             "overall_analysis": {}
         }
+        if memory_profile is not None:
+            base_report["memory_profile"] = memory_profile
+        if profile_future is not None:
+            base_report["statistical_profile"] = escalation.get("statistical_profile") or profile_future.result()
+        if sampling_report:
+            # Which sections describe the sample and which all rows
+            checked = "all_rows" if sampling_report["escalated"] else "sample"
+            sampling_report["populations"] = {"data_type_mismatch": checked, "data_quality_issues": checked}
+            if profile_future is not None:
+                sampling_report["populations"]["statistical_profile"] = \
+                    "sample" if df is not None and "statistical_profile" not in escalation else "all_rows"
+            base_report["sampling"] = sampling_report
+        if missing_stages:
+            base_report["missing_stages"] = missing_stages
 
  # --- [NEW] Step 7: LLM Final Analysis (Cheap) ---
         logging.info(f"--- [Sheet '{sheet_display_name}'] Step 7: Calling LLM for Final Analysis ---")
+        if not defer_final_analysis:
+            report_progress(progress_callback, "stage", sheet=sheet_name, stage="final_analysis")
+        stages.start("final_analysis", deferred=defer_final_analysis)
         historical_schemas = load_historical_schemas(target_table_name, NUM_HISTORICAL_SCHEMAS_TO_LOAD)
+        schema_drift_result = schema_drift.detect_schema_drift(file_schema, historical_schemas)
+        base_report["schema_drift"] = schema_drift_result
 
-# Use the NEW prompt function
-        analysis_prompt = prompts.get_analysis_prompt(
-        schema_analysis=schema_analysis_json,
-        violations_summary=violations_summary,
-        historical_schemas=historical_schemas
-        )
-
-        analysis_response_str = get_llm_streaming_response(SYSTEM_PROMPT_INSIGHT, analysis_prompt)
-        if analysis_response_str is None:
-            raise ValueError("Failed to get final analysis from LLM.")
-
-        try:
- # This is the SMALL JSON from the LLM
-            llm_analysis_json = json.loads(analysis_response_str)
-            base_report.update(llm_analysis_json)
-
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse JSON from final analysis: {e}\nRaw response: {analysis_response_str}")
-            # If it fails, we still have the base report with raw data
-            base_report["validation_summary"] = {"status": "Error", "details": "LLM analysis parsing failed."}
+        analysis_inputs = {
+            "schema_analysis": schema_analysis_json,
+            "violations_summary": violations_summary,
+            "schema_drift_delta": schema_drift.compact_drift_delta(schema_drift_result)
+        }
+        if defer_final_analysis:
+            base_report[PENDING_FINAL_ANALYSIS] = analysis_inputs
+        else:
+            try:
+                request_final_analysis(base_report, analysis_inputs)
+            except deadlines.DeadlineExceeded as e:
+                logging.warning(f"Final analysis cancelled: {e}")
+                mark_missing_stage(base_report, "final_analysis", str(e))
 
  # Save schema history (this is unchanged)
         if target_table_name:
             save_schema_to_history(target_table_name, file_schema)
 
+        stages.end()
         logging.info(f"--- Sheet '{sheet_display_name}' Validation Complete ---")
 
  # IMPORTANT: Make sure to return the base_report
         sheet_report = base_report
     except Exception as e:
+        stages.end(e)
         logging.error(f"---  ERROR during validation for Sheet '{sheet_display_name}': {e} ---", exc_info=True)
         sheet_report = {
             "file_name": file_path, "sheet_name": sheet_name,
@@ -391,10 +1088,227 @@ def run_validation_for_sheet(
     return sheet_report, schema_analysis_json, inferred_table_name_sheet
 
 
-# --- 9. Main Runner Function (Unchanged from last version) ---
-def run_multi_sheet_validation(file_path: str, db_url=DB_URL, user_provided_table_name: Optional[str] = None):
+# --- 9. Main Runner Function ---
+def load_columnar_data(file_path: str, db_url: str, table_name: Optional[str], prune_columns: bool = True,
+                       rows: Optional[np.ndarray] = None):
+    """
+    Loads a Parquet/Arrow/Feather input, reading only the columns that match the
+    target table's schema when the table is known, and only `rows` (positions,
+    e.g. a sample from plan_sample) when given.
+
+    Returns the DataFrame and schema-only details for the columns left on disk.
+    """
+    file_columns = list(tools.read_columnar_schema(file_path).keys())
+    columns_to_read = None
+    if prune_columns and table_name:
+        db_schema = tools.get_cached_db_schema(db_url, table_name)
+        if db_schema:
+            # If nothing matches by name, read everything and let the LLM map it
+            columns_to_read = tools.select_columns_for_schema(file_columns, db_schema) or None
+
+    df = tools.read_columnar_file(file_path, columns=columns_to_read, rows=rows)
+    pruned = [c for c in file_columns if c not in df.columns]
+    if pruned:
+        logging.info(f"Pruned {len(pruned)} of {len(file_columns)} columns from the read: {pruned}")
+    return df, tools.describe_columnar_columns(file_path, pruned)
+
+
+def load_csv_data(file_path: str, db_url: str, table_name: Optional[str], fast_csv: bool = True,
+                  rows: Optional[np.ndarray] = None):
+    """
+    Loads a CSV. With `fast_csv`, uses the multithreaded pyarrow reader and, when
+    the target table is known, its schema as dtype hints. With `rows` (positions,
+    e.g. a sample from plan_sample), only those lines are parsed and the frame
+    is indexed by them.
+
+    Returns the DataFrame and the type conversion failures found while parsing.
+    """
+    source = file_path if rows is None else tools.read_csv_lines(file_path, rows)
+    if not fast_csv:
+        df, parse_failures = pd.read_csv(source), {}
+    else:
+        db_schema = None
+        if table_name:
+            db_schema = tools.get_cached_db_schema(db_url, table_name)
+        df, parse_failures = tools.read_csv_with_schema(source, db_schema)
+    if rows is not None:
+        df.index = pd.Index(rows)
+    return df, parse_failures
+
+
+def plan_sample(file_path: str, columnar_format: Optional[str], sample_rows: int, sample_method: str):
+    """
+    Draws the rows of a sampling-mode run before the data is read: counts the
+    rows of a CSV (without parsing it) or of a columnar input (from its
+    metadata) and, for 'stratified:<column>', reads that one column.
+
+    Returns the sorted row positions (None if the sample covers every row) and
+    the sample's description (see sampling.sample_positions).
+    """
+    if columnar_format:
+        dataset = tools.open_columnar_dataset(file_path)
+        column = sampling.strata_column(sample_method, dataset.schema.names)
+        strata = dataset.to_table(columns=[column]).column(0).to_pandas() if column else None
+        total = len(strata) if strata is not None else dataset.count_rows()
+    else:
+        column = sampling.strata_column(sample_method, list(pd.read_csv(file_path, nrows=0).columns))
+        strata = tools.read_csv_column(file_path, column) if column else None
+        total = len(strata) if strata is not None else tools.count_csv_rows(file_path)
+    return sampling.sample_positions(total, sample_rows, sample_method, strata=strata)
+
+
+def validate_csv_sharded(file_path: str, db_url: str, table_name: Optional[str], shard_workers: int,
+                         progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                         statistical_profile: bool = STATISTICAL_PROFILE,
+                         sample_rows: Optional[int] = None, sample_method: str = "uniform",
+                         escalate_rate: float = sampling.SAMPLING_ESCALATE_RATE):
+    """
+    Validates one CSV in byte-range shards on a process pool.
+
+    Pass 1 profiles the shards into a file schema for the LLM mapping (and, with
+    `statistical_profile`, sketches their columns), pass 2 runs the checks per
+    shard with that mapping; results are merged exactly.
+
+    With `sample_rows`, pass 2 checks a sample stratified by shard: each shard
+    samples its share of `sample_rows` in proportion to its rows (whatever
+    `sample_method` asks for). The statistical profile still covers every row.
     """
-    Handles CSV or multi-sheet Excel validation by iterating through sheets.
+    db_schema = None
+    if table_name:
+        db_schema = tools.get_cached_db_schema(db_url, table_name)
+    header, ranges = sharded_csv.plan_byte_ranges(file_path, sharded_csv.shard_count_for(file_path, shard_workers))
+    num_partitions = shard_workers * sharded_csv.PK_PARTITIONS_PER_WORKER
+    logging.info(f"Sharded CSV mode: {len(ranges)} byte ranges on {shard_workers} processes.")
+
+    with ProcessPoolExecutor(max_workers=shard_workers) as pool:
+        with tracing.span("sharded.profile", shards=len(ranges)) as profile_span:
+            file_schema, profile_sketches, shard_rows = sharded_csv.profile_csv(pool, file_path, ranges, header, db_schema, statistical_profile)
+            profile_span.set(rows=file_schema.get("total_rows"))
+
+        shard_samples, sample_info = None, None
+        if sample_rows and sample_rows < sum(shard_rows):
+            if sample_method != "stratified":
+                logging.info(f"Sharded sampling is stratified by shard; '{sample_method}' does not apply.")
+            allocation = sampling.allocate(shard_rows, sample_rows)
+            shard_samples = [(rows, int(share)) for rows, share in zip(shard_rows, allocation)]
+            sample_info = {"method": "stratified", "rows_total": sum(shard_rows), "rows_sampled": int(allocation.sum()),
+                           "seed": sampling.SAMPLING_SEED, "strata": len(ranges), "strata_by": "shard"}
+
+        def deep_validator(naming_mismatches, target_db_schema, target_table_name, sampled):
+            rows = sample_info["rows_sampled"] if sampled else file_schema.get("total_rows")
+            with tracing.span("sharded.validate", shards=len(ranges), rows=rows, sampled=sampled):
+                return sharded_csv.validate_csv(
+                    pool, file_path, ranges, header, db_url, target_table_name,
+                    target_db_schema, naming_mismatches, num_partitions, shard_samples if sampled else None
+                )
+
+        return run_validation_for_sheet(
+            df=None, file_path=file_path, sheet_name=None,
+            db_url=db_url, user_provided_table_name=table_name,
+            file_schema=file_schema, deep_validator=deep_validator,
+            progress_callback=progress_callback,
+            sample_info=sample_info, escalate_rate=escalate_rate,
+            statistical_profile=statistical_profile, profile_sketches=profile_sketches
+        )
+
+
+def run_multi_sheet_validation(
+    file_path: str,
+    db_url=DB_URL,
+    user_provided_table_name: Optional[str] = None,
+    prune_columns: bool = True,
+    fast_csv: bool = True,
+    memory_budget: bool = False,
+    shard_workers: Optional[int] = None,
+    incremental: bool = False,
+    run_dir: Optional[str] = None,
+    resume: bool = False,
+    max_sheet_attempts: int = run_checkpoints.DEFAULT_MAX_SHEET_ATTEMPTS,
+    output_path: str = "validation_report_converted.json",
+    print_report: bool = True,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+    trace: bool = False,
+    trace_memory: bool = True,
+    profile: Optional[str] = None,
+    profile_stages: Optional[List[str]] = None,
+    batch_final_analysis: bool = False,
+    deadline_s: Optional[float] = VALIDATION_RUN_DEADLINE_S,
+    sample_rows: Optional[int] = None,
+    sample_method: str = "uniform",
+    escalate_rate: float = sampling.SAMPLING_ESCALATE_RATE,
+    statistical_profile: bool = STATISTICAL_PROFILE
+):
+    """
+    Handles CSV, Parquet/Arrow/Feather or multi-sheet Excel validation by iterating through sheets.
+
+    Columnar inputs (including partitioned dataset directories) are read natively
+    with their own types; with `prune_columns`, only columns matching the target
+    table are read. CSVs use the schema-directed pyarrow reader unless `fast_csv`
+    is False.
+
+    `memory_budget` shrinks each sheet's frame before the checks (see
+    run_validation_for_sheet) and adds a per-stage `memory_profile` to each report.
+
+    `shard_workers` > 1 validates a CSV in byte-range shards on that many
+    processes (see sharded_csv) instead of loading it into one DataFrame.
+
+    With `incremental` (and a known target table), each sheet's result is stored
+    under its content fingerprint, the target schema version and the validator
+    version; sheets whose key is unchanged reuse the stored report and skip
+    parsing, checks and LLM calls.
+
+    Each finished sheet is checkpointed atomically in `run_dir` (default: a stable
+    directory per file and table under run_checkpoints.VALIDATION_RUNS_DIR) and the
+    final report is assembled from the checkpoints. With `resume`, sheets already
+    done are skipped and failed ones are retried, each sheet at most
+    `max_sheet_attempts` times in total across the run and its resumes. The
+    default directory is removed once every sheet is done; a `run_dir` passed in
+    is kept.
+
+    The combined report is written to `output_path` and, with `print_report`,
+    echoed to stdout. `progress_callback` receives dict events: run_started,
+    sheet_started, stage, llm_partial, sheet_finished, then run_completed or run_failed.
+
+    With `trace`, the run is recorded as nested spans (load, each stage, each
+    check type, each LLM call, report assembly) with wall/CPU time, rows and, with
+    `trace_memory`, peak memory (tracemalloc slows allocation-heavy stages). The
+    spans go into the report's `trace` section and next to `output_path` as
+    Chrome trace (.trace.json) and OTLP JSON (.otlp.json) files.
+
+    `profile` ("cprofile" or "sampling") profiles the run, or only the spans named
+    in `profile_stages`, and writes the profiles next to `output_path`; the
+    report's `profile` section lists them (see profiling.py).
+
+    Every LLM call is recorded in the report's `llm_usage` section: tokens, the
+    prompt-prefix tokens served from the provider's cache, latency and estimated
+    cost per stage and deployment, and the routing decision that picked each
+    call's deployment (see llm_ledger.py and llm_routing.py).
+
+    With `batch_final_analysis`, the sheets of a multi-sheet workbook defer their
+    final analysis until all sheets are validated; it is then requested for
+    several sheets at once (see run_batched_final_analysis) and split back into
+    each sheet's report.
+
+    With `deadline_s`, the LLM stages are cancelled once the run has taken that
+    long (per-stage deadlines: STAGE_DEADLINES_S, see deadlines.py) and the report
+    is still written: sheets keep their deterministic results and list the
+    cancelled stages under `missing_stages`; sheets not started by then are
+    skipped (checkpointed as failed without using an attempt, so a resume
+    validates them). The `run` section lists the partial and skipped sheets.
+    Partial results are not stored for incremental reuse.
+
+    `sample_rows`, `sample_method` and `escalate_rate` turn on sampling mode for
+    each sheet (see run_validation_for_sheet). The sample is drawn before the
+    read: a CSV's lines are counted and only the sampled ones parsed, a columnar
+    input reads only the sampled rows, and each shard of a sharded CSV checks
+    its share of the sample (see validate_csv_sharded). Excel sheets are read
+    whole and sampled before any check. Sampled results that were not escalated
+    to a full scan are not stored for incremental reuse either.
+
+    With `statistical_profile`, each sheet report gets a `statistical_profile`
+    section (see run_validation_for_sheet); in sharded CSV mode it is merged from
+    per-shard sketches taken in the profiling pass. Stored results without the
+    section are not reused when it is requested.
     """
     logging.info(f"---  STARTING VALIDATION FOR FILE: {file_path} ---")
     if user_provided_table_name:
@@ -402,9 +1316,27 @@ def run_multi_sheet_validation(file_path: str, db_url=DB_URL, user_provided_tabl
     else:
         logging.info("User did not provide target table. Will infer table per sheet.")
 
+    # Profiling hooks into the tracer's spans, so it needs one even without `trace`
+    tracer = tracing.Tracer(track_memory=trace and trace_memory) if trace or profile else None
+    profiler = profiling.RunProfiler(profile, profile_stages) if profile else None
+    ledger = llm_ledger.LLMLedger()
+    trace_scope = contextlib.ExitStack()
+    trace_scope.enter_context(llm_ledger.activate(ledger))
+    trace_scope.enter_context(deadlines.limit(deadline_s, "run"))
+    if trace and trace_memory:
+        trace_scope.enter_context(tracing.tracemalloc_session())
+    if profiler is not None:
+        trace_scope.enter_context(profiler.attach(tracer))
+    if tracer is not None:
+        trace_scope.enter_context(tracing.activate(tracer))
+        trace_scope.enter_context(tracing.span("run", file_name=os.path.basename(os.path.normpath(file_path))))
+    phases = tracing.SpanSequence()
+
     try:
         sheet_names: List[Optional[str]] = []
         is_excel = file_path.endswith(('.xls', '.xlsx'))
+        columnar_format = tools.get_columnar_format(file_path)
+        use_shards = bool(shard_workers and shard_workers > 1 and not is_excel and not columnar_format)
 
         if is_excel:
             xls = pd.ExcelFile(file_path)
@@ -413,54 +1345,251 @@ def run_multi_sheet_validation(file_path: str, db_url=DB_URL, user_provided_tabl
             if not sheet_names:
                 logging.warning(f"Excel file '{file_path}' contains no sheets.")
                 return
+        elif columnar_format:
+            sheet_names = [None] # Single table, reported like a CSV
+            logging.info(f"Detected columnar ({columnar_format}) input: {file_path}")
         else:
             sheet_names = [None] # Placeholder for CSV
             logging.info(f"Detected CSV file: {file_path}")
 
+        base_file_name = os.path.basename(os.path.normpath(file_path))
         all_sheet_reports: Dict[str, Dict] = {}
         first_schema_mismatch = {}
         inferred_target_table = None
-        
-        for sheet_name in sheet_names:
+        if memory_budget:
+            trace_scope.enter_context(tracing.tracemalloc_session()) # Released when the run ends or fails
+
+        fingerprints, schema_ver, validator_ver = {}, None, None
+        if incremental and user_provided_table_name:
+            try:
+                schema_ver = get_target_schema_version(db_url, user_provided_table_name)
+                validator_ver = get_validator_version()
+                fingerprints = result_cache.fingerprint_sheets(file_path, sheet_names) if schema_ver else {}
+            except Exception as e:
+                logging.warning(f"Incremental mode disabled for this run, could not fingerprint '{file_path}': {e}")
+                fingerprints = {}
+        elif incremental:
+            logging.warning("Incremental mode needs a target table; validating every sheet.")
+        defer_final_analysis = batch_final_analysis and is_excel and len(sheet_names) > 1
+
+        def store_sheet_result(sheet_name, sheet_report, schema_analysis_json, inferred_table):
+            # Only complete results are reused; errors, unparsed LLM output and pending analyses are retried next run
+            fingerprint = fingerprints.get(sheet_name)
+            if not fingerprint or "error" in sheet_report or PENDING_FINAL_ANALYSIS in sheet_report or "missing_stages" in sheet_report \
+                    or sheet_report.get("sampling", {}).get("escalated") is False \
+                    or sheet_report.get("validation_summary", {}).get("status") == "Error":
+                return
+            try:
+                result_cache.store_result(
+                    fingerprint, schema_ver, validator_ver, user_provided_table_name,
+                    sheet_report, schema_analysis_json, inferred_table
+                )
+            except Exception as e:
+                logging.warning(f"Could not store the result for sheet '{sheet_name if sheet_name is not None else 'CSV Data'}': {e}")
+
+        def validate_sheet(sheet_name: Optional[str]):
             current_df = None
             sheet_display_name = sheet_name if sheet_name is not None else "CSV Data"
-            try:
-                logging.info(f"--- Loading data for sheet: '{sheet_display_name}' ---")
-                current_df = pd.read_excel(file_path, sheet_name=sheet_name) if is_excel else pd.read_csv(file_path)
-                
+            fingerprint = fingerprints.get(sheet_name)
+            cached = None
+            if fingerprint:
+                cached = result_cache.load_result(fingerprint, schema_ver, validator_ver, user_provided_table_name)
+            if cached and statistical_profile and "statistical_profile" not in cached[0]:
+                logging.info(f"Stored result for sheet '{sheet_display_name}' has no statistical profile; validating again.")
+                cached = None
+            if cached:
+                logging.info(f"--- Sheet '{sheet_display_name}' unchanged (content {fingerprint[:12]}); reusing stored result ---")
+                sheet_report, schema_analysis_json, inferred_table = cached
+                sheet_report["incremental"] = {
+                    "reused": True, "fingerprint": fingerprint,
+                    "originally_validated_at": sheet_report.get("validated_at")
+                }
+                sheet_report["file_name"] = base_file_name
+                sheet_report["sheet_name"] = sheet_name
+                return sheet_report, schema_analysis_json, inferred_table
+
+            logging.info(f"--- Loading data for sheet: '{sheet_display_name}' ---")
+            if use_shards:
+                sheet_report, schema_analysis_json, inferred_table = validate_csv_sharded(
+                    file_path, db_url, user_provided_table_name, shard_workers, progress_callback, statistical_profile,
+                    sample_rows, sample_method, escalate_rate
+                )
+            else:
+                pruned_columns = None
+                column_loader = None
+                parse_failures = None
+                positions, sample_info, full_df = None, None, None
+                memory_profile = [] if memory_budget else None
+                with tracing.span("load", sheet=sheet_name, format="excel" if is_excel else columnar_format or "csv") as load_span, \
+                        tools.memory_stage(memory_profile, "load") as stage:
+                    if sample_rows and not is_excel:
+                        positions, sample_info = plan_sample(file_path, columnar_format, sample_rows, sample_method)
+                    if is_excel:
+                        current_df = pd.read_excel(file_path, sheet_name=sheet_name)
+                        if sample_rows:
+                            full_df = tools.drop_blank_rows(current_df)
+                            current_df, sample_info = sampling.sample_frame(full_df, sample_rows, sample_method)
+                    elif columnar_format:
+                        current_df, pruned_columns = load_columnar_data(file_path, db_url, user_provided_table_name, prune_columns, positions)
+                        column_loader = lambda columns: tools.read_columnar_file(file_path, columns=columns, rows=positions)
+                    else:
+                        current_df, parse_failures = load_csv_data(file_path, db_url, user_provided_table_name, fast_csv, positions)
+                    if sample_info is not None and sample_info["rows_sampled"] >= sample_info["rows_total"]:
+                        sample_info = None # The sample would be every row
+                    if memory_budget:
+                        stage["frame_mb"] = tools.frame_memory_mb(current_df)
+                    load_span.set(rows=len(current_df), columns=len(current_df.columns), sampled=sample_info is not None)
+
+                def load_all_rows(late_columns: List[str]):
+                    """Reads every row for a sample that escalated to a full check."""
+                    if is_excel:
+                        return full_df, {}
+                    if columnar_format:
+                        frame, _ = load_columnar_data(file_path, db_url, user_provided_table_name, prune_columns)
+                        return (frame.join(tools.read_columnar_file(file_path, columns=late_columns)) if late_columns else frame), {}
+                    return load_csv_data(file_path, db_url, user_provided_table_name, fast_csv)
+
                 sheet_report, schema_analysis_json, inferred_table = run_validation_for_sheet(
                     df=current_df, file_path=file_path, sheet_name=sheet_name,
-                    db_url=db_url, user_provided_table_name=user_provided_table_name
+                    db_url=db_url, user_provided_table_name=user_provided_table_name,
+                    pruned_columns=pruned_columns, column_loader=column_loader,
+                    parse_failures=parse_failures,
+                    memory_budget=memory_budget, memory_profile=memory_profile,
+                    progress_callback=progress_callback, defer_final_analysis=defer_final_analysis,
+                    sample_info=sample_info, full_loader=load_all_rows, escalate_rate=escalate_rate,
+                    statistical_profile=statistical_profile
                 )
-                report_key = sheet_name if sheet_name is not None else "csv_data"
-                if report_key != "csv_data":
-                    ordered_sheet_report = {}
-
-                    if "file_name" in sheet_report:
-                        ordered_sheet_report["file_name"] = sheet_report.pop("file_name")
-                    if "sheet_name" in sheet_report:
-                        ordered_sheet_report["sheet_name"] = sheet_report.pop("sheet_name")
-                    ordered_sheet_report["schema_mismatch"] = schema_analysis_json
-                    ordered_sheet_report.update(sheet_report)                    
-                    all_sheet_reports[report_key] = ordered_sheet_report
-                else:
-                    all_sheet_reports[report_key] = sheet_report
-                if not first_schema_mismatch: first_schema_mismatch = schema_analysis_json
-                if not inferred_target_table and inferred_table: inferred_target_table = inferred_table
-                
+            store_sheet_result(sheet_name, sheet_report, schema_analysis_json, inferred_table)
+            return sheet_report, schema_analysis_json, inferred_table
+
+        # --- Per-sheet checkpoints: done sheets are skipped on resume, failed ones retried (bounded) ---
+        keep_run_dir = run_dir is not None
+        if run_dir is None:
+            run_dir = run_checkpoints.default_run_dir(file_path, user_provided_table_name)
+        resumed = run_checkpoints.open_run(run_dir, file_path, user_provided_table_name, sheet_names, resume)
+        max_sheet_attempts = max(1, max_sheet_attempts)
+        sheet_records = []
+        report_progress(progress_callback, "run_started", file_name=base_file_name, sheets=sheet_names, resumed=resumed)
+
+        def finish_sheet(index: int, record: Dict[str, Any], source: str):
+            sheet_records.append(record)
+            report_progress(
+                progress_callback, "sheet_finished", sheet=record["sheet_name"], index=index, total=len(sheet_names),
+                status=record["sheet_report"].get("validation_summary", {}).get("status"), source=source
+            )
+
+        for index, sheet_name in enumerate(sheet_names):
+            sheet_display_name = sheet_name if sheet_name is not None else "CSV Data"
+            record = run_checkpoints.load_checkpoint(run_dir, index, sheet_name) if resumed else None
+            if record and record["status"] == "done":
+                logging.info(f"--- Sheet '{sheet_display_name}' already validated; using its checkpoint ---")
+                finish_sheet(index, record, "checkpoint")
+                continue
+
+            attempts = record["attempts"] if record else 0
+            if attempts >= max_sheet_attempts:
+                logging.warning(f"Sheet '{sheet_display_name}' failed {attempts} times; not retrying.")
+                finish_sheet(index, record, "checkpoint")
+                continue
+            if attempts:
+                logging.info(f"Retrying sheet '{sheet_display_name}' (attempt {attempts + 1}/{max_sheet_attempts}).")
+
+            overdue = deadlines.expired()
+            if overdue is not None:
+                logging.warning(f"Skipping sheet '{sheet_display_name}': {overdue}.")
+                sheet_report = {
+                    "file_name": base_file_name, "sheet_name": sheet_name,
+                    "validated_at": datetime.now(timezone.utc).isoformat(),
+                    "validation_summary": {"status": "Skipped", "details": f"Not started before the {overdue}."},
+                    "missing_stages": {"all": str(overdue)},
+                    "error": str(overdue)
+                }
+                record = run_checkpoints.save_checkpoint(run_dir, index, sheet_name, "failed", attempts, sheet_report, {}, None)
+                finish_sheet(index, record, "deadline")
+                continue
+
+            report_progress(progress_callback, "sheet_started", sheet=sheet_name, index=index, total=len(sheet_names))
+            try:
+                with tracing.span("sheet", sheet=sheet_name, index=index, attempt=attempts + 1) as sheet_span, \
+                        ledger.labelled(sheet=sheet_name):
+                    sheet_report, schema_analysis_json, inferred_table = validate_sheet(sheet_name)
+                    sheet_span.set(reused=bool(sheet_report.get("incremental")))
             except Exception as e:
                 logging.error(f"Failed to process sheet '{sheet_display_name}': {e}", exc_info=True)
-                # ... (error handling) ...
+                sheet_report = {
+                    "file_name": base_file_name, "sheet_name": sheet_name,
+                    "validated_at": datetime.now(timezone.utc).isoformat(),
+                    "validation_summary": {"status": "Error", "details": str(e)},
+                    "error": str(e)
+                }
+                schema_analysis_json, inferred_table = {}, None
+            record = run_checkpoints.save_checkpoint(
+                run_dir, index, sheet_name, "failed" if "error" in sheet_report else "done", attempts + 1,
+                sheet_report, schema_analysis_json, inferred_table
+            )
+            finish_sheet(index, record, "cache" if sheet_report.get("incremental") else "validated")
+
+        # --- Batched final analysis of the sheets that deferred it (also those of a resumed run) ---
+        pending_indexes = [i for i, r in enumerate(sheet_records) if PENDING_FINAL_ANALYSIS in r["sheet_report"]]
+        if pending_indexes:
+            pending_sheets = [sheet_records[i]["sheet_name"] for i in pending_indexes]
+            phases.start("final_analysis_batch", sheets=len(pending_indexes))
+            report_progress(progress_callback, "stage", sheet=None, stage="final_analysis_batch", sheets=pending_sheets)
+            run_batched_final_analysis({sheet_records[i]["sheet_name"]: sheet_records[i]["sheet_report"] for i in pending_indexes})
+            for i in pending_indexes:
+                record = sheet_records[i]
+                sheet_report = record["sheet_report"]
+                sheet_records[i] = run_checkpoints.save_checkpoint(
+                    run_dir, i, record["sheet_name"], "failed" if "error" in sheet_report else "done", record["attempts"],
+                    sheet_report, record["schema_analysis"], record["inferred_table"]
+                )
+                store_sheet_result(record["sheet_name"], sheet_report, record["schema_analysis"], record["inferred_table"])
+
+        # --- Final Output Assembly (from the checkpoints) ---
+        phases.start("report_assembly", sheets=len(sheet_records))
+        for record in sheet_records:
+            sheet_name = record["sheet_name"]
+            sheet_report = dict(record["sheet_report"])
+            schema_analysis_json = record["schema_analysis"]
+            report_key = sheet_name if sheet_name is not None else "csv_data"
+            if report_key != "csv_data":
+                ordered_sheet_report = {}
+
+                if "file_name" in sheet_report:
+                    ordered_sheet_report["file_name"] = sheet_report.pop("file_name")
+                if "sheet_name" in sheet_report:
+                    ordered_sheet_report["sheet_name"] = sheet_report.pop("sheet_name")
+                ordered_sheet_report["schema_mismatch"] = schema_analysis_json
+                ordered_sheet_report.update(sheet_report)
+                all_sheet_reports[report_key] = ordered_sheet_report
+            else:
+                all_sheet_reports[report_key] = sheet_report
+            if not first_schema_mismatch: first_schema_mismatch = schema_analysis_json
+            if not inferred_target_table and record["inferred_table"]: inferred_target_table = record["inferred_table"]
+
+        run_summary = {
+            "run_dir": run_dir,
+            "resumed": resumed,
+            "sheets_done": sum(1 for r in sheet_records if r["status"] == "done"),
+            "sheets_failed": [r["sheet_name"] if r["sheet_name"] is not None else "csv_data" for r in sheet_records if r["status"] == "failed"],
+            "sheets_partial": [r["sheet_name"] if r["sheet_name"] is not None else "csv_data" for r in sheet_records
+                               if r["status"] == "done" and "missing_stages" in r["sheet_report"]],
+            "sheets_skipped": [r["sheet_name"] if r["sheet_name"] is not None else "csv_data" for r in sheet_records
+                               if "all" in r["sheet_report"].get("missing_stages", {})],
+            "deadline_s": deadline_s
+        }
+        if not keep_run_dir and run_summary["sheets_done"] == len(sheet_names):
+            run_checkpoints.remove_run(run_dir) # Nothing left to resume
+            run_summary["run_dir"] = None
 
-        # --- Final Output Assembly (Unchanged) ---
-        base_file_name = os.path.basename(file_path)
         if is_excel:
             final_output = {
                 "User_file_name": base_file_name,
                 "Processed_at": datetime.now(timezone.utc).isoformat(),
                 "user_provided_target_table": user_provided_table_name,
                 "inferred_target_table": inferred_target_table,
-                "sheet_validation_results": all_sheet_reports
+                "sheet_validation_results": all_sheet_reports,
+                "run": run_summary
             }
         else:
             csv_report_data = all_sheet_reports.get("csv_data", {})
@@ -473,23 +1602,58 @@ def run_multi_sheet_validation(file_path: str, db_url=DB_URL, user_provided_tabl
                 "schema_mismatch": schema_mismatch_data
             }
             final_output.update(csv_report_data)
+            final_output["run"] = run_summary
+        phases.end()
+
+        if os.path.dirname(output_path):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        trace_scope.close() # Ends the run span and stops the profiler
+        final_output["llm_usage"] = {**ledger.to_dict(), "routing": _router.to_dict()}
+        if trace:
+            final_output["trace"] = tracer.to_dict()
+            try:
+                final_output["trace"]["files"] = tracer.write_files(os.path.splitext(output_path)[0])
+            except OSError as e:
+                logging.warning(f"Could not write trace files next to '{output_path}': {e}")
+        if profiler is not None:
+            final_output["profile"] = profiler.summary()
+            try:
+                final_output["profile"]["files"] = profiler.write_files(os.path.splitext(output_path)[0])
+            except OSError as e:
+                logging.warning(f"Could not write profiles next to '{output_path}': {e}")
         
         logging.info("--- [Step 5: Complete Validation Report] ---")
-        print("="*80)
-        print(" SCHEMA VALIDATOR POC - FINAL REPORT - [CONVERTED VERSION]")
-        print("="*80)
         final_report_str_pretty = json.dumps(final_output, indent=2)
-        print(final_report_str_pretty)
+        if print_report:
+            print("="*80)
+            print(" SCHEMA VALIDATOR POC - FINAL REPORT - [CONVERTED VERSION]")
+            print("="*80)
+            print(final_report_str_pretty)
 
-        with open("validation_report_converted.json", "w") as f:
+        with open(output_path, "w") as f:
             f.write(final_report_str_pretty) 
-        logging.info("Combined report saved to validation_report_converted.json")
+        logging.info(f"Combined report saved to {output_path}")
+        report_progress(progress_callback, "run_completed", report_path=output_path, run=run_summary)
         return final_output
 
     except Exception as e:
+        phases.end(e)
         logging.error(f"A critical error occurred: {e}", exc_info=True)
+        report_progress(progress_callback, "run_failed", error=str(e))
+    finally:
+        trace_scope.close()
 
 # --- 10. Main Entry Point (Unchanged) ---
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        get_client() # Fail fast on missing credentials, before any file is read
+    except Exception as e:
+        logging.critical(f"Failed to initialize AzureOpenAI client: {e}. Check your .env file.")
+        exit(1) # Exit if client fails to initialize
     # This runs our main validation logic, NOT the test joke
-    run_multi_sheet_validation(file_path=FILE_PATH, user_provided_table_name=TABLE_NAME)
+    run_multi_sheet_validation(
+        file_path=FILE_PATH, user_provided_table_name=TABLE_NAME,
+        profile=os.getenv("VALIDATION_PROFILE") or None,
+        profile_stages=[s.strip() for s in os.getenv("VALIDATION_PROFILE_STAGES", "").split(",") if s.strip()] or None
+    )
@@ -0,0 +1,203 @@
+import io
+import json
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager, ExitStack
+from typing import Dict, Any, List, Optional, Sequence
+
+import tracing
+
+# ==============================================================
+# Opt-in profiling of a validation run
+# ==============================================================
+# Usage:
+#   main.run_multi_sheet_validation(..., profile="cprofile")
+#   main.run_multi_sheet_validation(..., profile="sampling", profile_stages=["deep_validation"])
+#   python batch.py ... --profile cprofile --profile-stages deep_validation,final_analysis
+#   VALIDATION_PROFILE=cprofile python main.py
+#
+# Stages are tracing span names (load, schema_extraction, schema_analysis,
+# deep_validation, checks.types, checks.quality, dynamic_rules, final_analysis,
+# llm_call, report_assembly, ...); without stages the whole run is profiled.
+# "sampling" uses pyinstrument when it is installed and falls back to cProfile.
+#
+# Profiles cover the thread that runs the pipeline. Column checks on worker threads
+# show up there as waits; set COLUMN_CHECK_WORKERS=1 to see them per function.
+# Allocation snapshots are taken around the tools.py check stages and reduced to
+# the top allocating lines per stage.
+#
+# Files written next to the report (<prefix> is the report path without .json):
+#   <prefix>.prof / <prefix>.profile.txt      cProfile stats (pstats, snakeviz) and a text summary
+#   <prefix>.pyinstrument.html / .txt         sampling profile
+#   <prefix>.alloc.json                       allocation diffs per check stage
+
+PROFILE_MODES = ("cprofile", "sampling")
+SNAPSHOT_SPANS = ("checks.types", "checks.quality")
+TOP_ALLOCATIONS = 25
+TOP_FUNCTIONS = 40
+
+
+def _load_sampling_profiler():
+    try:
+        from pyinstrument import Profiler
+        return Profiler
+    except ImportError:
+        return None
+
+
+class RunProfiler:
+    """
+    Profiles a run, or only the spans named in `stages`, and captures tracemalloc
+    snapshots around the check stages. Attach it to the run's tracer (attach()
+    is a context manager) and call write_files() after the run.
+    """
+
+    def __init__(self, mode: str = "cprofile", stages: Optional[Sequence[str]] = None, memory_snapshots: bool = True):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}'; expected one of {PROFILE_MODES}.")
+        self.requested_mode = mode
+        self.stages = set(stages) if stages else None
+        self.memory_snapshots = memory_snapshots
+        self.allocations: List[Dict[str, Any]] = []
+        self.sections = 0 # Times profiling was resumed; 0 if none of the stages ran
+        self._tracer = None
+        self._thread_id = None
+        self._depth = 0
+        self._snapshots: Dict[str, tracemalloc.Snapshot] = {}
+        self._tracemalloc_scope = ExitStack()
+
+        sampling_profiler = _load_sampling_profiler() if mode == "sampling" else None
+        if mode == "sampling" and sampling_profiler is None:
+            logging.warning("pyinstrument is not installed; profiling with cProfile instead.")
+        self.mode = "sampling" if sampling_profiler is not None else "cprofile"
+        self._profiler = sampling_profiler() if sampling_profiler is not None else cProfile.Profile()
+
+    # --- Profiler control (only on the thread that owns the run) ---
+    def _start_profiler(self) -> None:
+        if self.mode == "sampling":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def _stop_profiler(self) -> None:
+        if self.mode == "sampling":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def _resume(self) -> None:
+        if self._depth == 0:
+            self._start_profiler()
+            self.sections += 1
+        self._depth += 1
+
+    def _pause(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            self._stop_profiler()
+
+    @contextmanager
+    def _unprofiled(self):
+        """Keeps the snapshot work out of the profile."""
+        running = self._depth > 0
+        if running:
+            self._stop_profiler()
+        try:
+            yield
+        finally:
+            if running:
+                self._start_profiler()
+
+    # --- Tracer listener ---
+    def span_started(self, span) -> None:
+        if span.thread_id != self._thread_id:
+            return
+        if self.stages is not None and span.name in self.stages:
+            self._resume()
+        if self.memory_snapshots and span.name in SNAPSHOT_SPANS and tracemalloc.is_tracing():
+            with self._unprofiled():
+                self._snapshots[span.span_id] = tracemalloc.take_snapshot()
+
+    def span_finished(self, span) -> None:
+        if span.thread_id != self._thread_id:
+            return
+        before = self._snapshots.pop(span.span_id, None)
+        if before is not None and tracemalloc.is_tracing():
+            with self._unprofiled():
+                self._record_allocations(span, before, tracemalloc.take_snapshot())
+        if self.stages is not None and span.name in self.stages:
+            self._pause()
+
+    def _record_allocations(self, span, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot) -> None:
+        sheet = span
+        while sheet is not None and "sheet" not in sheet.attributes:
+            sheet = sheet.parent
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+        diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+        self.allocations.append({
+            "span": span.name,
+            "sheet": sheet.attributes["sheet"] if sheet is not None else None,
+            "rows": span.attributes.get("rows"),
+            "top_allocations": [
+                {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 "size_diff_kb": round(stat.size_diff / 1024, 1), "size_kb": round(stat.size / 1024, 1),
+                 "count_diff": stat.count_diff}
+                for stat in diff[:TOP_ALLOCATIONS]
+            ],
+        })
+
+    # --- Run scope ---
+    def attach(self, tracer) -> "RunProfiler":
+        tracer.listeners.append(self)
+        self._tracer = tracer
+        return self
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        if self.memory_snapshots:
+            self._tracemalloc_scope.enter_context(tracing.tracemalloc_session())
+        if self.stages is None:
+            self._resume()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.stages is None:
+            self._pause()
+        while self._depth > 0: # A stage left open by an error
+            self._pause()
+        self._tracemalloc_scope.close()
+        self._tracer.listeners.remove(self)
+        return False
+
+    def write_files(self, path_prefix: str) -> Dict[str, str]:
+        """Writes the profile (and allocation diffs, if any) next to the report; returns their paths."""
+        paths = {}
+        if not self.sections:
+            logging.warning(f"None of the profiled stages ran ({sorted(self.stages or [])}); no profile written.")
+        elif self.mode == "sampling":
+            paths["html"] = f"{path_prefix}.pyinstrument.html"
+            paths["text"] = f"{path_prefix}.pyinstrument.txt"
+            with open(paths["html"], "w") as f:
+                f.write(self._profiler.output_html())
+            with open(paths["text"], "w") as f:
+                f.write(self._profiler.output_text(unicode=False, color=False))
+        else:
+            paths["pstats"] = f"{path_prefix}.prof"
+            paths["text"] = f"{path_prefix}.profile.txt"
+            self._profiler.dump_stats(paths["pstats"])
+            summary = io.StringIO()
+            pstats.Stats(self._profiler, stream=summary).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            with open(paths["text"], "w") as f:
+                f.write(summary.getvalue())
+        if self.allocations:
+            paths["allocations"] = f"{path_prefix}.alloc.json"
+            with open(paths["allocations"], "w") as f:
+                json.dump(self.allocations, f, indent=2)
+        return paths
+
+    def summary(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "requested_mode": self.requested_mode,
+                "stages": sorted(self.stages) if self.stages else "run", "sections": self.sections}
@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timezone, timedelta
 
 
@@ -8,13 +8,17 @@ from datetime import datetime, timezone, timedelta
 # 1️⃣ SCHEMA ANALYSIS PROMPT
 # ==============================================================
 
+# Layout of every prompt, for provider prompt caching: static instructions and the
+# output format first, then context shared by the sheets of one target table, and
+# the per-sheet data last, so repeated calls share the longest possible prefix.
+
 SCHEMA_ANALYSIS_PROMPT = """
 You are an expert Data Validation Agent. Your task is to analyze a schema mismatch report and provide intelligent, context-aware recommendations.
 
 You will be given:
-1.  **Target Table**: The database table we are validating against ({target_table_name}).
-2.  **Source File**: The file being validated ({source_file_name}).
-3.  **DB Schema**: The target database table schema (columns, types, constraints).
+1.  **Target Table**: The database table we are validating against.
+2.  **DB Schema**: The target database table schema (columns, types, constraints).
+3.  **Source File**: The file being validated.
 4.  **File Schema**: The schema extracted from the user's file (columns, inferred types, sample values).
 5.  **Raw Comparison**: A simple list of columns that are 'missing' or 'extra' based on an exact name match.
 
@@ -25,22 +29,7 @@ Your Job:
 4.  **Format Output**: Return *ONLY* a single JSON object (no extra text or markdown) matching the structure below.
 
 ---
-[INPUT DATA]
-
-**Target Table**: {target_table_name}
-**Source File**: {source_file_name}
-
-**Database Schema (Target):**
-{db_schema_json}
-
-**File Schema (Source):**
-{file_schema_json}
-
-**Raw Comparison (Exact Match):**
-{raw_comparison_json}
-
----
-[YOUR ANALYSIS]
+[OUTPUT FORMAT]
 
 Produce a single JSON object in this *exact* format.
 **CRITICAL:** For 'naming_mismatches', the key MUST be the column from the File Schema and the value MUST be the column from the Database Schema.
@@ -49,8 +38,8 @@ Format: {{"file_column_name": "db_column_name"}}
 Example: {{"cust": "CustomerID", "qty": "Quantity"}}
 
 {{
-  "target_table": "{target_table_name}",
-  "source_file": "{source_file_name}",
+  "target_table": "The Target Table name",
+  "source_file": "The Source File name",
   "columns_missing_from_file": [
     "List_of_DB_columns_TRULY_missing_after_mapping"
   ],
@@ -71,6 +60,30 @@ Example: {{"cust": "CustomerID", "qty": "Quantity"}}
     ]
   }}
 }}
+
+---
+[TARGET TABLE]
+
+**Target Table**: {target_table_name}
+
+**Database Schema (Target):**
+{db_schema_json}
+
+---
+[INPUT DATA]
+
+**Source File**: {source_file_name}
+
+**File Schema (Source):**
+{file_schema_json}
+
+**Raw Comparison (Exact Match):**
+{raw_comparison_json}
+
+---
+[YOUR ANALYSIS]
+
+Return *ONLY* the JSON object described in [OUTPUT FORMAT].
 """
 
 def get_schema_analysis_prompt(
@@ -115,13 +128,7 @@ Your Job:
 3.  Return *ONLY* a single JSON list of rule objects. Do not add any other text, markdown, or explanations.
 
 ---
-[INPUT DATA]
-
-**Current File Schema (Source):**
-{current_file_schema_json}
-
----
-[YOUR ANALYSIS]
+[OUTPUT FORMAT]
 
 Produce a single JSON list in this *exact* format:
 
@@ -133,6 +140,17 @@ Produce a single JSON list in this *exact* format:
     "rule_details": "Explain the inferred rule. E.g., 'Based on X/Y samples, this column appears to follow a regex format: ^[A-Z]{{3}}\\d{{4}}$' OR 'Column appears to be categorical. All samples were from the list: [\"ValueA\", \"ValueB\"]'"
   }}
 ]
+
+---
+[INPUT DATA]
+
+**Current File Schema (Source):**
+{current_file_schema_json}
+
+---
+[YOUR ANALYSIS]
+
+Return *ONLY* the JSON list described in [OUTPUT FORMAT].
 """
 
 def get_dynamic_rules_prompt(
@@ -156,28 +174,8 @@ def get_dynamic_rules_prompt(
 # 3️⃣ FINAL ANALYSIS PROMPT (NEW & CHEAP)
 # ==============================================================
 
-ANALYSIS_PROMPT = """
-You are the Principal Data Steward. You will be given a *summary* of data validation findings and the initial schema analysis.
-Your job is to generate ONLY the high-level analysis, scoring, and planning sections, following your core instructions.
-
-[INPUT DATA]
-
-**1. Schema Analysis (What vs. What):**
-{schema_analysis_json}
-
-**2. Violation Summaries (The Problems):**
-{violations_summary_json}
-
-**3. Historical Schemas (For Drift Analysis):**
-{historical_schemas_json}
-
----
-[YOUR ANALYSIS]
-
-Based *only* on the input data, generate a single JSON object with the following keys.
-Be specific, authoritative, and link your analysis directly to the data.
-
-{{
+# The per-sheet object the final analysis returns (also used by the batched prompt)
+ANALYSIS_OUTPUT_FORMAT = """{{
   "validation_summary": {{
     "status": "[Passed | Passed with Warnings | Failed]",
     "high_severity_issues": <count of high severity issues>,
@@ -200,8 +198,7 @@ Be specific, authoritative, and link your analysis directly to the data.
     "reasoning": "Explain the strategy. **If 'Upsert', state the key. If 'Do Not Load', explain why it's unsafe.**"
   }},
   "schema_drift": {{
-    "detected": <true | false>,
-    "analysis": "Analyze the historical schemas. **If drift is detected, describe the *specific change* (e.g., 'Column 'Email' was added', 'Column 'Price' changed from INT to STRING').**"
+    "analysis": "If input 3 is null, write 'No drift'. Otherwise explain the *business impact* of the listed changes (e.g., 'Column 'Email' was renamed to 'EmailAddress', which will break downstream joins'). Do not invent changes that are not listed."
   }},
   "root_cause_analysis": {{
     "hypothesis": "Provide a *specific, data-driven hypothesis* for the root cause. **Connect the error patterns (e.g., 'null OrderIDs' + 'string-based 'qty'') to a likely real-world source** (e.g., 'This pattern suggests a manual data entry error from a spreadsheet, not an API bug')."
@@ -209,22 +206,151 @@ Be specific, authoritative, and link your analysis directly to the data.
   "overall_analysis": {{
     "narrative_summary": "Write a 2-sentence summary for a non-technical manager. **State the data's *fitness for use* (e.g., 'Data is NOT safe for production') and the **single biggest business risk** (e.g., 'Risk of data corruption in the Orders table')."
   }}
-}}
+}}"""
+
+ANALYSIS_PROMPT = """
+You are the Principal Data Steward. You will be given a *summary* of data validation findings and the initial schema analysis.
+Your job is to generate ONLY the high-level analysis, scoring, and planning sections, following your core instructions.
+
+[OUTPUT FORMAT]
+
+Based *only* on the input data, generate a single JSON object with the following keys.
+Be specific, authoritative, and link your analysis directly to the data.
+
+""" + ANALYSIS_OUTPUT_FORMAT + """
+
+---
+[INPUT DATA]
+
+**1. Schema Analysis (What vs. What):**
+{schema_analysis_json}
+
+**2. Violation Summaries (The Problems):**
+{violations_summary_json}
+
+**3. Schema Drift (computed exactly against the schema history; null if nothing changed):**
+{schema_drift_json}
+
+---
+[YOUR ANALYSIS]
+
+Return *ONLY* the JSON object described in [OUTPUT FORMAT].
 """
 def get_analysis_prompt(
     schema_analysis: Dict[str, Any],
     violations_summary: Dict[str, Any],
-    historical_schemas: List[Dict[str, Any]] # We still need this for drift
+    schema_drift_delta: Optional[Dict[str, Any]] = None
 ) -> str:
-    """Helper function to format the new, cheaper analysis prompt."""
+    """
+    Helper function to format the new, cheaper analysis prompt.
+
+    Drift is detected in Python (schema_drift.py); the LLM only sees the compact
+    delta, or null when there is no drift to explain.
+    """
     try:
         return ANALYSIS_PROMPT.format(
             schema_analysis_json=json.dumps(schema_analysis, indent=2, default=str),
             violations_summary_json=json.dumps(violations_summary, indent=2, default=str),
-            # Note: We pass historical schemas in the prompt, but it's small.
-            # The LLM's job is to analyze it, not just see it.
-            historical_schemas_json=json.dumps(historical_schemas, indent=2, default=str)
+            schema_drift_json=json.dumps(schema_drift_delta, indent=2, default=str)
         )
     except Exception as e:
         logging.error(f"Error formatting ANALYSIS_PROMPT: {e}")
         return "ERROR: Could not format analysis prompt."
+
+# Batched variant: the findings of several sheets in one request, answered with
+# one key per sheet name. Same output format per sheet as ANALYSIS_PROMPT.
+BATCH_ANALYSIS_PROMPT = """
+You are the Principal Data Steward. You will be given a *summary* of data validation findings and the initial schema analysis for each of several sheets of one workbook.
+Your job is to generate ONLY the high-level analysis, scoring, and planning sections, following your core instructions, for every sheet separately.
+
+[OUTPUT FORMAT]
+
+Generate a single JSON object with one key per sheet name, exactly as the names are given in [INPUT DATA].
+The value for each sheet is an object with the following keys, based *only* on that sheet's input data.
+Be specific, authoritative, and link your analysis directly to the data. Do not mix findings between sheets.
+
+{{
+  "<sheet name>": """ + ANALYSIS_OUTPUT_FORMAT.replace("\n", "\n  ") + """
+}}
+
+---
+[INPUT DATA]
+{sheets}
+---
+[YOUR ANALYSIS]
+
+Return *ONLY* the JSON object described in [OUTPUT FORMAT], with a key for each of these sheets: {sheet_names_json}
+"""
+
+BATCH_ANALYSIS_SHEET_INPUT = """
+### Sheet: {sheet_name_json}
+
+**1. Schema Analysis (What vs. What):**
+{schema_analysis_json}
+
+**2. Violation Summaries (The Problems):**
+{violations_summary_json}
+
+**3. Schema Drift (computed exactly against the schema history; null if nothing changed):**
+{schema_drift_json}
+"""
+
+def get_batch_sheet_input(
+    sheet_name: str,
+    schema_analysis: Dict[str, Any],
+    violations_summary: Dict[str, Any],
+    schema_drift_delta: Optional[Dict[str, Any]] = None
+) -> str:
+    """Formats one sheet's section of BATCH_ANALYSIS_PROMPT (also used to size batches)."""
+    return BATCH_ANALYSIS_SHEET_INPUT.format(
+        sheet_name_json=json.dumps(sheet_name),
+        schema_analysis_json=json.dumps(schema_analysis, indent=2, default=str),
+        violations_summary_json=json.dumps(violations_summary, indent=2, default=str),
+        schema_drift_json=json.dumps(schema_drift_delta, indent=2, default=str)
+    )
+
+def get_batch_analysis_prompt(sheets: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Formats the batched analysis prompt. `sheets` maps each sheet name to the
+    arguments of get_analysis_prompt (schema_analysis, violations_summary,
+    schema_drift_delta).
+    """
+    try:
+        return BATCH_ANALYSIS_PROMPT.format(
+            sheets="".join(get_batch_sheet_input(name, **inputs) for name, inputs in sheets.items()),
+            sheet_names_json=json.dumps(list(sheets))
+        )
+    except Exception as e:
+        logging.error(f"Error formatting BATCH_ANALYSIS_PROMPT: {e}")
+        return "ERROR: Could not format batch analysis prompt."
+
+# ==============================================================
+# 4️⃣ REPAIR PROMPT (FAILED FIELDS ONLY)
+# ==============================================================
+
+REPAIR_PROMPT = """
+Some fields of your previous response could not be used:
+{failures}
+
+Return *ONLY* a single JSON object with exactly these keys, in the same format as requested above:
+{expected_json}
+Do not repeat the other fields. Do not add any other text, markdown, or explanations.
+"""
+
+REPAIR_LIST_PROMPT = """
+Your previous response could not be used ({reason}).
+Return *ONLY* the complete JSON list, in the format requested above. Do not add any other text, markdown, or explanations.
+"""
+
+def get_repair_prompt(failures: Dict[str, str], expected_types: Dict[str, str]) -> str:
+    """
+    Formats the follow-up that asks only for the failed fields. `failures` maps
+    each field to what was wrong with it, `expected_types` to its JSON type; a
+    failure under None means the whole (list) response was unusable.
+    """
+    if None in failures:
+        return REPAIR_LIST_PROMPT.format(reason=failures[None])
+    return REPAIR_PROMPT.format(
+        failures="\n".join(f"- '{key}': {reason}" for key, reason in failures.items()),
+        expected_json=json.dumps(expected_types, indent=2)
+    )
@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import logging
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+import pandas as pd
+
+# ==============================================================
+# Per-sheet result store for incremental re-validation
+# ==============================================================
+# A sheet report is stored under (content fingerprint, target schema version,
+# validator version). Re-running a workbook where only one tab changed reuses the
+# stored reports of the unchanged tabs and skips their parsing, checks and LLM calls.
+# Fingerprints are streamed hashes of the raw bytes wherever the format allows.
+
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB", os.path.join("validation_cache", "sheet_results.db"))
+RESULT_CACHE_MAX_AGE_DAYS = int(os.getenv("RESULT_CACHE_MAX_AGE_DAYS", "30"))
+HASH_CHUNK_BYTES = 1 << 20
+
+_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_SHARED_STRING_CELL = re.compile(rb'(<c\b[^>]*\bt="s"[^>]*>\s*<v>)(\d+)(</v>)')
+
+
+def _hash_stream(hasher, f) -> None:
+    for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+        hasher.update(chunk)
+
+
+def _fingerprint_path(file_path: str) -> str:
+    """Streamed hash of a file, or of every data file in a (partitioned) directory."""
+    hasher = hashlib.sha256()
+    if os.path.isdir(file_path):
+        for root, dirs, files in os.walk(file_path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.startswith(('.', '_')):
+                    continue
+                path = os.path.join(root, name)
+                hasher.update(os.path.relpath(path, file_path).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    _hash_stream(hasher, f)
+    else:
+        with open(file_path, 'rb') as f:
+            _hash_stream(hasher, f)
+    return hasher.hexdigest()
+
+
+def _xlsx_sheet_paths(archive: zipfile.ZipFile) -> Dict[str, str]:
+    """Maps sheet names to their worksheet XML part inside an .xlsx archive."""
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{_PKG_REL_NS}Relationship")}
+    paths = {}
+    for sheet in workbook.iter(f"{_MAIN_NS}sheet"):
+        target = targets.get(sheet.get(f"{_REL_NS}id"), "")
+        paths[sheet.get("name")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+    return paths
+
+
+def _xlsx_shared_strings(archive: zipfile.ZipFile) -> List[bytes]:
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as f:
+        for _, element in ET.iterparse(f):
+            if element.tag == f"{_MAIN_NS}si":
+                strings.append("".join(element.itertext()).encode('utf-8'))
+                element.clear()
+    return strings
+
+
+def _fingerprint_xlsx_sheets(file_path: str) -> Dict[str, str]:
+    """
+    Fingerprints every sheet of an .xlsx without building a DataFrame: the sheet XML
+    is hashed with shared-string indices replaced by the strings themselves, so
+    editing another tab (which can renumber the shared string table) does not
+    change this sheet's fingerprint.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        shared_strings = _xlsx_shared_strings(archive)
+        fingerprints = {}
+        for sheet_name, part in _xlsx_sheet_paths(archive).items():
+            xml = archive.read(part)
+            resolved = _SHARED_STRING_CELL.sub(
+                lambda m: m.group(1) + shared_strings[int(m.group(2))] + m.group(3) if int(m.group(2)) < len(shared_strings) else m.group(0),
+                xml
+            )
+            fingerprints[sheet_name] = hashlib.sha256(resolved).hexdigest()
+    return fingerprints
+
+
+def fingerprint_sheets(file_path: str, sheet_names: List[Optional[str]]) -> Dict[Optional[str], str]:
+    """
+    Returns a content fingerprint per sheet (None is the single sheet of a CSV or
+    columnar input). Falls back to hashing the parsed sheet for formats whose raw
+    bytes cannot be split per sheet (.xls).
+    """
+    if file_path.endswith('.xlsx'):
+        try:
+            by_name = _fingerprint_xlsx_sheets(file_path)
+            if all(name in by_name for name in sheet_names):
+                return {name: by_name[name] for name in sheet_names}
+        except Exception as e:
+            logging.warning(f"Could not fingerprint '{file_path}' from its XML parts, hashing parsed sheets instead: {e}")
+    if file_path.endswith(('.xls', '.xlsx')):
+        fingerprints = {}
+        for name in sheet_names:
+            df = pd.read_excel(file_path, sheet_name=name)
+            hasher = hashlib.sha256(json.dumps([str(c) for c in df.columns]).encode('utf-8'))
+            hasher.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+            fingerprints[name] = hasher.hexdigest()
+        return fingerprints
+    content = _fingerprint_path(file_path)
+    return {name: content for name in sheet_names}
+
+
+def schema_version(db_schema: Dict[str, Any], check_constraints: Optional[List[Dict[str, Any]]] = None) -> str:
+    """Hash of the target table's columns and CHECK constraints."""
+    payload = {"columns": db_schema, "check_constraints": sorted(c.get('sqltext', '') for c in (check_constraints or []))}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _connect(db_path: Optional[str] = None) -> sqlite3.Connection:
+    db_path = db_path or RESULT_CACHE_DB
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sheet_results (
+            fingerprint TEXT NOT NULL,
+            schema_version TEXT NOT NULL,
+            validator_version TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            stored_at TEXT NOT NULL,
+            result_json TEXT NOT NULL,
+            PRIMARY KEY (fingerprint, schema_version, validator_version, table_name)
+        )
+        """
+    )
+    conn.commit()
+    return conn
+
+
+def load_result(fingerprint: str, schema_ver: str, validator_version: str, table_name: str,
+                db_path: Optional[str] = None) -> Optional[Tuple[Dict[str, Any], Dict[str, Any], Optional[str]]]:
+    """Returns the stored (sheet_report, schema_analysis_json, inferred_table) or None."""
+    conn = _connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT result_json, stored_at FROM sheet_results WHERE fingerprint = ? AND schema_version = ? AND validator_version = ? AND table_name = ?",
+            (fingerprint, schema_ver, validator_version, table_name)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    stored = json.loads(row[0])
+    return stored["sheet_report"], stored["schema_analysis"], stored["inferred_table"]
+
+
+def store_result(fingerprint: str, schema_ver: str, validator_version: str, table_name: str,
+                 sheet_report: Dict[str, Any], schema_analysis_json: Dict[str, Any], inferred_table: Optional[str],
+                 db_path: Optional[str] = None) -> None:
+    """Stores a successful sheet result and drops entries older than RESULT_CACHE_MAX_AGE_DAYS."""
+    now = datetime.now(timezone.utc)
+    payload = json.dumps({"sheet_report": sheet_report, "schema_analysis": schema_analysis_json, "inferred_table": inferred_table}, default=str)
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sheet_results VALUES (?, ?, ?, ?, ?, ?)",
+                (fingerprint, schema_ver, validator_version, table_name, now.isoformat(), payload)
+            )
+            if RESULT_CACHE_MAX_AGE_DAYS > 0:
+                cutoff = (now - timedelta(days=RESULT_CACHE_MAX_AGE_DAYS)).isoformat()
+                conn.execute("DELETE FROM sheet_results WHERE stored_at < ?", (cutoff,))
+    finally:
+        conn.close()
@@ -0,0 +1,133 @@
+import os
+import re
+import json
+import hashlib
+import shutil
+import logging
+import tempfile
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+# ==============================================================
+# Per-sheet checkpoints for multi-sheet runs
+# ==============================================================
+# Every finished sheet (passed or failed) is written to its own JSON file in the
+# run directory with an atomic rename, so a crash or preemption never leaves a
+# half-written checkpoint. A resumed run skips sheets that are done, retries
+# failed ones up to a bounded number of attempts, and the final report is
+# assembled from the checkpoint files. A run in the default directory removes
+# it once every sheet is done; an explicit run directory is always kept.
+
+VALIDATION_RUNS_DIR = os.getenv("VALIDATION_RUNS_DIR", "validation_runs")
+MANIFEST_FILE = "run.json"
+DEFAULT_MAX_SHEET_ATTEMPTS = 3
+
+
+def default_run_dir(file_path: str, table_name: Optional[str]) -> str:
+    """Stable run directory for a (file, table) pair, so a plain resume finds it again."""
+    key = f"{os.path.abspath(file_path)}|{table_name or ''}"
+    base_name = os.path.basename(os.path.normpath(file_path))
+    return os.path.join(VALIDATION_RUNS_DIR, f"{base_name}-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]}")
+
+
+def write_json_atomic(path: str, data: Any) -> None:
+    """Writes JSON to a temp file in the same directory, fsyncs it and renames it into place."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _source_signature(file_path: str) -> Dict[str, Any]:
+    stat = os.stat(file_path)
+    return {"path": os.path.abspath(file_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _checkpoint_path(run_dir: str, index: int, sheet_name: Optional[str]) -> str:
+    # The index keeps names unique even when two sheet names slug to the same text
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", sheet_name if sheet_name is not None else "csv_data")[:60]
+    return os.path.join(run_dir, f"sheet-{index:04d}-{slug}.json")
+
+
+def open_run(run_dir: str, file_path: str, table_name: Optional[str], sheet_names: List[Optional[str]], resume: bool) -> bool:
+    """
+    Prepares `run_dir` for a run. With `resume`, existing checkpoints are kept if the
+    manifest matches the same source file (size and mtime), table and sheets.
+    Otherwise stale checkpoints are removed. Returns True if the run is resumed.
+    """
+    manifest = {
+        "source": _source_signature(file_path),
+        "table_name": table_name,
+        "sheet_names": sheet_names,
+    }
+    manifest_path = os.path.join(run_dir, MANIFEST_FILE)
+    if resume and os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            previous = json.load(f)
+        if {k: previous.get(k) for k in manifest} == manifest:
+            logging.info(f"Resuming run from checkpoints in '{run_dir}'.")
+            return True
+        logging.warning(f"Source or sheets changed since the run in '{run_dir}' was started; starting over.")
+    elif resume:
+        logging.info(f"No previous run in '{run_dir}'; starting a new one.")
+
+    os.makedirs(run_dir, exist_ok=True)
+    for name in os.listdir(run_dir):
+        if name.startswith("sheet-") and name.endswith(".json"):
+            os.remove(os.path.join(run_dir, name))
+    write_json_atomic(manifest_path, {**manifest, "started_at": datetime.now(timezone.utc).isoformat()})
+    return False
+
+
+def load_checkpoint(run_dir: str, index: int, sheet_name: Optional[str]) -> Optional[Dict[str, Any]]:
+    path = _checkpoint_path(run_dir, index, sheet_name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Ignoring unreadable checkpoint '{path}': {e}")
+        return None
+
+
+def save_checkpoint(
+    run_dir: str,
+    index: int,
+    sheet_name: Optional[str],
+    status: str,
+    attempts: int,
+    sheet_report: Dict[str, Any],
+    schema_analysis_json: Dict[str, Any],
+    inferred_table: Optional[str]
+) -> Dict[str, Any]:
+    """Atomically records a sheet outcome ('done' or 'failed') and returns the record."""
+    record = {
+        "sheet_name": sheet_name,
+        "status": status,
+        "attempts": attempts,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+        "sheet_report": sheet_report,
+        "schema_analysis": schema_analysis_json,
+        "inferred_table": inferred_table,
+    }
+    write_json_atomic(_checkpoint_path(run_dir, index, sheet_name), record)
+    return record
+
+
+def remove_run(run_dir: str) -> None:
+    """Deletes a finished run's checkpoints, and the runs directory if that leaves it empty."""
+    shutil.rmtree(run_dir, ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(os.path.normpath(run_dir)) or ".")
+    except OSError:
+        pass # Other runs' directories, or the working directory itself
@@ -0,0 +1,182 @@
+import os
+import math
+import logging
+from statistics import NormalDist
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# ==============================================================
+# Sampling mode: run the checks on a row sample, with confidence intervals
+# ==============================================================
+# Usage:
+#   positions, info = sampling.sample_positions(total_rows, 100_000, "stratified")
+#   df = ... read only the rows at `positions` (see tools.read_csv_lines)
+#   info.update(sampling.estimate_violation_rates(type_violations + dq_violations, info))
+#   if info["max_sampled_rate"] >= sampling.SAMPLING_ESCALATE_RATE: ... check all rows
+#
+#   sample, info = sampling.sample_frame(df, 100_000)  # for a frame already in memory
+#
+# Methods:
+#   uniform               simple random sample of rows
+#   stratified            proportional sample from SAMPLING_STRATA contiguous row
+#                         blocks, so every part of the file is covered (e.g. one
+#                         bad batch appended at the end)
+#   stratified:<column>   proportional sample per value of a file column
+# Proportional allocation keeps the sample self-weighting, so rates are
+# estimated as for a simple random sample.
+#
+# Each violation with a row count gets a `sampled` estimate: the rate in the
+# sample with its Wilson score interval at SAMPLING_CONFIDENCE, and the count
+# scaled to all rows. Primary key duplicates do not scale with the sample (a
+# duplicate needs both rows sampled), so they get no estimated count.
+
+SAMPLING_METHODS = ("uniform", "stratified")
+SAMPLING_STRATA = int(os.getenv("SAMPLING_STRATA", "10"))
+SAMPLING_CONFIDENCE = float(os.getenv("SAMPLING_CONFIDENCE", "0.95"))
+# Check the full frame instead when any sampled violation rate reaches this
+SAMPLING_ESCALATE_RATE = float(os.getenv("SAMPLING_ESCALATE_RATE", "0.01"))
+SAMPLING_SEED = int(os.getenv("SAMPLING_SEED", "0"))
+
+
+def wilson_interval(count: int, rows: int, confidence: float = SAMPLING_CONFIDENCE) -> Tuple[float, float]:
+    """Wilson score interval for a proportion of `count` in `rows`."""
+    if rows <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = count / rows
+    denominator = 1 + z * z / rows
+    center = (p + z * z / (2 * rows)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / rows + z * z / (4 * rows * rows)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def allocate(counts: Sequence[int], rows: int) -> np.ndarray:
+    """Splits `rows` over strata of the given sizes in proportion to their size (largest remainders first)."""
+    counts = np.asarray(counts, dtype=np.int64)
+    if counts.sum() == 0:
+        return np.zeros(len(counts), dtype=np.int64)
+    quotas = rows * counts / counts.sum()
+    allocation = np.floor(quotas).astype(np.int64)
+    shortfall = rows - int(allocation.sum())
+    if shortfall > 0:
+        allocation[np.argsort(allocation - quotas, kind="stable")[:shortfall]] += 1
+    return np.minimum(allocation, counts)
+
+
+def _stratified_positions(codes: np.ndarray, rows: int, rng: np.random.Generator) -> np.ndarray:
+    """Row positions of a proportional sample of `rows`, one stratum per code."""
+    counts = np.bincount(codes)
+    allocation = allocate(counts, rows)
+    # A random priority per row; each stratum keeps its `allocation` lowest-priority rows
+    order = np.lexsort((rng.random(len(codes)), codes))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sorted_codes = codes[order]
+    rank = np.arange(len(codes)) - starts[sorted_codes]
+    return np.sort(order[rank < allocation[sorted_codes]])
+
+
+def strata_column(method: str, columns: Sequence[str]) -> Optional[str]:
+    """
+    The file column named by a 'stratified:<column>' method (None for the other
+    methods), matched exactly or else ignoring case and surrounding spaces.
+    """
+    base_method, _, name = method.partition(":")
+    if base_method not in SAMPLING_METHODS:
+        raise ValueError(f"Unknown sampling method '{method}'; expected uniform, stratified or stratified:<column>.")
+    if not name:
+        return None
+    if name in columns:
+        return name
+    matches = [c for c in columns if str(c).strip().lower() == name.strip().lower()]
+    if not matches:
+        raise ValueError(f"Sampling strata column '{name}' is not a column of the file.")
+    return matches[0]
+
+
+def sample_positions(
+    total: int,
+    rows: int,
+    method: str = "uniform",
+    seed: Union[int, Sequence[int]] = SAMPLING_SEED,
+    strata: Optional[pd.Series] = None
+) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
+    """
+    Draws the sorted positions of a sample of `rows` out of `total` rows, and
+    describes the sample. 'stratified:<column>' needs that column's values for
+    all rows as `strata`. Returns None positions when `rows` covers every row.
+    """
+    base_method, _, _ = method.partition(":")
+    if base_method not in SAMPLING_METHODS:
+        raise ValueError(f"Unknown sampling method '{method}'; expected uniform, stratified or stratified:<column>.")
+    info = {"method": method, "rows_total": total, "rows_sampled": min(rows, total), "seed": seed}
+    if rows >= total:
+        return None, info
+
+    rng = np.random.default_rng(seed)
+    if base_method == "uniform":
+        positions = np.sort(rng.choice(total, size=rows, replace=False))
+    elif strata is not None:
+        codes, _ = pd.factorize(strata, use_na_sentinel=False)
+        positions = _stratified_positions(np.asarray(codes), rows, rng)
+        info["strata"] = int(np.asarray(codes).max()) + 1
+    else:
+        # Contiguous blocks are already in order, so each is drawn from directly
+        blocks = min(SAMPLING_STRATA, total)
+        bounds = -(-np.arange(blocks + 1) * total // blocks) # Block j holds rows with j == row * blocks // total
+        counts = np.diff(bounds)
+        positions = np.concatenate([
+            start + np.sort(rng.choice(count, size=share, replace=False))
+            for start, count, share in zip(bounds[:-1], counts, allocate(counts, rows))
+        ])
+        info["strata"] = blocks
+    logging.info(f"Sampled {len(positions)} of {total} rows ({method}).")
+    info["rows_sampled"] = len(positions)
+    return positions, info
+
+
+def sample_frame(
+    df: pd.DataFrame,
+    rows: int,
+    method: str = "uniform",
+    seed: Union[int, Sequence[int]] = SAMPLING_SEED
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Returns a sample of `rows` rows of `df` (original index kept, so reported row
+    indices still point into the file) and a description of the sample. Frames
+    with no more than `rows` rows are returned whole.
+    """
+    column = strata_column(method, list(df.columns))
+    positions, info = sample_positions(len(df), rows, method, seed, df[column] if column is not None else None)
+    return (df if positions is None else df.take(positions)), info
+
+
+def estimate_violation_rates(
+    violations: List[Dict[str, Any]],
+    info: Dict[str, Any],
+    confidence: float = SAMPLING_CONFIDENCE
+) -> Dict[str, Any]:
+    """
+    Adds a `sampled` estimate to each violation with a row count (see the header)
+    and returns the sample-level figures: the highest sampled violation rate and
+    the interval for a check that found nothing in the sample.
+    """
+    rows_sampled, rows_total = info["rows_sampled"], info["rows_total"]
+    max_rate = 0.0
+    for violation in violations:
+        count = violation.get("count", violation.get("total_duplicate_records", violation.get("invalid_count")))
+        if count is None:
+            continue
+        rate = count / rows_sampled if rows_sampled else 0.0
+        low, high = wilson_interval(count, rows_sampled, confidence)
+        estimate = {"rate": round(rate, 6), "rate_ci": [round(low, 6), round(high, 6)]}
+        if violation.get("check") == "primary_key_violation":
+            estimate["estimated_count"] = None
+        else:
+            estimate["estimated_count"] = round(rate * rows_total)
+            estimate["estimated_count_ci"] = [math.floor(low * rows_total), math.ceil(high * rows_total)]
+        violation["sampled"] = estimate
+        max_rate = max(max_rate, rate)
+    _, clean_high = wilson_interval(0, rows_sampled, confidence)
+    return {"confidence": confidence, "max_sampled_rate": round(max_rate, 6), "clean_check_rate_ci": [0.0, round(clean_high, 6)]}
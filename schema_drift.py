@@ -0,0 +1,170 @@
+import difflib
+import logging
+from typing import Dict, Any, List, Optional
+
+import tools
+
+# ==============================================================
+# Deterministic schema drift detection
+# ==============================================================
+# Compares the current file schema with the versions in the schema history store
+# (newest first) and reports exact column-level changes. The LLM only receives
+# the compact delta, and only when there is something to narrate.
+#
+# Types are compared by category (tools._pandas_type_category), so int32 vs int64
+# or object vs Arrow strings is not drift, and an integer column that only turned
+# float because it gained nulls is reported as a null-rate shift, not a type change.
+
+NULL_RATE_SHIFT_THRESHOLD = 0.10 # Absolute change in the share of null values
+DISTINCT_RATIO_SHIFT_THRESHOLD = 0.20 # Absolute change in distinct values / non-null values
+RENAME_NAME_SIMILARITY = 0.80
+RENAME_SAMPLE_OVERLAP = 0.50
+
+
+def _null_rate(details: Dict[str, Any], total_rows: Optional[int]) -> Optional[float]:
+    if not total_rows or details.get('null_count') is None:
+        return None
+    return details['null_count'] / total_rows
+
+
+def _distinct_ratio(details: Dict[str, Any], total_rows: Optional[int]) -> Optional[float]:
+    if not total_rows or details.get('null_count') is None or details.get('unique_count') is None:
+        return None
+    non_null = total_rows - details['null_count']
+    return details['unique_count'] / non_null if non_null > 0 else None
+
+
+def _type_category(details: Dict[str, Any]) -> Optional[str]:
+    inferred = details.get('inferred_type')
+    return tools._pandas_type_category(inferred) if inferred is not None else None
+
+
+def _same_type(before: Dict[str, Any], after: Dict[str, Any]) -> bool:
+    category_before, category_after = _type_category(before), _type_category(after)
+    if category_before == category_after:
+        return True
+    # pandas reads an integer column with missing values as float
+    return (category_before, category_after) == ('int64', 'float64') and before.get('null_count') == 0 and (after.get('null_count') or 0) > 0
+
+
+def _sample_overlap(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    samples_a = {str(v) for v in a.get('sample_values') or []}
+    samples_b = {str(v) for v in b.get('sample_values') or []}
+    if not samples_a or not samples_b:
+        return 0.0
+    return len(samples_a & samples_b) / len(samples_a | samples_b)
+
+
+def _find_renames(removed: List[str], added: List[str], previous: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    Pairs removed and added columns that look like the same column under a new name:
+    same type category and either a similar name or overlapping sample values.
+    Pairs are chosen greedily by score, so the result does not depend on column order.
+    """
+    candidates = []
+    for old in removed:
+        for new in added:
+            if not _same_type(previous[old], current[new]):
+                continue
+            name_score = difflib.SequenceMatcher(None, old.lower(), new.lower()).ratio()
+            sample_score = _sample_overlap(previous[old], current[new])
+            if name_score >= RENAME_NAME_SIMILARITY or sample_score >= RENAME_SAMPLE_OVERLAP:
+                candidates.append((max(name_score, sample_score), old, new))
+
+    renames, used_old, used_new = [], set(), set()
+    for _, old, new in sorted(candidates, key=lambda c: (-c[0], c[1], c[2])):
+        if old in used_old or new in used_new:
+            continue
+        renames.append({"from": old, "to": new})
+        used_old.add(old)
+        used_new.add(new)
+    return renames
+
+
+def diff_schemas(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Column-level diff between two schema snapshots ({"columns": ..., "total_rows": ...}).
+
+    Returns added, removed and renamed columns, type changes, and null-rate and
+    cardinality (distinct ratio) shifts above the module thresholds.
+    """
+    prev_cols = previous.get('columns', {})
+    curr_cols = current.get('columns', {})
+    prev_rows = previous.get('total_rows')
+    curr_rows = current.get('total_rows')
+
+    removed = [c for c in prev_cols if c not in curr_cols]
+    added = [c for c in curr_cols if c not in prev_cols]
+    renamed = _find_renames(removed, added, prev_cols, curr_cols)
+    renamed_from = {r["from"] for r in renamed}
+    renamed_to = {r["to"] for r in renamed}
+
+    # Renamed columns are compared under their new name
+    pairs = [(c, c) for c in curr_cols if c in prev_cols] + [(r["from"], r["to"]) for r in renamed]
+    type_changes, null_rate_shifts, cardinality_shifts = [], [], []
+    for old, new in pairs:
+        before, after = prev_cols[old], curr_cols[new]
+        if not _same_type(before, after):
+            type_changes.append({"column": new, "from": before.get('inferred_type'), "to": after.get('inferred_type')})
+
+        rate_before, rate_after = _null_rate(before, prev_rows), _null_rate(after, curr_rows)
+        if rate_before is not None and rate_after is not None and abs(rate_after - rate_before) >= NULL_RATE_SHIFT_THRESHOLD:
+            null_rate_shifts.append({"column": new, "from": round(rate_before, 4), "to": round(rate_after, 4)})
+
+        ratio_before, ratio_after = _distinct_ratio(before, prev_rows), _distinct_ratio(after, curr_rows)
+        if ratio_before is not None and ratio_after is not None and abs(ratio_after - ratio_before) >= DISTINCT_RATIO_SHIFT_THRESHOLD:
+            cardinality_shifts.append({
+                "column": new,
+                "from_distinct_ratio": round(ratio_before, 4), "to_distinct_ratio": round(ratio_after, 4),
+                "from_unique_count": before.get('unique_count'), "to_unique_count": after.get('unique_count')
+            })
+
+    return {
+        "columns_added": [c for c in added if c not in renamed_to],
+        "columns_removed": [c for c in removed if c not in renamed_from],
+        "columns_renamed": renamed,
+        "type_changes": type_changes,
+        "null_rate_shifts": null_rate_shifts,
+        "cardinality_shifts": cardinality_shifts
+    }
+
+
+def _has_changes(diff: Dict[str, Any]) -> bool:
+    return any(diff.values())
+
+
+def detect_schema_drift(current_schema: Dict[str, Any], historical_schemas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Computes drift of `current_schema` against the history (newest first).
+
+    'changes' is the diff against the most recent version; 'version_history' lists
+    the diff between each consecutive pair of older versions that changed anything.
+    """
+    current = {"columns": current_schema.get("columns", {}), "total_rows": current_schema.get("total_rows")}
+    if not historical_schemas:
+        return {"detected": False, "versions_compared": 0, "changes": {}, "version_history": [],
+                "analysis": "No schema history for this table yet; nothing to compare."}
+
+    changes = diff_schemas(historical_schemas[0], current)
+    version_history = []
+    for age, (newer, older) in enumerate(zip(historical_schemas, historical_schemas[1:]), start=1):
+        diff = diff_schemas(older, newer)
+        if _has_changes(diff):
+            version_history.append({"versions_ago": age, **{k: v for k, v in diff.items() if v}})
+
+    detected = _has_changes(changes)
+    logging.info(f"Schema drift against {len(historical_schemas)} historical versions: {'detected' if detected else 'none'}.")
+    return {
+        "detected": detected,
+        "versions_compared": len(historical_schemas),
+        "changes": {k: v for k, v in changes.items() if v},
+        "version_history": version_history,
+        "analysis": "" if detected else "No schema drift against the latest stored version."
+    }
+
+
+def compact_drift_delta(drift: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The part of a drift result worth sending to the LLM, or None when nothing changed."""
+    if not drift.get("detected"):
+        return None
+    return {"changes_since_last_version": drift["changes"], "earlier_version_changes": drift["version_history"]}
@@ -0,0 +1,224 @@
+import os
+import re
+import glob
+import json
+import sqlite3
+import hashlib
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, List, Optional
+
+# ==============================================================
+# Schema history store (SQLite)
+# ==============================================================
+# Replaces one-JSON-file-per-run in schema_history/. Each table's history is an
+# append-only list of versions indexed by (table_name, recorded_at). A version's
+# structure (column names and types) is stored once, keyed by its content hash;
+# the per-run stats (row, null and unique counts, samples) live on the version
+# row. A run that sees the same structure as the latest version only bumps that
+# version's last_seen_at and replaces its stats, and old versions are pruned by
+# the retention settings below. The legacy JSON files in SCHEMA_HISTORY_DIR are
+# imported once per store.
+
+SCHEMA_HISTORY_DIR = "schema_history"
+SCHEMA_HISTORY_DB = os.getenv("SCHEMA_HISTORY_DB", os.path.join(SCHEMA_HISTORY_DIR, "schema_history.db"))
+SCHEMA_HISTORY_MAX_VERSIONS = int(os.getenv("SCHEMA_HISTORY_MAX_VERSIONS", "100")) # Per table
+SCHEMA_HISTORY_MAX_AGE_DAYS = int(os.getenv("SCHEMA_HISTORY_MAX_AGE_DAYS", "365")) # 0 disables age-based pruning
+
+_CREATE_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS schema_content (
+        content_hash TEXT PRIMARY KEY,
+        schema_json TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS schema_versions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        recorded_at TEXT NOT NULL,
+        last_seen_at TEXT NOT NULL,
+        seen_count INTEGER NOT NULL DEFAULT 1,
+        content_hash TEXT NOT NULL REFERENCES schema_content(content_hash)
+    )
+    """,
+    "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_schema_versions_table_time ON schema_versions (table_name, recorded_at, id)",
+]
+
+
+def _connect(db_path: Optional[str] = None) -> sqlite3.Connection:
+    db_path = db_path or SCHEMA_HISTORY_DB
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL") # Concurrent runs read while another one writes
+    for statement in _CREATE_STATEMENTS:
+        conn.execute(statement)
+    if "stats_json" not in {row[1] for row in conn.execute("PRAGMA table_info(schema_versions)")}:
+        conn.execute("ALTER TABLE schema_versions ADD COLUMN stats_json TEXT") # Stores from before the split
+    conn.commit()
+    if not conn.execute("SELECT 1 FROM store_meta WHERE key = 'legacy_imported'").fetchone():
+        import_legacy_json_history(SCHEMA_HISTORY_DIR, conn)
+    return conn
+
+
+def _now() -> str:
+    # Microsecond ISO timestamps sort correctly as text; the id breaks any remaining ties
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds')
+
+
+def _split_schema(schema: Dict[str, Any]) -> tuple:
+    """(structure, stats) of a snapshot: column names and types, and everything measured by the run."""
+    columns = schema.get("columns", {})
+    structure = {"columns": {name: {"inferred_type": details.get("inferred_type")} for name, details in columns.items()}}
+    stats = {
+        "total_rows": schema.get("total_rows"),
+        "columns": {name: {k: v for k, v in details.items() if k != "inferred_type"} for name, details in columns.items()}
+    }
+    return structure, stats
+
+
+def _join_schema(schema_json: str, stats_json: Optional[str]) -> Dict[str, Any]:
+    schema = json.loads(schema_json)
+    if stats_json is None:
+        return schema # Stored whole, before stats moved to the version row
+    stats = json.loads(stats_json)
+    columns = {name: {**details, **stats["columns"].get(name, {})} for name, details in schema["columns"].items()}
+    return {"columns": columns, "total_rows": stats.get("total_rows")}
+
+
+def schema_content_hash(schema: Dict[str, Any]) -> str:
+    """Stable hash of a snapshot's structure (column names and types; key order does not matter)."""
+    structure, _ = _split_schema(schema)
+    return hashlib.sha256(json.dumps(structure, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _record(conn: sqlite3.Connection, table_name: str, schema: Dict[str, Any], recorded_at: str) -> str:
+    structure, stats = _split_schema(schema)
+    content_hash = schema_content_hash(schema)
+    stats_json = json.dumps(stats, default=str)
+    conn.execute(
+        "INSERT OR IGNORE INTO schema_content (content_hash, schema_json) VALUES (?, ?)",
+        (content_hash, json.dumps(structure, default=str))
+    )
+    latest = conn.execute(
+        "SELECT id, content_hash FROM schema_versions WHERE table_name = ? ORDER BY recorded_at DESC, id DESC LIMIT 1",
+        (table_name,)
+    ).fetchone()
+    if latest and latest[1] == content_hash:
+        conn.execute(
+            "UPDATE schema_versions SET last_seen_at = ?, seen_count = seen_count + 1, stats_json = ? WHERE id = ?",
+            (recorded_at, stats_json, latest[0])
+        )
+    else:
+        conn.execute(
+            "INSERT INTO schema_versions (table_name, recorded_at, last_seen_at, content_hash, stats_json) VALUES (?, ?, ?, ?, ?)",
+            (table_name, recorded_at, recorded_at, content_hash, stats_json)
+        )
+    return content_hash
+
+
+def apply_retention(
+    conn: sqlite3.Connection,
+    table_name: str,
+    max_versions: Optional[int] = None,
+    max_age_days: Optional[int] = None
+) -> int:
+    """
+    Deletes versions beyond the newest `max_versions` for a table and versions not
+    seen for `max_age_days`, always keeping the latest one. Returns the number deleted.
+    Defaults come from SCHEMA_HISTORY_MAX_VERSIONS / SCHEMA_HISTORY_MAX_AGE_DAYS.
+    """
+    max_versions = SCHEMA_HISTORY_MAX_VERSIONS if max_versions is None else max_versions
+    max_age_days = SCHEMA_HISTORY_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    deleted = conn.execute(
+        """
+        DELETE FROM schema_versions WHERE table_name = ? AND id NOT IN (
+            SELECT id FROM schema_versions WHERE table_name = ? ORDER BY recorded_at DESC, id DESC LIMIT ?
+        )
+        """,
+        (table_name, table_name, max(1, max_versions))
+    ).rowcount
+    if max_age_days > 0:
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).isoformat(timespec='microseconds')
+        deleted += conn.execute(
+            """
+            DELETE FROM schema_versions WHERE table_name = ? AND last_seen_at < ? AND id != (
+                SELECT id FROM schema_versions WHERE table_name = ? ORDER BY recorded_at DESC, id DESC LIMIT 1
+            )
+            """,
+            (table_name, cutoff, table_name)
+        ).rowcount
+    if deleted:
+        conn.execute("DELETE FROM schema_content WHERE content_hash NOT IN (SELECT content_hash FROM schema_versions)")
+    return deleted
+
+
+def save_schema(table_name: str, schema: Dict[str, Any], db_path: Optional[str] = None) -> str:
+    """Appends a schema snapshot to a table's history and applies retention. Returns its content hash."""
+    conn = _connect(db_path)
+    try:
+        with conn:
+            content_hash = _record(conn, table_name, schema, _now())
+            pruned = apply_retention(conn, table_name)
+        if pruned:
+            logging.info(f"Pruned {pruned} old schema versions for table '{table_name}'.")
+        return content_hash
+    finally:
+        conn.close()
+
+
+def load_schemas(table_name: str, num_history: int, db_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Returns the latest `num_history` schema versions for a table, newest first, with their latest stats."""
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            """
+            SELECT c.schema_json, v.stats_json FROM schema_versions v JOIN schema_content c ON c.content_hash = v.content_hash
+            WHERE v.table_name = ? ORDER BY v.recorded_at DESC, v.id DESC LIMIT ?
+            """,
+            (table_name, num_history)
+        ).fetchall()
+        return [_join_schema(schema_json, stats_json) for schema_json, stats_json in rows]
+    finally:
+        conn.close()
+
+
+def import_legacy_json_history(directory: str, conn: sqlite3.Connection) -> int:
+    """
+    One-time import of the old '<table>_schema_<YYYYmmddTHHMMSSZ>.json' files from
+    `directory`, oldest first. The files are left in place. Returns the number imported.
+
+    The import and its 'legacy_imported' marker are written in one write
+    transaction, so of several runs opening a new store at once only one imports.
+    A store that already has versions (created before the marker) is not imported into.
+    """
+    pattern = re.compile(r"^(?P<table>.+)_schema_(?P<ts>\d{8}T\d{6})Z\.json$")
+    entries = []
+    for path in glob.glob(os.path.join(directory, "*_schema_*.json")):
+        match = pattern.match(os.path.basename(path))
+        if not match:
+            continue
+        recorded_at = datetime.strptime(match.group("ts"), "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+        entries.append((recorded_at.isoformat(timespec='microseconds'), match.group("table"), path))
+
+    imported = 0
+    conn.execute("BEGIN IMMEDIATE") # Waits for a run that is importing right now
+    try:
+        already = conn.execute("SELECT 1 FROM store_meta WHERE key = 'legacy_imported'").fetchone()
+        if not already and not conn.execute("SELECT 1 FROM schema_versions LIMIT 1").fetchone():
+            for recorded_at, table_name, path in sorted(entries):
+                try:
+                    with open(path, 'r') as f:
+                        _record(conn, table_name, json.load(f), recorded_at)
+                    imported += 1
+                except Exception as e:
+                    logging.warning(f"Skipping legacy schema history file '{path}': {e}")
+        conn.execute("INSERT OR IGNORE INTO store_meta (key, value) VALUES ('legacy_imported', ?)", (_now(),))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if imported:
+        logging.info(f"Imported {imported} legacy schema history files from '{directory}'.")
+    return imported
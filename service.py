@@ -0,0 +1,338 @@
+import os
+import re
+import json
+import uuid
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+import main
+import tools
+import build_md
+from batch import SUPPORTED_EXTENSIONS
+
+# ==============================================================
+# Validation job service (stdlib HTTP)
+# ==============================================================
+# Usage: python service.py --port 8765 --workers 4
+#
+#   POST /jobs?table=customer_orders&filename=orders.csv   (body: raw file bytes)
+#   POST /jobs  {"file_path": "...", "table_name": "..."}  (needs --input-root)
+#   GET  /jobs/<id>               status and latest progress
+#   GET  /jobs/<id>/events        progress as Server-Sent Events
+#   GET  /jobs/<id>/report        JSON report
+#   GET  /jobs/<id>/report.md     Markdown report
+#   GET  /health
+#
+# Submissions accept incremental, prune_columns, trace, batch_final_analysis and
+# statistical_profile flags (query or JSON: true/false, 1/0, yes/no; anything
+# else is a 400); trace adds per-stage spans to the
+# report (see tracing.py), batch_final_analysis requests the final analysis of a
+# workbook's sheets together, statistical_profile=1 adds the statistical profile
+# (see data_profile.py).
+#
+# Jobs run on a thread pool inside this process, so the LLM client, the database
+# engines and the schema catalog (see tools.get_engine / get_cached_db_schema)
+# stay warm across jobs. Job state is kept in memory; inputs, checkpoints and
+# reports are written under JOBS_DIR/<job id>/. tracemalloc is shared by the
+# jobs (see tracing.tracemalloc_session), so peak memory figures measured while
+# another job was tracing are marked 'shared_peak'.
+
+JOBS_DIR = os.getenv("SERVICE_JOBS_DIR", "service_jobs")
+MAX_UPLOAD_MB = int(os.getenv("SERVICE_MAX_UPLOAD_MB", "512"))
+JOB_FLAGS = ("incremental", "prune_columns", "trace", "batch_final_analysis", "statistical_profile")
+MAX_JOBS_KEPT = 500 # Finished jobs beyond this are forgotten (their files stay on disk)
+SSE_KEEPALIVE_SECONDS = 15
+_TRUE_VALUES = ("1", "true", "yes", "on")
+_FALSE_VALUES = ("0", "false", "no", "off", "")
+
+
+def parse_flag(name: str, value: Any) -> bool:
+    """A job flag from a query string or JSON body; raises ValueError for anything but a clear boolean."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in _TRUE_VALUES + _FALSE_VALUES:
+        return value.strip().lower() in _TRUE_VALUES
+    raise ValueError(f"'{name}' must be a boolean (true/false, 1/0, yes/no), got {value!r}.")
+
+
+class Job:
+    def __init__(self, job_id: str, file_path: str, table_name: str, options: Dict[str, Any]):
+        self.job_id = job_id
+        self.file_path = file_path
+        self.table_name = table_name
+        self.options = options
+        self.job_dir = os.path.join(JOBS_DIR, job_id)
+        self.report_path = os.path.join(self.job_dir, "report.json")
+        self.state = "queued"
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self.changed = threading.Condition()
+
+    def add_event(self, event: Dict[str, Any]) -> None:
+        with self.changed:
+            self.events.append(event)
+            self.changed.notify_all()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed")
+
+    def status(self) -> Dict[str, Any]:
+        with self.changed:
+            events = list(self.events)
+        sheets_finished = [e for e in events if e["event"] == "sheet_finished"]
+        started = next((e for e in events if e["event"] == "run_started"), None)
+        latest_stage = next((e for e in reversed(events) if e["event"] == "stage"), None)
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "file_name": os.path.basename(os.path.normpath(self.file_path)),
+            "table_name": self.table_name,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "sheets_total": len(started["sheets"]) if started else None,
+            "sheets_finished": len(sheets_finished),
+            "current_stage": None if self.finished or not latest_stage else {"sheet": latest_stage["sheet"], "stage": latest_stage["stage"]},
+            "error": self.error,
+            "links": {
+                "events": f"/jobs/{self.job_id}/events",
+                "report": f"/jobs/{self.job_id}/report",
+                "report_md": f"/jobs/{self.job_id}/report.md",
+            },
+        }
+
+
+class JobManager:
+    """Queues jobs on a warm worker pool and tracks their state and progress events."""
+
+    def __init__(self, db_url: str, workers: int, input_root: Optional[str] = None):
+        self.db_url = db_url
+        self.input_root = os.path.realpath(input_root) if input_root else None
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="validation-job")
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def warm_up(self, table_names: List[str]) -> None:
+        """Opens the engine and loads the given tables into the schema catalog ahead of the first job."""
+        tools.get_engine(self.db_url)
+        for table_name in table_names:
+            if tools.get_cached_db_schema(self.db_url, table_name) is None:
+                logging.warning(f"Warm-up: table '{table_name}' does not exist.")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def resolve_local_path(self, file_path: str) -> str:
+        if not self.input_root:
+            raise ValueError("Server-side file paths are disabled; upload the file instead (see --input-root).")
+        resolved = os.path.realpath(os.path.join(self.input_root, file_path))
+        if os.path.commonpath([resolved, self.input_root]) != self.input_root or not os.path.exists(resolved):
+            raise ValueError(f"File '{file_path}' was not found under the input root.")
+        return resolved
+
+    def submit(self, table_name: str, options: Dict[str, Any], upload: Optional[bytes] = None,
+               filename: Optional[str] = None, file_path: Optional[str] = None) -> Job:
+        if not table_name:
+            raise ValueError("A target table is required ('table' query parameter or 'table_name').")
+        job_id = uuid.uuid4().hex
+        if upload is not None:
+            filename = re.sub(r"[^A-Za-z0-9_.-]+", "_", os.path.basename(filename or ""))
+            if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                raise ValueError(f"Unsupported file type '{filename}'; expected one of {', '.join(SUPPORTED_EXTENSIONS)}.")
+            input_dir = os.path.join(JOBS_DIR, job_id, "input")
+            os.makedirs(input_dir, exist_ok=True)
+            file_path = os.path.join(input_dir, filename)
+            with open(file_path, "wb") as f:
+                f.write(upload)
+        else:
+            file_path = self.resolve_local_path(file_path or "")
+
+        job = Job(job_id, file_path, table_name, options)
+        with self.lock:
+            self.jobs[job_id] = job
+            finished = [jid for jid, j in self.jobs.items() if j.finished]
+            for jid in finished[:max(0, len(self.jobs) - MAX_JOBS_KEPT)]:
+                del self.jobs[jid]
+        self.pool.submit(self._run, job)
+        logging.info(f"Queued job {job_id} for '{file_path}' against '{table_name}'.")
+        return job
+
+    def _run(self, job: Job) -> None:
+        job.state = "running"
+        job.started_at = datetime.now(timezone.utc).isoformat()
+        job.add_event({"event": "job_started", "at": job.started_at})
+        try:
+            report = main.run_multi_sheet_validation(
+                file_path=job.file_path,
+                db_url=self.db_url,
+                user_provided_table_name=job.table_name,
+                prune_columns=job.options.get("prune_columns", True),
+                incremental=job.options.get("incremental", False),
+                trace=job.options.get("trace", False),
+                batch_final_analysis=job.options.get("batch_final_analysis", False),
+                statistical_profile=job.options.get("statistical_profile", main.STATISTICAL_PROFILE),
+                run_dir=os.path.join(job.job_dir, "checkpoints"),
+                output_path=job.report_path,
+                print_report=False,
+                progress_callback=job.add_event
+            )
+            if report is None:
+                raise RuntimeError("Validation aborted; see the service log.")
+            job.state = "done"
+        except Exception as e:
+            logging.error(f"Job {job.job_id} failed: {e}", exc_info=True)
+            job.error = str(e)
+            job.state = "failed"
+        job.finished_at = datetime.now(timezone.utc).isoformat()
+        job.add_event({"event": "job_finished", "at": job.finished_at, "state": job.state, "error": job.error})
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ValidationRequestHandler(BaseHTTPRequestHandler):
+    manager: JobManager = None # Set by serve()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status: HTTPStatus, payload: Any) -> None:
+        body = json.dumps(payload, indent=2, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status: HTTPStatus, text: str, content_type: str) -> None:
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: HTTPStatus, message: str) -> None:
+        self._send_json(status, {"error": message})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self._error(HTTPStatus.NOT_FOUND, "Unknown endpoint.")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_UPLOAD_MB * 1024 * 1024:
+            self.close_connection = True
+            return self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Uploads are limited to {MAX_UPLOAD_MB} MB.")
+        body = self.rfile.read(length)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                request = json.loads(body or b"{}")
+                options = {k: parse_flag(k, request[k]) for k in JOB_FLAGS if k in request}
+                job = self.manager.submit(request.get("table_name"), options, file_path=request.get("file_path"))
+            else:
+                if not body:
+                    raise ValueError("Empty upload.")
+                options = {k: parse_flag(k, query[k]) for k in JOB_FLAGS if k in query}
+                job = self.manager.submit(query.get("table"), options, upload=body, filename=query.get("filename"))
+        except (ValueError, json.JSONDecodeError) as e:
+            return self._error(HTTPStatus.BAD_REQUEST, str(e))
+        self._send_json(HTTPStatus.ACCEPTED, job.status())
+
+    def do_GET(self):
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        if parts == ["health"]:
+            return self._send_json(HTTPStatus.OK, {"status": "ok"})
+        if len(parts) < 2 or parts[0] != "jobs":
+            return self._error(HTTPStatus.NOT_FOUND, "Unknown endpoint.")
+        job = self.manager.get(parts[1])
+        if job is None:
+            return self._error(HTTPStatus.NOT_FOUND, f"No job '{parts[1]}'.")
+        if len(parts) == 2:
+            return self._send_json(HTTPStatus.OK, job.status())
+        if parts[2:] == ["events"]:
+            return self._stream_events(job)
+        if parts[2:] in (["report"], ["report.md"]):
+            if not job.finished:
+                return self._error(HTTPStatus.CONFLICT, f"Job is {job.state}; the report is not ready.")
+            if not os.path.exists(job.report_path):
+                return self._error(HTTPStatus.NOT_FOUND, job.error or "The job produced no report.")
+            with open(job.report_path, "r") as f:
+                report_text = f.read()
+            if parts[2] == "report":
+                return self._send_text(HTTPStatus.OK, report_text, "application/json")
+            return self._send_text(HTTPStatus.OK, build_md.create_validation_markdown(json.loads(report_text)), "text/markdown; charset=utf-8")
+        return self._error(HTTPStatus.NOT_FOUND, "Unknown endpoint.")
+
+    def _stream_events(self, job: Job) -> None:
+        """Replays the job's events, then streams new ones until the job finishes."""
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        sent = 0
+        try:
+            while True:
+                with job.changed:
+                    if sent == len(job.events):
+                        job.changed.wait(timeout=SSE_KEEPALIVE_SECONDS)
+                    pending = job.events[sent:]
+                if pending:
+                    for event in pending:
+                        self.wfile.write(f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n".encode("utf-8"))
+                    sent += len(pending)
+                else:
+                    self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+                if any(event["event"] == "job_finished" for event in pending):
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            logging.info(f"Event stream client for job {job.job_id} disconnected.")
+
+
+def serve(host: str, port: int, db_url: str, workers: int, input_root: Optional[str] = None,
+          warm_tables: Optional[List[str]] = None) -> None:
+    manager = JobManager(db_url, workers, input_root)
+    manager.warm_up(warm_tables or [])
+    ValidationRequestHandler.manager = manager
+    server = ThreadingHTTPServer((host, port), ValidationRequestHandler)
+    server.daemon_threads = True
+    logging.info(f"Validation service listening on http://{host}:{server.server_address[1]} with {workers} workers.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down the validation service.")
+    finally:
+        server.server_close()
+        manager.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the validation job service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db-url", default=main.DB_URL)
+    parser.add_argument("--workers", type=int, default=4, help="Jobs validated concurrently.")
+    parser.add_argument("--input-root", help="Allow JSON submissions of file paths under this directory.")
+    parser.add_argument("--warm-table", action="append", default=[], help="Load this table's schema at startup (repeatable).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    serve(args.host, args.port, args.db_url, max(1, args.workers), args.input_root, args.warm_table)
@@ -5,9 +5,6 @@ import os
 DB_DIR = "database"
 DB_PATH = os.path.join(DB_DIR, "sample_data.db")
 
-# Ensure the database directory exists
-os.makedirs(DB_DIR, exist_ok=True)
-
 # SQL statements for creating tables
 create_customer_orders_table = """
 CREATE TABLE IF NOT EXISTS customer_orders (
@@ -47,43 +44,58 @@ VALUES
     ('PROD003', 'Coffee Mug', 'Homeware', 15.00, 300);
 """
 
-try:
-    # Connect to the SQLite database (it will be created if it doesn't exist)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+# Table DDL by name, also used by the benchmark data generator (benchmarks/synthetic_data.py)
+TABLE_DDL = {
+    "customer_orders": create_customer_orders_table,
+    "products": create_products_table,
+}
+
+
+def setup_database():
+    # Ensure the database directory exists
+    os.makedirs(DB_DIR, exist_ok=True)
+    conn = None
+    try:
+        # Connect to the SQLite database (it will be created if it doesn't exist)
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
     
-    print("Database connection established.")
+        print("Database connection established.")
 
-    # Create tables
-    cursor.execute(create_customer_orders_table)
-    print("Table 'customer_orders' created successfully.")
+        # Create tables
+        cursor.execute(create_customer_orders_table)
+        print("Table 'customer_orders' created successfully.")
     
-    cursor.execute(create_products_table)
-    print("Table 'products' created successfully.")
-
-    # Insert sample data (checking if empty first to avoid duplicates on re-run)
-    cursor.execute("SELECT COUNT(*) FROM customer_orders")
-    if cursor.fetchone()[0] == 0:
-        cursor.execute(insert_orders_data)
-        print("Sample data inserted into 'customer_orders'.")
-    else:
-        print("'customer_orders' already contains data.")
-
-    cursor.execute("SELECT COUNT(*) FROM products")
-    if cursor.fetchone()[0] == 0:
-        cursor.execute(insert_products_data)
-        print("Sample data inserted into 'products'.")
-    else:
-        print("'products' already contains data.")
-
-    # Commit changes and close the connection
-    conn.commit()
-    print("Changes committed.")
-
-except sqlite3.Error as e:
-    print(f"An error occurred: {e}")
-
-finally:
-    if conn:
-        conn.close()
-        print("Database connection closed.")
\ No newline at end of file
+        cursor.execute(create_products_table)
+        print("Table 'products' created successfully.")
+
+        # Insert sample data (checking if empty first to avoid duplicates on re-run)
+        cursor.execute("SELECT COUNT(*) FROM customer_orders")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(insert_orders_data)
+            print("Sample data inserted into 'customer_orders'.")
+        else:
+            print("'customer_orders' already contains data.")
+
+        cursor.execute("SELECT COUNT(*) FROM products")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(insert_products_data)
+            print("Sample data inserted into 'products'.")
+        else:
+            print("'products' already contains data.")
+
+        # Commit changes and close the connection
+        conn.commit()
+        print("Changes committed.")
+
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+
+    finally:
+        if conn:
+            conn.close()
+            print("Database connection closed.")
+
+
+if __name__ == "__main__":
+    setup_database()
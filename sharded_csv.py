@@ -0,0 +1,382 @@
+import io
+import os
+import pickle
+import shutil
+import logging
+import tempfile
+from concurrent.futures import Executor
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import inspect
+
+import tools
+import sampling
+import data_profile
+
+# ==============================================================
+# Byte-range sharded validation of a single large CSV
+# ==============================================================
+# The file body is split into byte ranges aligned to line boundaries. Each range
+# is parsed and checked in a worker process, and the per-shard results are merged
+# so the report matches a single-process run:
+#   - pass 1 profiles the file (dtypes, samples, null counts) for the LLM mapping,
+#     and optionally sketches each column for the statistical profile (see data_profile.py)
+#   - pass 2 re-parses each shard with the mapping and runs type / NULL / CHECK checks;
+#     in sampling mode each shard parses and checks only its share of the sample
+#     (proportional to its rows, so the shards are the strata)
+#   - primary keys are hashed into partitions on disk and each partition is
+#     checked for duplicates across all shards
+# Ranges are cut at newlines, so quoted fields must not contain line breaks.
+
+SHARD_TARGET_BYTES = 128 * 2**20 # Keeps each worker's shard small regardless of file size
+PK_PARTITIONS_PER_WORKER = 2
+
+_worker_engines: Dict[str, sqlalchemy.engine.Engine] = {}
+
+
+def _get_worker_engine(db_url: str) -> sqlalchemy.engine.Engine:
+    if db_url not in _worker_engines:
+        _worker_engines[db_url] = sqlalchemy.create_engine(db_url)
+    return _worker_engines[db_url]
+
+
+def plan_byte_ranges(file_path: str, num_shards: int) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """
+    Splits a CSV body into about `num_shards` byte ranges that start and end on line boundaries.
+
+    Returns the header line and the list of (start, end) offsets.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        body_start = f.tell()
+        step = max(1, (file_size - body_start) // max(1, num_shards))
+
+        boundaries = [body_start]
+        position = body_start
+        while position + step < file_size:
+            f.seek(position + step)
+            f.readline() # Move to the start of the next line
+            position = f.tell()
+            if position >= file_size:
+                break
+            boundaries.append(position)
+        boundaries.append(file_size)
+
+    ranges = [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+    return header, ranges
+
+
+def _read_shard(file_path: str, header: bytes, start: int, end: int, db_schema, naming_map,
+                rows: Optional[np.ndarray] = None) -> (pd.DataFrame, Dict[str, Any]):
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        body = f.read(end - start)
+    source = io.BytesIO(header + body)
+    if rows is not None:
+        source = tools.read_csv_lines(source, rows) # Only the sampled lines are parsed
+    # Workers run in parallel already, so each parse stays single-threaded
+    df, parse_failures = tools.read_csv_with_schema(source, db_schema, naming_map=naming_map, use_threads=False)
+    if rows is not None:
+        df.index = pd.Index(rows)
+    return df, parse_failures
+
+
+def _profile_shard(file_path: str, header: bytes, start: int, end: int, db_schema, statistical_profile: bool = False):
+    df, _ = _read_shard(file_path, header, start, end, db_schema, None)
+    raw_rows = len(df)
+    profile = tools.extract_schema_from_df(df, file_path, None)
+    if "error" in profile:
+        raise ValueError(f"Schema extraction failed for byte range {start}-{end}: {profile['error']}")
+    return profile, data_profile.sketch_frame(df) if statistical_profile else None, raw_rows
+
+
+def _merge_dtypes(dtypes: List[str]) -> str:
+    """Returns the dtype a single read of all shards would have produced."""
+    unique = list(dict.fromkeys(dtypes))
+    if len(unique) == 1:
+        return unique[0]
+    categories = {tools._pandas_type_category(d) for d in unique}
+    if categories <= {'int64', 'float64'}:
+        if 'float64' in categories:
+            return 'float64'
+        return 'Int64' if 'Int64' in unique else 'int64'
+    for d in unique:
+        if tools._pandas_type_category(d) == 'object':
+            return d
+    return 'object'
+
+
+def _merge_samples(sample_lists: List[List[Any]], limit: int = 5) -> List[Any]:
+    merged = []
+    for samples in sample_lists:
+        for value in samples:
+            if value not in merged:
+                merged.append(value)
+            if len(merged) >= limit:
+                return merged
+    return merged
+
+
+def merge_schema_profiles(profiles: List[Dict[str, Any]], file_name: str) -> Dict[str, Any]:
+    """Merges per-shard extract_schema_from_df results into one file schema."""
+    column_names: List[str] = []
+    for profile in profiles:
+        for col in profile.get("columns", {}):
+            if col not in column_names:
+                column_names.append(col)
+
+    total_rows = sum(p.get("total_rows", 0) for p in profiles)
+    columns = {}
+    for col in column_names:
+        parts = [(p["columns"][col], p.get("total_rows", 0)) for p in profiles if col in p.get("columns", {})]
+        # A shard where the column is entirely null says nothing about its type
+        typed = [details["inferred_type"] for details, rows in parts if details["null_count"] < rows] or \
+                [details["inferred_type"] for details, _ in parts]
+        columns[col] = {
+            'inferred_type': _merge_dtypes(typed),
+            'sample_values': _merge_samples([details["sample_values"] for details, _ in parts]),
+            'null_count': sum(details["null_count"] for details, _ in parts),
+            'unique_count': None # Distinct counts do not add up across shards
+        }
+
+    return {
+        "file_name": file_name,
+        "sheet_name": None,
+        "total_rows": total_rows,
+        "total_columns": len(columns),
+        "columns": columns
+    }
+
+
+def profile_csv(pool: Executor, file_path: str, ranges: List[Tuple[int, int]], header: bytes, db_schema=None,
+                statistical_profile: bool = False) -> (Dict[str, Any], Optional[Dict[str, Dict[str, Any]]], List[int]):
+    """
+    Pass 1: schema profile of the whole file, built from per-shard profiles, with
+    `statistical_profile` the merged column sketches of all shards (else None),
+    and the number of data rows in each shard (blank rows included).
+    """
+    futures = [pool.submit(_profile_shard, file_path, header, start, end, db_schema, statistical_profile) for start, end in ranges]
+    results = [f.result() for f in futures]
+    logging.info(f"Profiled {len(results)} shards of '{file_path}'.")
+    sketches = data_profile.merge_sketches([sketch for _, sketch, _ in results]) if statistical_profile else None
+    return merge_schema_profiles([profile for profile, _, _ in results], file_path), sketches, [rows for _, _, rows in results]
+
+
+def _pk_spill_path(spill_dir: str, pk_index: int, partition: int, shard_index: int) -> str:
+    return os.path.join(spill_dir, f"pk{pk_index}_p{partition}_s{shard_index}.pkl")
+
+
+def _check_shard(
+    file_path: str,
+    header: bytes,
+    start: int,
+    end: int,
+    shard_index: int,
+    db_url: str,
+    table_name: str,
+    db_schema: Dict[str, Any],
+    naming_map: Dict[str, str],
+    spill_dir: str,
+    num_partitions: int,
+    sample: Optional[Tuple[int, int]] = None
+) -> Dict[str, Any]:
+    rows = None
+    if sample is not None: # (rows in the shard, rows to sample)
+        rows, _ = sampling.sample_positions(sample[0], sample[1], "uniform", seed=(sampling.SAMPLING_SEED, shard_index))
+    df, parse_failures = _read_shard(file_path, header, start, end, db_schema, naming_map, rows)
+    raw_rows = len(df) if rows is None else sample[0]
+    tools.drop_blank_rows(df) # The same rows the single-process checks see
+    df.rename(columns=naming_map, inplace=True)
+    mapped_failures = {naming_map.get(c, c): v for c, v in parse_failures.items()}
+
+    engine = _get_worker_engine(db_url)
+    # Serial column checks: the shards already use every worker process, a thread pool per shard would oversubscribe
+    type_violations = tools.validate_data_types(df, db_schema, parse_failures=mapped_failures, max_workers=1)
+    dq_violations = tools.run_data_quality_checks(df, db_schema, engine, table_name, enabled_checks=['not_null', 'check_constraint'],
+                                                  max_workers=1)
+
+    duplicated = set(df.columns[df.columns.duplicated()])
+    present = [c for c in db_schema if c in df.columns and c not in duplicated]
+    dtypes = {c: str(df[c].dtype) for c in present}
+    all_null = {c: bool(df[c].isna().all()) for c in present}
+
+    # CHECK constraints only apply when the whole column is numeric, which is a file-wide condition
+    try:
+        check_sql = [c.get('sqltext', '') for c in inspect(engine).get_check_constraints(table_name)]
+    except Exception:
+        check_sql = []
+    check_eligible = {
+        c: bool(pd.to_numeric(df[c], errors='coerce').notna().all())
+        for c in present if any(c in sql for sql in check_sql)
+    }
+
+    # Hash primary keys into partitions so duplicates can be found across shards
+    pk_columns = [c for c in present if db_schema[c]['primary_key']]
+    for pk_index, col in enumerate(pk_columns):
+        keys = df[col].dropna().astype(str)
+        partitions = pd.util.hash_pandas_object(keys, index=False) % num_partitions
+        for partition, part_keys in keys.groupby(partitions.values):
+            with open(_pk_spill_path(spill_dir, pk_index, int(partition), shard_index), 'wb') as f:
+                pickle.dump(part_keys.value_counts(sort=False), f)
+
+    return {
+        "raw_rows": raw_rows,
+        "type_violations": type_violations,
+        "parse_failures": mapped_failures,
+        "dq_violations": dq_violations,
+        "dtypes": dtypes,
+        "all_null": all_null,
+        "check_eligible": check_eligible,
+        "pk_columns": pk_columns
+    }
+
+
+def _check_pk_partition(spill_dir: str, pk_index: int, partition: int, num_shards: int) -> Dict[str, Any]:
+    counts = []
+    for shard_index in range(num_shards):
+        path = _pk_spill_path(spill_dir, pk_index, partition, shard_index)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                counts.append(pickle.load(f))
+    if not counts:
+        return {"distinct": 0, "records": 0, "samples": []}
+    totals = pd.concat(counts).groupby(level=0, sort=False).sum()
+    duplicates = totals[totals > 1]
+    return {
+        "distinct": int(len(duplicates)),
+        "records": int(duplicates.sum()),
+        "samples": [str(v) for v in duplicates.index[:5]]
+    }
+
+
+def _offset_indices(violation: Dict[str, Any], offset: int) -> Dict[str, Any]:
+    if "affected_rows_sample_indices" in violation:
+        violation = {**violation, "affected_rows_sample_indices": [i + offset for i in violation["affected_rows_sample_indices"]]}
+    return violation
+
+
+def validate_csv(
+    pool: Executor,
+    file_path: str,
+    ranges: List[Tuple[int, int]],
+    header: bytes,
+    db_url: str,
+    table_name: str,
+    db_schema: Dict[str, Any],
+    naming_map: Dict[str, str],
+    num_partitions: int,
+    shard_samples: Optional[List[Tuple[int, int]]] = None
+) -> (List[Dict[str, Any]], List[Dict[str, Any]]):
+    """
+    Pass 2: type and data quality checks on every shard, merged into the same
+    violation lists validate_data_types and run_data_quality_checks would return.
+    With `shard_samples` ((rows in the shard, rows to sample) per shard), each
+    shard checks a uniform sample of its rows; reported row indices still point
+    into the file.
+    """
+    spill_dir = tempfile.mkdtemp(prefix="pk_partitions_")
+    try:
+        futures = [
+            pool.submit(_check_shard, file_path, header, start, end, shard_index, db_url, table_name,
+                        db_schema, naming_map, spill_dir, num_partitions,
+                        shard_samples[shard_index] if shard_samples else None)
+            for shard_index, (start, end) in enumerate(ranges)
+        ]
+        results = [f.result() for f in futures]
+
+        pk_columns = results[0]["pk_columns"] if results else []
+        pk_futures = {
+            col: [pool.submit(_check_pk_partition, spill_dir, pk_index, p, len(ranges)) for p in range(num_partitions)]
+            for pk_index, col in enumerate(pk_columns)
+        }
+        pk_results = {col: [f.result() for f in futures] for col, futures in pk_futures.items()}
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    offsets, total = [], 0
+    for result in results:
+        offsets.append(total)
+        total += result["raw_rows"]
+
+    # --- Types: parse failures add up; dtype mismatches are judged on the merged dtype ---
+    merged_failures: Dict[str, Dict[str, Any]] = {}
+    shard_samples: Dict[str, List[List[Any]]] = {}
+    for result in results:
+        for col, failure in result["parse_failures"].items():
+            if col not in merged_failures:
+                merged_failures[col] = {**failure}
+            else:
+                merged = merged_failures[col]
+                merged["invalid_count"] += failure["invalid_count"]
+                merged["sample_invalid_values"] = _merge_samples([merged["sample_invalid_values"], failure["sample_invalid_values"]])
+        for violation in result["type_violations"]:
+            shard_samples.setdefault(violation["column"], []).append(violation.get("sample_invalid_values", []))
+
+    merged_dtypes = {}
+    for col in db_schema:
+        typed = [r["dtypes"][col] for r in results if col in r["dtypes"] and not r["all_null"][col]] or \
+                [r["dtypes"][col] for r in results if col in r["dtypes"]]
+        if typed:
+            merged_dtypes[col] = _merge_dtypes(typed)
+    probe_df = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in merged_dtypes.items()})
+    type_violations = tools.validate_data_types(probe_df, db_schema, parse_failures=merged_failures)
+    for violation in type_violations:
+        if violation["column"] not in merged_failures:
+            violation["sample_invalid_values"] = _merge_samples(shard_samples.get(violation["column"], []))
+
+    # --- NULL and CHECK violations add up across shards ---
+    merged_dq: Dict[Tuple, Dict[str, Any]] = {}
+    for result, offset in zip(results, offsets):
+        for violation in result["dq_violations"]:
+            key = (violation["column"], violation["check"], violation.get("constraint_name"), violation.get("sqltext"))
+            violation = _offset_indices(violation, offset)
+            if key not in merged_dq:
+                merged_dq[key] = violation
+                continue
+            merged = merged_dq[key]
+            merged["count"] += violation["count"]
+            for field in ("affected_rows_sample_indices", "sample_violating_values"):
+                if field in merged:
+                    merged[field] = (merged[field] + violation[field])[:5]
+
+    for (col, check, _, sqltext), violation in merged_dq.items():
+        if check == "not_null_violation":
+            violation["details"] = f"Column is non-nullable but contains {violation['count']} nulls (or empty strings treated as nulls)."
+        elif check == "check_constraint_violation":
+            violation["details"] = f"{violation['count']} values violate CHECK constraint '{sqltext}'."
+
+    ineligible = {col for r in results for col, ok in r["check_eligible"].items() if not ok}
+    merged_dq = {k: v for k, v in merged_dq.items() if not (k[1] == "check_constraint_violation" and k[0] in ineligible)}
+
+    # --- Primary keys: partitions are disjoint, so their duplicate counts add up ---
+    for col, partitions in pk_results.items():
+        distinct = sum(p["distinct"] for p in partitions)
+        if distinct == 0:
+            continue
+        records = sum(p["records"] for p in partitions)
+        merged_dq[(col, "primary_key_violation", None, None)] = {
+            "column": col,
+            "check": "primary_key_violation",
+            "distinct_keys_duplicated": distinct,
+            "total_duplicate_records": records,
+            "sample_duplicate_values": _merge_samples([p["samples"] for p in partitions]),
+            "severity": "high",
+            "details": f"Primary key column contains duplicates for {distinct} unique key(s), affecting {records} records total."
+        }
+
+    # Same order as run_data_quality_checks: by DB column, then NULL, PK, CHECK
+    column_order = {col: i for i, col in enumerate(db_schema)}
+    check_order = {"not_null_violation": 0, "primary_key_violation": 1, "check_constraint_violation": 2}
+    dq_violations = sorted(merged_dq.values(), key=lambda v: (column_order.get(v["column"], len(column_order)), check_order.get(v["check"], 3)))
+
+    logging.info(f"Sharded validation complete: {len(type_violations)} type mismatches, {len(dq_violations)} data quality violations.")
+    return type_violations, dq_violations
+
+
+def shard_count_for(file_path: str, workers: int) -> int:
+    """At least one shard per worker, and more for big files so each shard stays near SHARD_TARGET_BYTES."""
+    return max(workers, -(-os.path.getsize(file_path) // SHARD_TARGET_BYTES))
@@ -0,0 +1,213 @@
+import re
+import json
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+# ==============================================================
+# Incremental JSON parsing of streamed LLM responses
+# ==============================================================
+# The parser is fed chunks as they arrive and tracks brackets and strings
+# character by character. Each top-level member (an object's "key": value or an
+# array's element) is parsed as soon as its closing comma or bracket arrives and
+# handed to `on_member`, so callers can act on early keys while the rest streams.
+#
+# The stream is rejected (StreamFormatError) as soon as it goes structurally
+# off-format: more than MAX_PREFIX_CHARS of text before the opening bracket, the
+# wrong top-level type, or mismatched brackets. A member that is not valid JSON,
+# or whose type does not match the shape, is recorded in `invalid` and parsing
+# goes on, so the remaining members are still usable. Once the top-level value
+# closes, `done` is set; trailing text (e.g. a closing code fence) is ignored.
+#
+# salvage() is the local repair pass: it keeps every member that parsed, closes a
+# value cut off after its last complete member, drops stray commas, and reports
+# the fields that still have to be re-requested.
+#
+# A shape is {"type": dict|list, "keys": {name: type, ...}, "items": type}; keys
+# not listed are accepted as-is, listed keys are required. A leading ```/```json
+# fence line and a short lead-in sentence are tolerated.
+
+MAX_PREFIX_CHARS = 200
+_CLOSERS = {"{": "}", "[": "]"}
+_JSON_TYPES = {dict: "object", list: "array", str: "string", bool: "boolean", int: "integer", float: "number"}
+_MEMBER_KEY = re.compile(r'\s*"((?:[^"\\]|\\.)*)"\s*:')
+
+
+class StreamFormatError(ValueError):
+    """The streamed text is not (or no longer can be) the expected JSON."""
+
+    def __init__(self, message: str, received_chars: int):
+        super().__init__(f"{message} (after {received_chars} characters)")
+        self.received_chars = received_chars
+
+
+def _type_name(expected) -> str:
+    return _JSON_TYPES.get(expected, getattr(expected, "__name__", str(expected)))
+
+
+def json_schema(shape: Dict[str, Any]) -> Dict[str, Any]:
+    """The JSON Schema for a shape (for structured-output requests)."""
+    schema: Dict[str, Any] = {"type": _type_name(shape.get("type", dict))}
+    if "keys" in shape:
+        schema["properties"] = {key: {"type": _type_name(expected)} for key, expected in shape["keys"].items()}
+        schema["required"] = list(shape["keys"])
+    if "items" in shape:
+        schema["items"] = {"type": _type_name(shape["items"])}
+    return schema
+
+
+def subshape(shape: Dict[str, Any], keys: List[str]) -> Dict[str, Any]:
+    """The shape of an object with only `keys` (for re-requesting failed fields)."""
+    expected = shape.get("keys", {})
+    return {"type": dict, "keys": {key: expected[key] for key in keys if key in expected}}
+
+
+class IncrementalJSONParser:
+    def __init__(self, shape: Optional[Dict[str, Any]] = None, on_member: Optional[Callable[[Any, Any], None]] = None):
+        self.shape = shape or {}
+        self.on_member = on_member
+        self.reset()
+
+    def reset(self) -> None:
+        """Starts over (e.g. for a retried request)."""
+        self.done = False
+        self.received_chars = 0
+        self._parts: List[str] = []        # Everything fed so far, joined once in text()
+        self._member: List[str] = []       # Segments of the current top-level member
+        self._stack: List[str] = []
+        self._opener: Optional[str] = None
+        self._in_string = False
+        self._escape = False
+        self._in_fence = False
+        self._prefix_chars = 0
+        self._members: List[tuple] = []
+        self.invalid: Dict[Any, str] = {}  # Members that did not parse or match the shape
+        self.error: Optional[StreamFormatError] = None
+
+    def _fail(self, message: str):
+        self.error = StreamFormatError(message, self.received_chars)
+        raise self.error
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def feed(self, chunk: str) -> None:
+        if not chunk:
+            return
+        self._parts.append(chunk)
+        if self.done:
+            return
+        base = self.received_chars
+        segment_start = 0
+        for i, ch in enumerate(chunk):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            self.received_chars = base + i + 1
+            if self._opener is None:
+                if self._in_fence:
+                    self._in_fence = ch != "\n"
+                elif ch == "`":
+                    self._in_fence = True
+                elif ch in _CLOSERS:
+                    expected = self.shape.get("type")
+                    if expected is not None and (ch == "{") != (expected is dict):
+                        self._fail(f"Expected a JSON {_type_name(expected)}, got '{ch}'")
+                    self._opener = ch
+                    self._stack.append(ch)
+                    segment_start = i + 1
+                elif not ch.isspace():
+                    self._prefix_chars += 1
+                    if self._prefix_chars > MAX_PREFIX_CHARS:
+                        self._fail(f"No JSON value in the first {MAX_PREFIX_CHARS} characters")
+            elif ch == '"':
+                self._in_string = True
+            elif ch in _CLOSERS:
+                self._stack.append(ch)
+            elif ch in "}]":
+                if _CLOSERS[self._stack[-1]] != ch:
+                    self._fail(f"Mismatched '{ch}' closing '{self._stack[-1]}'")
+                self._stack.pop()
+                if not self._stack:
+                    self._member.append(chunk[segment_start:i])
+                    self._complete_member(final=True)
+                    self.done = True
+                    break
+            elif ch == "," and len(self._stack) == 1:
+                self._member.append(chunk[segment_start:i])
+                self._complete_member(final=False)
+                segment_start = i + 1
+        if self._opener is not None and not self.done:
+            self._member.append(chunk[segment_start:])
+        self.received_chars = base + len(chunk)
+
+    def _complete_member(self, final: bool) -> None:
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return # '{}', '[]' or a stray comma
+        is_object = self._opener == "{"
+        try:
+            if is_object:
+                (key, value), = json.loads("{" + text + "}").items()
+            else:
+                key, value = len(self._members), json.loads(text)
+        except ValueError:
+            match = _MEMBER_KEY.match(text) if is_object else None
+            self.invalid[match.group(1) if match else len(self.invalid)] = f"not valid JSON: {text[:60]!r}"
+            return
+        expected = self.shape.get("keys", {}).get(key) if is_object else self.shape.get("items")
+        if expected is not None and not isinstance(value, expected):
+            self.invalid[key] = f"should be a JSON {_type_name(expected)}, got {type(value).__name__}"
+            return
+        self._members.append((key, value))
+        if is_object:
+            self.invalid.pop(key, None) # A repeated key that is valid this time
+        if self.on_member is not None:
+            self.on_member(key, value)
+
+    def result(self) -> Any:
+        """The parsed value; raises StreamFormatError if the stream ended before it closed."""
+        if not self.done:
+            # Not recorded in self.error: salvage() can still recover a value that was only cut off
+            message = "The response ended before the JSON value was complete" if self._opener else "The response contained no JSON value"
+            raise StreamFormatError(message, self.received_chars)
+        return self._value()
+
+    def _value(self) -> Any:
+        if self._opener == "{":
+            return dict(self._members) # Later duplicates win, as with json.loads
+        return [value for _, value in self._members]
+
+    def salvage(self) -> Tuple[Any, Dict[Any, str]]:
+        """
+        The value as far as it can be recovered, and the fields that could not be
+        ({key: reason}): invalid, cut-off and missing keys of an object shape. For
+        an array shape, invalid items are dropped and a value that could not be
+        recovered at all is reported under None.
+        """
+        if self._opener is not None and not self.done and self.error is None:
+            # Cut off: a member that closed all its own brackets is complete, anything deeper is not
+            pending = "".join(self._member).strip()
+            if pending and len(self._stack) == 1 and not self._in_string:
+                self._complete_member(final=True) # Consumes self._member
+            elif pending:
+                self._member = []
+                match = _MEMBER_KEY.match(pending) if self._opener == "{" else None
+                if match:
+                    self.invalid[match.group(1)] = "cut off"
+        value = self._value() if self._opener is not None else None
+        if self.shape.get("type", dict) is list:
+            failures = {}
+            if value is None:
+                failures[None] = str(self.error) if self.error else "no JSON value"
+            return value, failures
+        failures = {key: reason for key, reason in self.invalid.items() if isinstance(key, str)}
+        missing = "missing" if value is not None else (str(self.error) if self.error else "no JSON object")
+        for key in self.shape.get("keys", {}):
+            if key not in (value or {}) and key not in failures:
+                failures[key] = missing
+        return value, failures
@@ -0,0 +1,50 @@
+import os
+import sys
+import sqlite3
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import llm_backends
+import setup_database
+
+ORDERS_HEADER = "OrderID,CustomerID,OrderDate,Quantity,Price,DiscountCode"
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Runs the test in tmp_path, so schema history, caches and checkpoints land there."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def db_url(workdir):
+    path = workdir / "target.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(setup_database.TABLE_DDL["customer_orders"])
+    return f"sqlite:///{path}"
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    """Points main at a local stub LLM server that answers at once (see llm_backends.py)."""
+    _, url = llm_backends.start_stub_server(latency_ms=0.0, chunk_ms=0.0)
+    monkeypatch.setattr(main, "AZURE_ENDPOINT", url)
+    monkeypatch.setattr(main, "API_KEY", "stub")
+    monkeypatch.setattr(llm_backends, "LLM_BACKEND", "azure")
+    monkeypatch.setattr(main, "count_tokens", lambda system_prompt, user_prompt, full_response: (0, 0, 0))
+    main.set_client(None)
+    yield url
+    main.set_client(None)
+
+
+def write_orders_csv(path, rows):
+    """Writes customer_orders rows (tuples; None for an empty field) as a CSV."""
+    with open(path, "w") as f:
+        f.write(ORDERS_HEADER + "\n")
+        for row in rows:
+            f.write(",".join("" if v is None else str(v) for v in row) + "\n")
+    return str(path)
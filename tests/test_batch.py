@@ -0,0 +1,26 @@
+import json
+
+import batch
+
+
+def test_report_paths_differ_per_target_table(tmp_path):
+    path = str(tmp_path / "orders.csv")
+    orders = batch.report_path_for("reports", path, "customer_orders")
+    archive = batch.report_path_for("reports", path, "customer_orders_archive")
+    assert orders != archive
+    assert orders == batch.report_path_for("reports", path, "customer_orders")
+    assert orders.startswith("reports") and orders.endswith(".json")
+
+
+def test_duplicate_file_table_pairs_are_dropped(tmp_path):
+    manifest = tmp_path / "nightly.json"
+    manifest.write_text(json.dumps([
+        {"file_path": "orders.csv", "table_name": "customer_orders"},
+        {"file_path": "orders.csv", "table_name": "customer_orders_archive"},
+        {"file_path": str(tmp_path / "orders.csv"), "table_name": "customer_orders"},
+        {"file_path": ""},
+    ]))
+    jobs = batch.drop_duplicate_jobs(batch.load_manifest(str(manifest)))
+    assert [job["table_name"] for job in jobs] == ["customer_orders", "customer_orders_archive"]
+    assert all(job["file_path"] == str(tmp_path / "orders.csv") for job in jobs)
+    assert len({batch.report_path_for("reports", job["file_path"], job["table_name"]) for job in jobs}) == 2
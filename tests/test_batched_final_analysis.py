@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+import llm_backends
+import llm_ledger
+import main
+
+SHEETS = ["Jan", "Feb", "Mar", "Apr", "May"]
+
+
+@pytest.fixture
+def batch_stub(stub_llm, monkeypatch):
+    """The stub LLM, answering each sheet of a batch with its own analysis and leaving out 'Feb'."""
+    answer = llm_backends.default_stub_response
+
+    def respond(messages):
+        response = json.loads(answer(messages))
+        prompt = messages[1]["content"]
+        if "one key per sheet name" not in prompt:
+            return json.dumps(response)
+        return json.dumps({name: {**analysis, "overall_analysis": {"sheet": name}}
+                           for name, analysis in response.items() if name != "Feb"})
+
+    monkeypatch.setattr(llm_backends, "default_stub_response", respond)
+
+
+def _reports():
+    return {
+        name: {"sheet_name": name, main.PENDING_FINAL_ANALYSIS: {
+            "schema_analysis": {}, "violations_summary": {"sheet": name}, "schema_drift_delta": None
+        }}
+        for name in SHEETS
+    }
+
+
+def test_batches_are_split_back_and_missing_sheets_fall_back(batch_stub):
+    reports = _reports()
+    ledger = llm_ledger.LLMLedger()
+    with llm_ledger.activate(ledger):
+        main.run_batched_final_analysis(reports, token_budget=10**6, max_sheets=2)
+
+    assert [(c["stage"], c.get("sheets") or c.get("sheet"), c["repair"]) for c in ledger.calls] == [
+        ("final_analysis_batch", ["Jan", "Feb"], False),
+        ("final_analysis_batch", ["Jan", "Feb"], True), # Feb re-requested on its own key
+        ("final_analysis", "Feb", False), # ... then on its own prompt
+        ("final_analysis_batch", ["Mar", "Apr"], False),
+        ("final_analysis", "May", False), # A one-sheet batch is a plain request
+    ]
+    for name in ("Jan", "Mar", "Apr"):
+        assert reports[name]["overall_analysis"] == {"sheet": name}
+    for name in ("Feb", "May"):
+        assert reports[name]["overall_analysis"] == {}
+    for report in reports.values():
+        assert main.PENDING_FINAL_ANALYSIS not in report
+        assert report["validation_summary"]["status"] == "Stub"
+        assert set(main.FINAL_ANALYSIS_SHAPE["keys"]) - {"schema_drift"} <= set(report) # Drift facts stay local
+
+
+def test_batches_respect_max_sheets_and_token_budget():
+    pending = {name: report[main.PENDING_FINAL_ANALYSIS] for name, report in _reports().items()}
+    assert main.plan_final_analysis_batches(pending, token_budget=10**6, max_sheets=2) == [["Jan", "Feb"], ["Mar", "Apr"], ["May"]]
+    assert main.plan_final_analysis_batches(pending, token_budget=10**6, max_sheets=8) == [SHEETS]
+    assert main.plan_final_analysis_batches(pending, token_budget=1, max_sheets=8) == [[name] for name in SHEETS]
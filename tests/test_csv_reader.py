@@ -0,0 +1,67 @@
+import io
+
+import pandas as pd
+
+import tools
+
+DB_SCHEMA = {
+    "OrderID": {"type": "VARCHAR(20)", "nullable": False, "primary_key": True},
+    "Quantity": {"type": "INTEGER", "nullable": False, "primary_key": False},
+    "Price": {"type": "REAL", "nullable": False, "primary_key": False},
+    "ShippedOn": {"type": "DATE", "nullable": True, "primary_key": False},
+}
+CSV = (
+    "order_id,quantity,PRICE,ship_date,Extra\n"
+    "ORD1,1,2.5,2025-01-01,x\n"
+    "ORD2,2,3,2025-01-02,y\n"
+    "ORD3,two,4,not a date,z\n"
+    "ORD4,3.5,5,2025-01-04,\n"
+)
+
+
+def _read(naming_map=None):
+    return tools.read_csv_with_schema(io.BytesIO(CSV.encode()), DB_SCHEMA, naming_map)
+
+
+def test_hints_from_normalized_names_and_naming_map():
+    df, failures = _read({"ship_date": "ShippedOn"})
+    assert df["PRICE"].dtype == "float64" # Matched 'Price' by normalized name
+    assert df["order_id"].tolist() == ["ORD1", "ORD2", "ORD3", "ORD4"]
+    assert set(failures) == {"quantity", "ship_date"}
+    assert failures["ship_date"] == {
+        "column": "ShippedOn", "expected_db_type": "DATE", "found_file_type": str(df["ship_date"].dtype),
+        "sample_invalid_values": ["not a date"], "invalid_count": 1, "detected_during": "parse"
+    }
+
+    # Without the naming map, ship_date is not a schema column and gets no hint
+    df, failures = _read()
+    assert set(failures) == {"quantity"}
+
+
+def test_failing_column_is_left_as_strings():
+    df, failures = _read()
+    assert failures["quantity"]["column"] == "Quantity"
+    assert failures["quantity"]["invalid_count"] == 2
+    assert sorted(failures["quantity"]["sample_invalid_values"]) == ["3.5", "two"]
+    assert df["quantity"].tolist() == ["1", "2", "two", "3.5"]
+    assert not pd.api.types.is_numeric_dtype(df["quantity"])
+
+    df, failures = tools.read_csv_with_schema(io.BytesIO(b"quantity\n1\n\n3\n4\n"), DB_SCHEMA)
+    assert failures == {}
+    assert str(df["quantity"].dtype) == "int64"
+    df, _ = tools.read_csv_with_schema(io.BytesIO(b"quantity,PRICE\n1,1\n,2\n"), DB_SCHEMA)
+    assert str(df["quantity"].dtype) == "Int64" # Missing values keep the integers
+
+
+def test_validate_data_types_reuses_parse_failures():
+    naming_map = {"order_id": "OrderID", "quantity": "Quantity", "PRICE": "Price", "ship_date": "ShippedOn"}
+    df, failures = _read(naming_map)
+    df = df.rename(columns=naming_map)
+    by_db_column = {naming_map[col]: failure for col, failure in failures.items()}
+
+    violations = tools.validate_data_types(df, DB_SCHEMA, parse_failures=by_db_column, max_workers=1)
+    assert violations == [by_db_column["Quantity"], by_db_column["ShippedOn"]]
+
+    rederived = tools.validate_data_types(df, DB_SCHEMA, max_workers=1)
+    assert [v["column"] for v in rederived] == ["Quantity"] # Dates left as strings are accepted
+    assert "detected_during" not in rederived[0]
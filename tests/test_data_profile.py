@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+import data_profile
+from conftest import write_orders_csv
+
+
+def _frame(rows=3000):
+    rng = np.random.default_rng(7)
+    return pd.DataFrame({
+        "amount": np.where(np.arange(rows) % 97 == 0, np.nan, rng.lognormal(3, 1, rows)),
+        "quantity": rng.integers(1, 50, rows),
+        "ordered": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 90, rows), unit="D"),
+        "customer": pd.array([f"CUST{i % 700:04d}" if i % 13 else None for i in range(rows)], dtype="str"),
+        "returned": np.arange(rows) % 5 == 0,
+    })
+
+
+def test_merging_chunks_matches_the_whole_frame_in_any_grouping():
+    df = _frame()
+    a, b, c = (data_profile.sketch_frame(part) for part in (df.iloc[:700], df.iloc[700:1900], df.iloc[1900:]))
+    left = data_profile.merge_sketches([data_profile.merge_sketches([a, b]), c])
+    right = data_profile.merge_sketches([a, data_profile.merge_sketches([b, c])])
+    whole = data_profile.profile_frame(df)
+    assert data_profile.summarize(left) == data_profile.summarize(right)
+    _same(data_profile.summarize(left), whole)
+
+
+def _same(got, expected):
+    # Moments merge exactly up to floating-point rounding
+    assert got.keys() == expected.keys()
+    for key in got:
+        if isinstance(got[key], dict):
+            _same(got[key], expected[key])
+        elif isinstance(got[key], float):
+            assert got[key] == pytest.approx(expected[key], rel=1e-9), key
+        else:
+            assert got[key] == expected[key], key
+    return True
+
+
+def test_profile_is_exact_where_it_claims_to_be():
+    df = _frame()
+    profile = data_profile.profile_frame(df)["columns"]
+    amount = profile["amount"]
+    assert amount["count"] == df["amount"].count() and amount["null_count"] == df["amount"].isna().sum()
+    assert amount["min"] == pytest.approx(df["amount"].min()) and amount["max"] == pytest.approx(df["amount"].max())
+    assert amount["mean"] == pytest.approx(df["amount"].mean()) and amount["std"] == pytest.approx(df["amount"].std())
+    for p in (25, 50, 75):
+        exact = df["amount"].quantile(p / 100, interpolation="lower")
+        assert amount["quantiles"][f"p{p}"] == pytest.approx(exact, rel=2 * data_profile.PROFILE_RELATIVE_ACCURACY)
+    assert profile["customer"]["null_count"] == df["customer"].isna().sum()
+    assert profile["customer"]["distinct_estimate"] == pytest.approx(df["customer"].nunique(), rel=0.05)
+    assert profile["ordered"]["min"] == str(df["ordered"].min().date())
+    assert profile["returned"]["true_count"] == df["returned"].sum()
+    assert sum(profile["quantity"]["histogram"]["counts"]) == len(df)
+
+
+def test_sharded_and_single_process_profiles_agree(workdir, db_url, stub_llm):
+    rows = [(f"ORD{i:05d}", f"CUST{i % 40:03d}" if i % 53 else None, f"2025-01-{1 + i % 28:02d}",
+             1 + i % 9, f"{i * 1.25:.2f}", None if i % 3 else "SAVE10") for i in range(900)]
+    path = write_orders_csv(workdir / "orders.csv", rows)
+
+    def run(**options):
+        return main.run_multi_sheet_validation(
+            path, db_url=db_url, user_provided_table_name="customer_orders", output_path="report.json",
+            print_report=False, statistical_profile=True, **options
+        )["statistical_profile"]
+
+    single = run(run_dir=str(workdir / "single"))
+    assert single["rows"] == 900 and "error" not in single
+    _same(run(run_dir=str(workdir / "sharded"), shard_workers=3), single)
+    assert "statistical_profile" not in main.run_multi_sheet_validation(
+        path, db_url=db_url, user_provided_table_name="customer_orders", output_path="report.json",
+        print_report=False, run_dir=str(workdir / "off"), statistical_profile=False
+    )
@@ -0,0 +1,37 @@
+import contextvars
+import time
+
+import pytest
+
+import deadlines
+
+
+def test_stage_deadline_never_extends_the_run_deadline():
+    with deadlines.limit(0.05, "run"):
+        with deadlines.limit(60, "final_analysis"):
+            assert deadlines.remaining() <= 0.05
+            time.sleep(0.06)
+            with pytest.raises(deadlines.DeadlineExceeded) as raised:
+                deadlines.check()
+    assert raised.value.scope == "run"
+    assert deadlines.remaining() is None
+
+
+def test_sleep_raises_at_once_when_the_deadline_comes_first():
+    with deadlines.limit(5, "dynamic_rules"):
+        started = time.monotonic()
+        with pytest.raises(deadlines.DeadlineExceeded):
+            deadlines.sleep(60)
+        assert time.monotonic() - started < 1
+
+
+def test_deadline_is_inherited_by_copied_contexts_only():
+    with deadlines.limit(30, "run"):
+        assert contextvars.copy_context().run(deadlines.remaining) is not None
+        assert contextvars.Context().run(deadlines.remaining) is None
+
+
+def test_stage_seconds_parsing():
+    assert deadlines._parse_stage_seconds("schema_analysis=60, final_analysis = 90") == {"schema_analysis": 60.0, "final_analysis": 90.0}
+    with pytest.raises(ValueError):
+        deadlines._parse_stage_seconds("schema_analysis")
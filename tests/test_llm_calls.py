@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+import llm_backends
+import llm_ledger
+import main
+
+
+class FakeError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RateLimitError(FakeError):
+    pass
+
+
+class ScriptedClient:
+    """A client whose create() raises the scripted errors in turn, then streams '{}'."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **request):
+        self.requests.append(request)
+        if self.errors:
+            raise self.errors.pop(0)
+        return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="{}"))], usage=None)])
+
+
+@pytest.fixture
+def auto_formats(monkeypatch):
+    monkeypatch.setattr(main, "LLM_RESPONSE_FORMAT", "auto")
+    monkeypatch.setattr(main, "_response_format_mode", "json_schema")
+    monkeypatch.setattr(main, "_stream_usage", True)
+    monkeypatch.setattr(main, "RATE_LIMIT_BACKOFF_SECONDS", 0.0)
+    monkeypatch.setattr(main, "count_tokens", lambda system_prompt, user_prompt, full_response: (0, 0, 0))
+    yield
+    main.set_client(None)
+
+
+def _call(max_retries):
+    ledger = llm_ledger.LLMLedger()
+    with llm_ledger.activate(ledger):
+        response = main.get_llm_streaming_response(
+            "system", "user", max_retries=max_retries, stage="schema_analysis",
+            response_format={"type": "json_schema", "json_schema": {"name": "x", "schema": {"type": "object"}}}
+        )
+    return response, ledger.calls
+
+
+def test_step_downs_do_not_use_up_rate_limit_attempts(auto_formats):
+    unsupported = "Unrecognized request argument supplied: {}"
+    client = ScriptedClient([
+        FakeError(unsupported.format("response_format"), 400), FakeError(unsupported.format("response_format"), 400),
+        FakeError(unsupported.format("stream_options"), 400), RateLimitError("Too many requests", 429)
+    ])
+    main.set_client(client)
+    response, calls = _call(max_retries=2)
+    assert response == "{}"
+    assert [c.get("failed") for c in calls] == [None]
+    assert calls[0]["attempts"] == 2
+    assert "response_format" not in client.requests[-1] and "stream_options" not in client.requests[-1]
+
+
+def test_exhausted_retries_report_the_real_cause(auto_formats):
+    main.set_client(ScriptedClient([FakeError("Service unavailable", 429)] * 3))
+    response, calls = _call(max_retries=3)
+    assert response is None
+    assert [(c["attempts"], c["failed"]) for c in calls] == [(3, "FakeError")]
+
+
+def test_stub_deployment_rejecting_every_optional_parameter(auto_formats, monkeypatch):
+    server, url = llm_backends.start_stub_server(latency_ms=0.0, chunk_ms=0.0, reject_parameters="response_format,stream_options")
+    monkeypatch.setattr(main, "AZURE_ENDPOINT", url)
+    monkeypatch.setattr(main, "API_KEY", "stub")
+    monkeypatch.setattr(llm_backends, "LLM_BACKEND", "azure")
+    main.set_client(None)
+    try:
+        response, calls = _call(max_retries=1)
+    finally:
+        server.shutdown()
+    assert response is not None
+    assert [(c["attempts"], c.get("failed"), c["usage_source"]) for c in calls] == [(1, None, "estimate")]
+    assert server.state.stats()["requests"] == 4
+    assert main._stream_usage is False
@@ -0,0 +1,42 @@
+import pytest
+
+import llm_routing
+
+
+class FakeLedger:
+    def __init__(self, cost_usd=0.0, duration_ms=0):
+        self.totals = {"cost_usd": cost_usd, "duration_ms": duration_ms}
+
+    def summary(self):
+        return self.totals
+
+
+@pytest.fixture
+def router():
+    return llm_routing.Router(
+        "gpt-4.1", stage_deployments={"schema_analysis": "gpt-4.1-mini"}, fallback_deployment="gpt-4.1-nano",
+        cost_budget_usd=0.50, latency_budget_s=60, prices=llm_routing.parse_prices("gpt-4.1=2/8/0.5,gpt-4.1-nano=0.1/0.4")
+    )
+
+
+def test_routes_by_stage_until_a_budget_is_spent(router):
+    assert router.route("schema_analysis", FakeLedger(0.49, 59_000)) == {"deployment": "gpt-4.1-mini", "reason": "stage"}
+    assert router.route("final_analysis", FakeLedger())["reason"] == "default"
+    assert router.route("final_analysis", FakeLedger(cost_usd=0.50)) == {
+        "deployment": "gpt-4.1-nano", "reason": "cost_budget", "configured": "gpt-4.1"
+    }
+    assert router.route("final_analysis", FakeLedger(duration_ms=60_000))["reason"] == "latency_budget"
+    assert router.route("final_analysis", None)["reason"] == "default"
+
+
+def test_cost_uses_cached_input_price(router):
+    assert router.cost_usd("gpt-4.1", 1_000_000, 500_000, 100_000) == pytest.approx(1.0 + 0.25 + 0.8)
+    assert router.cost_usd("gpt-4.1-nano", 1_000_000, 1_000_000, 0) == pytest.approx(0.1)
+    assert router.cost_usd("gpt-4.1-mini", 1_000, 0, 10) is None
+
+
+def test_malformed_prices_are_rejected():
+    with pytest.raises(ValueError):
+        llm_routing.parse_prices("gpt-4.1=2")
+    with pytest.raises(ValueError):
+        llm_routing.parse_prices("gpt-4.1")
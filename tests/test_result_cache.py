@@ -0,0 +1,38 @@
+import pandas as pd
+
+import result_cache
+from conftest import ORDERS_HEADER
+
+COLUMNS = ORDERS_HEADER.split(",")
+
+
+def _write_workbook(path, sheets):
+    with pd.ExcelWriter(path) as writer:
+        for name, rows in sheets.items():
+            pd.DataFrame(rows, columns=COLUMNS).to_excel(writer, sheet_name=name, index=False)
+
+
+def test_xlsx_fingerprints_follow_each_sheets_content(workdir):
+    jan = [("ORD00001", "CUST001", "2025-01-01", 1, 2.5, "SAVE10")]
+    feb = [("ORD00002", "CUST002", "2025-02-01", 3, 4.0, None)]
+    _write_workbook("a.xlsx", {"Jan": jan, "Feb": feb})
+    # Same sheets in the other order: the shared string table is numbered differently
+    _write_workbook("b.xlsx", {"Feb": feb, "Jan": jan})
+    _write_workbook("c.xlsx", {"Jan": jan, "Feb": [("ORD00002", "CUST002", "2025-02-01", 4, 4.0, None)]})
+
+    a, b, c = (result_cache.fingerprint_sheets(f"{name}.xlsx", ["Jan", "Feb"]) for name in "abc")
+    assert a == b
+    assert a["Jan"] == c["Jan"] and a["Feb"] != c["Feb"]
+
+
+def test_results_are_keyed_by_content_schema_validator_and_table(workdir):
+    db = str(workdir / "results.db")
+    schema = {"OrderID": "VARCHAR(20)"}
+    version = result_cache.schema_version(schema, [{"sqltext": "Quantity > 0"}])
+    result_cache.store_result("fp", version, "v1", "customer_orders", {"rows": 1}, {"columns": []}, "customer_orders", db_path=db)
+
+    assert result_cache.load_result("fp", version, "v1", "customer_orders", db_path=db) == ({"rows": 1}, {"columns": []}, "customer_orders")
+    assert result_cache.schema_version(schema, [{"sqltext": "Quantity >= 0"}]) != version
+    assert result_cache.schema_version({"OrderID": "VARCHAR(40)"}, [{"sqltext": "Quantity > 0"}]) != version
+    for key in [("fp2", version, "v1", "customer_orders"), ("fp", version, "v2", "customer_orders"), ("fp", version, "v1", "orders")]:
+        assert result_cache.load_result(*key, db_path=db) is None
@@ -0,0 +1,100 @@
+import os
+
+import pandas as pd
+import pytest
+
+import main
+import run_checkpoints
+from conftest import ORDERS_HEADER
+
+
+@pytest.fixture
+def workbook(workdir):
+    path = workdir / "orders.xlsx"
+    columns = ORDERS_HEADER.split(",")
+    with pd.ExcelWriter(path) as writer:
+        for sheet, start in (("Jan", 0), ("Feb", 100)):
+            rows = [(f"ORD{i:05d}", "CUST001", "2025-01-01", 1, 2.5, None) for i in range(start, start + 20)]
+            pd.DataFrame(rows, columns=columns).to_excel(writer, sheet_name=sheet, index=False)
+    return str(path)
+
+
+def _run(path, db_url, events, **options):
+    return main.run_multi_sheet_validation(
+        path, db_url=db_url, user_provided_table_name="customer_orders", output_path="report.json",
+        print_report=False, run_dir="run", progress_callback=events.append, **options
+    )
+
+
+def _sources(events):
+    return {e["sheet"]: e["source"] for e in events if e["event"] == "sheet_finished"}
+
+
+def test_resume_skips_done_sheets_and_retries_failed_ones(workbook, db_url, stub_llm, monkeypatch):
+    validate = main.run_validation_for_sheet
+
+    def fail_feb(*args, **kwargs):
+        if kwargs["sheet_name"] == "Feb":
+            raise RuntimeError("worker preempted")
+        return validate(*args, **kwargs)
+
+    monkeypatch.setattr(main, "run_validation_for_sheet", fail_feb)
+    first_events = []
+    first = _run(workbook, db_url, first_events)
+    assert first["sheet_validation_results"]["Feb"]["validation_summary"]["status"] == "Error"
+    assert run_checkpoints.load_checkpoint("run", 1, "Feb")["attempts"] == 1
+
+    monkeypatch.setattr(main, "run_validation_for_sheet", validate)
+    events = []
+    resumed = _run(workbook, db_url, events, resume=True)
+    assert _sources(events) == {"Jan": "checkpoint", "Feb": "validated"}
+    assert resumed["sheet_validation_results"]["Jan"] == first["sheet_validation_results"]["Jan"]
+    assert "error" not in resumed["sheet_validation_results"]["Feb"]
+    assert run_checkpoints.load_checkpoint("run", 1, "Feb")["attempts"] == 2
+
+
+def test_failed_sheet_is_not_retried_past_its_attempts(workbook, db_url, stub_llm, monkeypatch):
+    monkeypatch.setattr(main, "run_validation_for_sheet", lambda *args, **kwargs: (_ for _ in ()).throw(RuntimeError("bad sheet")))
+    _run(workbook, db_url, [], max_sheet_attempts=1)
+    events = []
+    _run(workbook, db_url, events, resume=True, max_sheet_attempts=1)
+    assert _sources(events) == {"Jan": "checkpoint", "Feb": "checkpoint"}
+
+
+def test_changed_source_starts_over(workbook, db_url, stub_llm):
+    _run(workbook, db_url, [])
+    stat = os.stat(workbook)
+    os.utime(workbook, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    events = []
+    _run(workbook, db_url, events, resume=True)
+    assert _sources(events) == {"Jan": "validated", "Feb": "validated"}
+
+
+def test_atomic_write_keeps_the_old_file_when_the_rename_fails(tmp_path, monkeypatch):
+    path = tmp_path / "sheet-0000-Jan.json"
+    run_checkpoints.write_json_atomic(str(path), {"status": "done"})
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(run_checkpoints.os, "replace", fail)
+    with pytest.raises(OSError):
+        run_checkpoints.write_json_atomic(str(path), {"status": "failed"})
+    assert path.read_text().count("done") == 1
+    assert os.listdir(tmp_path) == [path.name]
+
+
+def test_default_run_dir_is_removed_once_every_sheet_is_done(workbook, db_url, stub_llm, monkeypatch):
+    def run():
+        return main.run_multi_sheet_validation(workbook, db_url=db_url, user_provided_table_name="customer_orders",
+                                               output_path="report.json", print_report=False)
+
+    run_dir = run_checkpoints.default_run_dir(workbook, "customer_orders")
+    validate = main.run_validation_for_sheet
+    monkeypatch.setattr(main, "run_validation_for_sheet", lambda *args, **kwargs: (_ for _ in ()).throw(RuntimeError("bad sheet")))
+    assert run()["run"]["run_dir"] == run_dir
+    assert os.path.exists(os.path.join(run_dir, run_checkpoints.MANIFEST_FILE))
+
+    monkeypatch.setattr(main, "run_validation_for_sheet", validate)
+    assert run()["run"]["run_dir"] is None
+    assert not os.path.exists(run_checkpoints.VALIDATION_RUNS_DIR)
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+import tools
+import sampling
+from conftest import ORDERS_HEADER, write_orders_csv
+
+ROWS = 2000
+
+
+def _orders(rows=ROWS):
+    # Every 50th Price fails to parse (2%), every 100th CustomerID is missing (1%)
+    return [(f"ORD{i:05d}", None if i % 100 == 0 else f"CUST{i % 40:03d}", "2025-01-01", 1 + i % 5,
+             "unknown" if i % 50 == 0 else f"{i * 1.25:.2f}", None) for i in range(rows)]
+
+
+def _run(path, db_url, **options):
+    return main.run_multi_sheet_validation(
+        path, db_url=db_url, user_provided_table_name="customer_orders",
+        output_path="report.json", print_report=False, statistical_profile=True, **options
+    )
+
+
+def _issue(report, check, column):
+    return next(v for v in report["data_quality_issues"] if v["check"] == check and v["column"] == column)
+
+
+def test_wilson_interval():
+    assert sampling.wilson_interval(0, 0) == (0.0, 1.0)
+    low, high = sampling.wilson_interval(0, 100, 0.95)
+    assert low == 0.0 and high == pytest.approx(0.0370, abs=1e-4)
+    low, high = sampling.wilson_interval(50, 100, 0.95)
+    assert low == pytest.approx(1 - high) and low == pytest.approx(0.4038, abs=1e-4)
+
+
+def test_allocation_is_proportional_and_capped():
+    allocation = sampling.allocate([100, 300, 600, 1], 100)
+    assert allocation.sum() == 100 and list(allocation[:3]) == [10, 30, 60]
+    assert list(sampling.allocate([3, 500], 200)) == [1, 199]
+    assert list(sampling.allocate([2, 2], 10)) == [2, 2]
+
+
+def test_stratified_positions_cover_every_block():
+    positions, info = sampling.sample_positions(10_000, 50, "stratified")
+    assert len(positions) == 50 == info["rows_sampled"] and info["strata"] == sampling.SAMPLING_STRATA
+    assert np.all(np.diff(positions) > 0)
+    assert np.array_equal(np.bincount(positions * sampling.SAMPLING_STRATA // 10_000), [5] * sampling.SAMPLING_STRATA)
+    again, _ = sampling.sample_positions(10_000, 50, "stratified")
+    assert np.array_equal(positions, again)
+
+
+def test_read_csv_lines_counts_rows_like_the_parser(tmp_path):
+    path = tmp_path / "lines.csv"
+    path.write_bytes(b"a,b\r\n1,x\r\n\r\n2,y\n,\n\n3,z")
+    assert tools.count_csv_rows(str(path)) == 4
+    buffer = tools.read_csv_lines(str(path), np.array([1, 3]))
+    assert buffer.getvalue() == b"a,b\r\n2,y\n3,z\n"
+
+
+def test_sampled_checks_and_profile_share_one_population(workdir, db_url, stub_llm):
+    path = write_orders_csv(workdir / "orders.csv", _orders())
+    report = _run(path, db_url, sample_rows=400, escalate_rate=0.5)
+
+    positions, _ = sampling.sample_positions(ROWS, 400, "uniform")
+    sampling_section = report["sampling"]
+    assert sampling_section["rows_sampled"] == 400 and sampling_section["rows_total"] == ROWS
+    assert sampling_section["escalated"] is False
+    assert sampling_section["populations"] == {
+        "data_type_mismatch": "sample", "data_quality_issues": "sample", "statistical_profile": "sample"
+    }
+    assert report["total_rows_checked"] == 400 == report["statistical_profile"]["rows"]
+
+    # Parse failures and NULL counts both come from the sampled rows
+    price = next(v for v in report["data_type_mismatch"] if v["column"] == "Price")
+    assert price["invalid_count"] == int(np.sum(positions % 50 == 0))
+    assert price["sampled"]["estimated_count"] == round(price["invalid_count"] / 400 * ROWS)
+    nulls = _issue(report, "not_null_violation", "CustomerID")
+    assert nulls["count"] == int(np.sum(positions % 100 == 0))
+    assert set(nulls["affected_rows_sample_indices"]) <= set(positions.tolist())
+
+
+def test_frequent_violations_escalate_to_all_rows(workdir, db_url, stub_llm):
+    path = write_orders_csv(workdir / "orders.csv", _orders())
+    report = _run(path, db_url, sample_rows=400, escalate_rate=0.01)
+
+    assert report["sampling"]["escalated"] is True
+    assert report["sampling"]["populations"]["data_quality_issues"] == "all_rows"
+    assert report["sampling"]["populations"]["statistical_profile"] == "all_rows"
+    assert report["total_rows_checked"] == ROWS == report["statistical_profile"]["rows"]
+    assert next(v for v in report["data_type_mismatch"] if v["column"] == "Price")["invalid_count"] == ROWS // 50
+    assert _issue(report, "not_null_violation", "CustomerID")["count"] == ROWS // 100
+
+
+def test_sharded_sample_is_stratified_by_shard(workdir, db_url, stub_llm):
+    path = write_orders_csv(workdir / "orders.csv", _orders())
+    report = _run(path, db_url, sample_rows=400, escalate_rate=0.5, shard_workers=2)
+
+    sampling_section = report["sampling"]
+    assert sampling_section["strata_by"] == "shard" and sampling_section["rows_sampled"] == 400
+    assert sampling_section["populations"]["data_quality_issues"] == "sample"
+    assert sampling_section["populations"]["statistical_profile"] == "all_rows"
+    assert report["total_rows_checked"] == 400
+    price = next(v for v in report["data_type_mismatch"] if v["column"] == "Price")
+    assert price["invalid_count"] < ROWS // 50 and "sampled" in price
+
+
+def test_columnar_sample_reads_only_the_sampled_rows(workdir, db_url, stub_llm):
+    frame = pd.DataFrame(_orders(), columns=ORDERS_HEADER.split(",")).astype({"Price": str})
+    frame.to_parquet(workdir / "orders.parquet")
+    report = _run(str(workdir / "orders.parquet"), db_url, sample_rows=400, sample_method="stratified:customerid", escalate_rate=0.5)
+
+    assert report["sampling"]["method"] == "stratified:customerid" and report["sampling"]["strata"] == 41
+    assert report["total_rows_checked"] == 400 == report["statistical_profile"]["rows"]
+    nulls = _issue(report, "not_null_violation", "CustomerID")
+    assert 0 < nulls["count"] < ROWS // 100 and set(nulls["affected_rows_sample_indices"]) <= set(range(0, ROWS, 100))
+
@@ -0,0 +1,72 @@
+import schema_drift
+
+
+def col(inferred_type="int64", null_count=0, unique_count=100, samples=()):
+    return {"inferred_type": inferred_type, "null_count": null_count, "unique_count": unique_count, "sample_values": list(samples)}
+
+
+def snapshot(columns, total_rows=100):
+    return {"columns": columns, "total_rows": total_rows}
+
+
+def test_added_removed_and_renamed_by_name():
+    before = snapshot({"OrderID": col(), "CustomerID": col("object"), "Notes": col("object")})
+    after = snapshot({"OrderID": col(), "Customer_ID": col("str"), "Region": col("object")})
+    diff = schema_drift.diff_schemas(before, after)
+    assert diff["columns_renamed"] == [{"from": "CustomerID", "to": "Customer_ID"}]
+    assert diff["columns_added"] == ["Region"]
+    assert diff["columns_removed"] == ["Notes"]
+    assert diff["type_changes"] == []
+
+
+def test_rename_by_sample_overlap_and_greedy_tie_break():
+    samples = ("A1", "B2", "C3")
+    before = snapshot({"amount_a": col(samples=samples), "amount_b": col(samples=samples), "code": col("object", samples=("x",))})
+    after = snapshot({"total": col(samples=samples), "code": col("object", samples=("x",))})
+    diff = schema_drift.diff_schemas(before, after)
+    # Both removed columns match 'total' equally; the tie goes to the first name, whatever the column order
+    assert diff["columns_renamed"] == [{"from": "amount_a", "to": "total"}]
+    assert diff["columns_removed"] == ["amount_b"]
+    reordered = snapshot(dict(reversed(list(before["columns"].items()))))
+    assert schema_drift.diff_schemas(reordered, after)["columns_renamed"] == diff["columns_renamed"]
+
+
+def test_rename_needs_a_matching_type():
+    before = snapshot({"CustomerID": col("int64")})
+    after = snapshot({"Customer_ID": col("datetime64[ns]")})
+    diff = schema_drift.diff_schemas(before, after)
+    assert diff["columns_renamed"] == []
+    assert (diff["columns_removed"], diff["columns_added"]) == (["CustomerID"], ["Customer_ID"])
+
+
+def test_type_changes_compare_categories():
+    before = snapshot({"qty": col("int64"), "price": col("float64"), "code": col("object"), "when": col("object")})
+    after = snapshot({"qty": col("float64", null_count=1), "price": col("float32"), "code": col("str"), "when": col("datetime64[ns]")})
+    assert schema_drift.diff_schemas(before, after)["type_changes"] == [{"column": "when", "from": "object", "to": "datetime64[ns]"}]
+
+    # Without new nulls, int -> float is a real change
+    after["columns"]["qty"]["null_count"] = 0
+    assert [c["column"] for c in schema_drift.diff_schemas(before, after)["type_changes"]] == ["qty", "when"]
+
+
+def test_null_rate_and_distinct_ratio_thresholds():
+    before = snapshot({"a": col(null_count=0, unique_count=100), "b": col(null_count=0, unique_count=100)})
+    after = snapshot({"a": col(null_count=9, unique_count=91), "b": col(null_count=10, unique_count=50)})
+    diff = schema_drift.diff_schemas(before, after)
+    assert diff["null_rate_shifts"] == [{"column": "b", "from": 0.0, "to": 0.1}]
+    assert [(s["column"], s["to_distinct_ratio"]) for s in diff["cardinality_shifts"]] == [("b", round(50 / 90, 4))]
+
+
+def test_version_history_and_compact_delta():
+    v1 = snapshot({"OrderID": col()})
+    v2 = snapshot({"OrderID": col(), "Region": col("object")})
+    v3 = snapshot({"OrderID": col(), "Region": col("object")})
+    drift = schema_drift.detect_schema_drift(v3, [v2, v2, v1])
+    assert drift["detected"] is False and drift["versions_compared"] == 3
+    assert drift["version_history"] == [{"versions_ago": 2, "columns_added": ["Region"]}]
+    assert schema_drift.compact_drift_delta(drift) is None
+
+    drift = schema_drift.detect_schema_drift(v1, [v3])
+    assert drift["changes"] == {"columns_removed": ["Region"]}
+    assert schema_drift.compact_drift_delta(drift) == {"changes_since_last_version": {"columns_removed": ["Region"]}, "earlier_version_changes": []}
+    assert schema_drift.detect_schema_drift(v1, [])["detected"] is False
@@ -0,0 +1,65 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import schema_history
+
+
+def snapshot(total_rows, qty_type="int64", null_count=0):
+    return {"total_rows": total_rows, "columns": {
+        "OrderID": {"inferred_type": "object", "null_count": 0, "unique_count": total_rows, "sample_values": [f"ORD{total_rows}"]},
+        "Quantity": {"inferred_type": qty_type, "null_count": null_count, "unique_count": 5, "sample_values": [1, 2]},
+    }}
+
+
+def _versions(db, table="orders"):
+    with sqlite3.connect(db) as conn:
+        return conn.execute("SELECT seen_count FROM schema_versions WHERE table_name = ? ORDER BY id", (table,)).fetchall()
+
+
+def test_same_structure_is_one_version_with_the_latest_stats(workdir):
+    db = str(workdir / "history.db")
+    first = schema_history.save_schema("orders", snapshot(100), db_path=db)
+    assert schema_history.save_schema("orders", snapshot(250, null_count=3), db_path=db) == first
+    assert _versions(db) == [(2,)]
+    assert schema_history.load_schemas("orders", 10, db_path=db) == [snapshot(250, null_count=3)]
+
+    schema_history.save_schema("orders", snapshot(250, qty_type="float64"), db_path=db)
+    assert _versions(db) == [(2,), (1,)]
+    assert [s["columns"]["Quantity"]["inferred_type"] for s in schema_history.load_schemas("orders", 10, db_path=db)] == ["float64", "int64"]
+
+
+def test_retention_by_count_and_age(workdir):
+    conn = schema_history._connect(str(workdir / "history.db"))
+    old = (datetime.now(timezone.utc) - timedelta(days=40)).isoformat(timespec='microseconds')
+    with conn:
+        for i, qty_type in enumerate(["int64", "float64", "object"]):
+            schema_history._record(conn, "orders", snapshot(10, qty_type=qty_type), f"2020-01-0{i + 1}T00:00:00.000000+00:00")
+        schema_history._record(conn, "orders", snapshot(10, qty_type="bool"), old)
+    with conn:
+        assert schema_history.apply_retention(conn, "orders", max_versions=2, max_age_days=0) == 2
+    with conn:
+        # The latest version is kept however old it is
+        assert schema_history.apply_retention(conn, "orders", max_versions=2, max_age_days=30) == 1
+        assert schema_history.apply_retention(conn, "orders", max_versions=2, max_age_days=30) == 0
+    assert conn.execute("SELECT COUNT(*) FROM schema_content").fetchone() == (1,)
+    conn.close()
+
+
+def test_legacy_json_is_imported_once_from_the_history_dir(workdir):
+    os.makedirs(schema_history.SCHEMA_HISTORY_DIR)
+    for ts, rows in (("20240101T000000", 10), ("20240102T000000", 20), ("20240103T000000", 30)):
+        with open(os.path.join(schema_history.SCHEMA_HISTORY_DIR, f"orders_schema_{ts}Z.json"), "w") as f:
+            json.dump(snapshot(rows, qty_type="float64" if rows == 30 else "int64"), f)
+    db = str(workdir / "elsewhere" / "history.db")
+
+    threads = [threading.Thread(target=schema_history.load_schemas, args=("orders", 10, db)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert _versions(db) == [(2,), (1,)]
+    schema_history.save_schema("orders", snapshot(40, qty_type="float64"), db_path=db)
+    assert _versions(db)[-1] == (2,)
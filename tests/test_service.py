@@ -0,0 +1,71 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import service
+from conftest import write_orders_csv
+
+
+@pytest.fixture
+def service_url(workdir, db_url, stub_llm):
+    manager = service.JobManager(db_url, workers=2, input_root=str(workdir))
+    handler = type("BoundValidationRequestHandler", (service.ValidationRequestHandler,), {"manager": manager})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", manager
+    server.shutdown()
+    server.server_close()
+    manager.pool.shutdown(wait=True)
+
+
+def _request(url, body=None, content_type="text/csv"):
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type} if body is not None else {})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.status, response.read().decode("utf-8")
+
+
+def _events(url):
+    _, text = _request(url)
+    return [json.loads(line[len("data: "):]) for line in text.splitlines() if line.startswith("data: ")]
+
+
+def test_upload_status_events_and_reports(workdir, service_url):
+    url, _ = service_url
+    path = write_orders_csv(workdir / "orders.csv", [("ORD00001", "CUST001", "2025-01-01", 0, "2.50", None)])
+    with open(path, "rb") as f:
+        status, body = _request(f"{url}/jobs?table=customer_orders&filename=orders.csv&incremental=no", f.read())
+    job = json.loads(body)
+    assert status == 202 and job["state"] in ("queued", "running")
+
+    live = _events(url + job["links"]["events"]) # Streams until the job finishes
+    assert live[0]["event"] == "job_started" and live[-1] == {**live[-1], "event": "job_finished", "state": "done"}
+    assert "sheet_finished" in [e["event"] for e in live]
+    assert _events(url + job["links"]["events"]) == live # A late subscriber gets the whole replay
+
+    status = json.loads(_request(f"{url}/jobs/{job['job_id']}")[1])
+    assert (status["state"], status["sheets_total"], status["sheets_finished"]) == ("done", 1, 1)
+    report = json.loads(_request(url + job["links"]["report"])[1])
+    assert report["user_provided_target_table"] == "customer_orders"
+    assert report["data_quality_issues"]
+    assert _request(url + job["links"]["report_md"])[1].strip()
+
+
+def test_json_submission_parses_flags(workdir, service_url):
+    url, manager = service_url
+    write_orders_csv(workdir / "orders.csv", [("ORD00001", "CUST001", "2025-01-01", 1, "2.50", None)])
+    body = {"file_path": "orders.csv", "table_name": "customer_orders", "incremental": "false", "prune_columns": "0", "trace": True}
+    job = json.loads(_request(f"{url}/jobs", json.dumps(body).encode(), "application/json")[1])
+    assert manager.get(job["job_id"]).options == {"incremental": False, "prune_columns": False, "trace": True}
+
+    for bad in ({**body, "incremental": "maybe"}, {**body, "trace": 2}, {**body, "file_path": "../outside.csv"}):
+        with pytest.raises(urllib.error.HTTPError) as raised:
+            _request(f"{url}/jobs", json.dumps(bad).encode(), "application/json")
+        assert raised.value.code == 400
+    with pytest.raises(urllib.error.HTTPError) as raised:
+        _request(f"{url}/jobs/unknown")
+    assert raised.value.code == 404
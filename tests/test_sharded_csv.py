@@ -0,0 +1,82 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import sqlalchemy
+
+import main
+import sharded_csv
+import tools
+from conftest import write_orders_csv
+
+
+def _orders_with_gaps(count=600):
+    rows = []
+    for i in range(count):
+        rows.append((
+            f"ORD{i:05d}" if i % 97 else None,
+            f"CUST{i % 40:03d}" if i % 53 else None,
+            "2025-01-01" if i % 61 else None,
+            (i % 9) - 1, # Zero and negative quantities violate CHECK(Quantity > 0)
+            f"{i * 1.25:.2f}" if i % 83 else None,
+            None if i % 3 else "SAVE10",
+        ))
+        if i % 150 == 75:
+            rows.append((None,) * 6) # A blank line of empty fields
+    rows.append(("ORD00001", "CUST001", "2025-01-02", 1, "1.00", None)) # Duplicate primary key
+    rows.append((None,) * 6) # Blank last row
+    return rows
+
+
+def _run(path, db_url, **options):
+    return main.run_multi_sheet_validation(
+        path, db_url=db_url, user_provided_table_name="customer_orders",
+        output_path="report.json", print_report=False, **options
+    )
+
+
+def test_sharded_checks_match_single_process_with_blank_rows(workdir, db_url, stub_llm):
+    path = write_orders_csv(workdir / "orders.csv", _orders_with_gaps())
+
+    single = _run(path, db_url, run_dir=str(workdir / "single"))
+    sharded = _run(path, db_url, run_dir=str(workdir / "sharded"), shard_workers=3)
+
+    assert single["total_rows_checked"] == 600 + 1
+    for key in ("total_rows_checked", "data_type_mismatch", "data_quality_issues"):
+        assert sharded[key] == single[key], key
+    assert {v["check"] for v in single["data_quality_issues"]} == {"not_null_violation", "primary_key_violation", "check_constraint_violation"}
+
+
+def test_byte_ranges_cover_the_body_on_line_boundaries(workdir):
+    path = write_orders_csv(workdir / "orders.csv", _orders_with_gaps(200))
+    header, ranges = sharded_csv.plan_byte_ranges(path, 7)
+    with open(path, "rb") as f:
+        content = f.read()
+    assert content.startswith(header)
+    assert ranges[0][0] == len(header) and ranges[-1][1] == len(content)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start and content[end - 1:end] == b"\n"
+
+
+def test_violation_lists_do_not_depend_on_worker_counts(workdir, db_url):
+    rows = _orders_with_gaps()
+    rows[10:10] = [("ORD90001", "CUST001", "soon", "many", "1.00", None), ("ORD90002", "CUST001", "2025-01-01", 2, "free", None)]
+    path = write_orders_csv(workdir / "orders.csv", rows)
+    db_schema = tools.get_cached_db_schema(db_url, "customer_orders")
+    header, ranges = sharded_csv.plan_byte_ranges(path, 5)
+
+    def sharded(processes):
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            return sharded_csv.validate_csv(pool, path, ranges, header, db_url, "customer_orders", db_schema, {}, 4)
+
+    parallel = sharded(3)
+    assert parallel == sharded(1)
+    assert parallel[0] and parallel[1]
+
+    df, parse_failures = tools.read_csv_with_schema(path, db_schema)
+    tools.drop_blank_rows(df)
+    engine = sqlalchemy.create_engine(db_url)
+    for workers in (4, 1):
+        checks = (tools.validate_data_types(df, db_schema, parse_failures=parse_failures, max_workers=workers),
+                  tools.run_data_quality_checks(df, db_schema, engine, "customer_orders", max_workers=workers))
+        if workers == 4:
+            threaded = checks
+    assert threaded == checks
@@ -0,0 +1,46 @@
+import pytest
+
+from streaming_json import IncrementalJSONParser, StreamFormatError
+
+SHAPE = {"type": dict, "keys": {"status": str, "issues": list, "score": int}}
+RESPONSE = '```json\n{"status": "ok, mostly", "issues": [{"col": "a}"}, 2], "score": 7}\n```'
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(RESPONSE)])
+def test_chunked_stream_parses_like_json_loads(size):
+    seen = []
+    parser = IncrementalJSONParser(SHAPE, on_member=lambda key, value: seen.append(key))
+    for start in range(0, len(RESPONSE), size):
+        parser.feed(RESPONSE[start:start + size])
+    assert parser.result() == {"status": "ok, mostly", "issues": [{"col": "a}"}, 2], "score": 7}
+    assert seen == ["status", "issues", "score"]
+    assert parser.invalid == {}
+
+
+def test_off_format_stream_is_rejected_early():
+    parser = IncrementalJSONParser(SHAPE)
+    with pytest.raises(StreamFormatError):
+        parser.feed('Sure! Here is the list: [1, 2')
+    with pytest.raises(StreamFormatError):
+        IncrementalJSONParser().feed('{"a": [1}')
+
+
+def test_salvage_keeps_complete_members_and_reports_the_rest():
+    parser = IncrementalJSONParser(SHAPE)
+    parser.feed('{"status": "ok", "score": "high", "issues": [1, 2')
+    with pytest.raises(StreamFormatError):
+        parser.result()
+    value, failures = parser.salvage()
+    assert value == {"status": "ok"}
+    assert set(failures) == {"score", "issues"}
+    assert failures["issues"] == "cut off"
+
+
+def test_salvage_keeps_a_trailing_member_that_closed_its_own_brackets():
+    parser = IncrementalJSONParser(SHAPE)
+    parser.feed('{"status": "ok", "issues": [1, 2]')
+    assert parser.salvage() == ({"status": "ok", "issues": [1, 2]}, {"score": "missing"})
+
+    rules = IncrementalJSONParser({"type": list, "items": dict})
+    rules.feed('[{"rule": "a"}, {"rule": "b"}')
+    assert rules.salvage() == ([{"rule": "a"}, {"rule": "b"}], {})
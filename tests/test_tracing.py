@@ -0,0 +1,83 @@
+import threading
+import contextvars
+import tracemalloc
+
+import tools
+import tracing
+
+
+def test_tracemalloc_sessions_are_reference_counted():
+    assert not tracemalloc.is_tracing()
+    first, second = tracing.tracemalloc_session(), tracing.tracemalloc_session()
+    other_job = contextvars.Context()
+    first.__enter__()
+    other_job.run(second.__enter__)
+    first.__exit__(None, None, None) # One job finishing leaves the other's tracing running
+    assert tracemalloc.is_tracing()
+    other_job.run(second.__exit__, None, None, None)
+    assert not tracemalloc.is_tracing()
+
+
+def test_nested_sessions_in_one_run_count_once():
+    stages = []
+    with tracing.tracemalloc_session():
+        with tracing.tracemalloc_session(): # e.g. memory_budget inside a profiled run
+            with tools.memory_stage(stages, "load"):
+                pass
+        assert tracemalloc.is_tracing()
+    assert "shared_peak" not in stages[0]
+    assert not tracemalloc.is_tracing()
+
+
+def test_session_leaves_tracing_it_did_not_start():
+    tracemalloc.start()
+    try:
+        with tracing.tracemalloc_session():
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_session_is_released_when_the_block_fails():
+    try:
+        with tracing.tracemalloc_session():
+            raise RuntimeError("run failed")
+    except RuntimeError:
+        pass
+    assert not tracemalloc.is_tracing()
+
+
+def test_memory_stage_marks_peaks_shared_with_a_concurrent_run():
+    alone, shared = [], []
+    with tracing.tracemalloc_session():
+        with tools.memory_stage(alone, "load"):
+            bytearray(1 << 20)
+        entered, release = threading.Event(), threading.Event()
+
+        def other_job():
+            with tracing.tracemalloc_session():
+                entered.set()
+                release.wait()
+
+        worker = threading.Thread(target=contextvars.Context().run, args=(other_job,))
+        with tools.memory_stage(shared, "deep_validation"):
+            worker.start()
+            entered.wait()
+            release.set()
+            worker.join()
+    assert "shared_peak" not in alone[0] and alone[0]["peak_mb"] >= 1
+    assert shared[0]["shared_peak"] is True
+    assert not tracemalloc.is_tracing()
+
+
+def test_memory_budget_run_records_stages_and_releases_tracemalloc(workdir, db_url, stub_llm):
+    import main
+    from conftest import write_orders_csv
+    path = write_orders_csv(workdir / "orders.csv", [(f"ORD{i:05d}", "CUST001", "2025-01-01", 1, "1.00", None) for i in range(50)])
+    report = main.run_multi_sheet_validation(path, db_url=db_url, user_provided_table_name="customer_orders",
+                                             output_path="report.json", print_report=False, memory_budget=True,
+                                             trace=True, trace_memory=True)
+    assert [entry["stage"] for entry in report["memory_profile"]][:1] == ["load"]
+    assert not any(entry.get("shared_peak") for entry in report["memory_profile"])
+    assert not tracemalloc.is_tracing()
@@ -1,12 +1,59 @@
+import io
+import os
+import copy
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 import sqlalchemy
 from sqlalchemy import create_engine, inspect, MetaData
 import logging
 from typing import Dict, Any, List, Optional
-import config 
 from pandas import DataFrame
-from datetime import datetime
+from datetime import datetime, date
 import re
+import tracing
+
+# --- Shared engines and schema catalog ---
+# Long-lived processes (the job service, batch workers) reuse one engine per URL
+# and cache table schemas for SCHEMA_CATALOG_TTL_SECONDS instead of reflecting
+# the database on every run.
+SCHEMA_CATALOG_TTL_SECONDS = float(os.getenv("SCHEMA_CATALOG_TTL_SECONDS", "300"))
+_engines: Dict[str, sqlalchemy.engine.Engine] = {}
+_schema_catalog: Dict[tuple, tuple] = {}
+_catalog_lock = threading.Lock()
+
+
+def get_engine(db_url: str) -> sqlalchemy.engine.Engine:
+    """Returns the process-wide engine (and connection pool) for `db_url`."""
+    with _catalog_lock:
+        engine = _engines.get(db_url)
+        if engine is None:
+            engine = _engines[db_url] = create_engine(db_url)
+        return engine
+
+
+def get_cached_db_schema(db_url: str, table_name: str) -> Optional[Dict[str, Any]]:
+    """get_db_schema through the schema catalog; callers get their own copy."""
+    key = (db_url, table_name)
+    with _catalog_lock:
+        entry = _schema_catalog.get(key)
+    if entry and time.monotonic() - entry[0] < SCHEMA_CATALOG_TTL_SECONDS:
+        return copy.deepcopy(entry[1])
+    schema = get_db_schema(get_engine(db_url), table_name)
+    if schema is not None:
+        with _catalog_lock:
+            _schema_catalog[key] = (time.monotonic(), schema)
+    return copy.deepcopy(schema)
+
+
+def clear_schema_catalog() -> None:
+    with _catalog_lock:
+        _schema_catalog.clear()
+
 
 def get_db_schema(engine: sqlalchemy.engine.Engine, table_name: str) -> Optional[Dict[str, Any]]:
     """
@@ -41,15 +88,33 @@ def get_db_schema(engine: sqlalchemy.engine.Engine, table_name: str) -> Optional
         logging.error(f"Error fetching DB schema for table '{table_name}': {e}")
         raise
 
-def extract_schema_from_df(df: pd.DataFrame, file_name: str, sheet_name: Optional[str]) -> Dict[str, Any]:
+def drop_blank_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drops rows where every value is null, in place, and returns `df`. This is the
+    one row filter of the pipeline: schema extraction, the single-process checks
+    and each shard of a sharded CSV all see the rows that survive it.
+    """
+    df.dropna(how='all', inplace=True)
+    return df
+
+def extract_schema_from_df(
+    df: pd.DataFrame,
+    file_name: str,
+    sheet_name: Optional[str],
+    extra_columns: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Dict[str, Any]:
     """
     Extracts schema information directly from a pandas DataFrame.
 
+    `extra_columns` holds schema-only details for columns that exist in the file
+    but were not loaded (e.g. pruned from a Parquet read). They are listed
+    alongside the loaded columns so schema comparison still sees them.
+
     Returns a dictionary containing metadata, column details, and sample data.
     """
     try:
         
-        df.dropna(how='all', inplace=True)
+        drop_blank_rows(df)
         if df.empty:
             logging.warning(f"DataFrame for '{file_name}' - sheet '{sheet_name}' is empty or contains only null rows.")
             return {"file_name": file_name, "sheet_name": sheet_name, "total_rows": 0, "columns": {}}
@@ -58,22 +123,26 @@ def extract_schema_from_df(df: pd.DataFrame, file_name: str, sheet_name: Optiona
         column_details = {}
         for col in df.columns:
             # Get 5 unique, non-null sample values
-            sample_values = df[col].dropna().unique().tolist()
+            unique_values = df[col].dropna().unique()
+            sample_values = unique_values[:5].tolist()
             # Ensure samples are JSON serializable (convert timestamps/dates to strings)
-            sample_values = [str(s) if isinstance(s, (pd.Timestamp, datetime)) else s for s in sample_values]
-            sample_values = sample_values[:5]
+            sample_values = [str(s) if isinstance(s, (pd.Timestamp, datetime, date)) else s for s in sample_values]
 
             column_details[str(col)] = {
                 'inferred_type': str(df[col].dtype),
                 'sample_values': sample_values,
-                'null_count': int(df[col].isnull().sum())
+                'null_count': int(df[col].isnull().sum()),
+                'unique_count': len(unique_values)
             }
 
+        for col, details in (extra_columns or {}).items():
+            column_details.setdefault(str(col), details)
+
         schema_summary = {
             "file_name": file_name, # Keep original file name for context
             "sheet_name": sheet_name, # Record which sheet this schema is for
             "total_rows": len(df),
-            "total_columns": len(df.columns),
+            "total_columns": len(column_details),
             "columns": column_details
         }
 
@@ -88,11 +157,313 @@ def extract_schema_from_df(df: pd.DataFrame, file_name: str, sheet_name: Optiona
 # --- [END NEW] ---
 
 
-def extract_file_schema(file_path: str, sheet_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+# --- Columnar (Parquet / Arrow IPC / Feather) Inputs ---
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_IPC_EXTENSIONS = ('.arrow', '.ipc', '.feather')
+COLUMNAR_SAMPLE_ROWS = 1000
+
+
+def _columnar_format_from_name(name: str) -> Optional[str]:
+    lowered = name.lower()
+    if lowered.endswith(PARQUET_EXTENSIONS):
+        return 'parquet'
+    if lowered.endswith(ARROW_IPC_EXTENSIONS):
+        return 'ipc'
+    return None
+
+
+def get_columnar_format(file_path: str) -> Optional[str]:
+    """
+    Returns the pyarrow dataset format ('parquet' or 'ipc') for a columnar file
+    or a partitioned dataset directory, or None if the path is not columnar.
+    """
+    if os.path.isdir(file_path):
+        for _, _, files in os.walk(file_path):
+            for name in files:
+                if name.startswith(('.', '_')):
+                    continue # Skip _SUCCESS, _metadata and hidden files, like pyarrow does
+                file_format = _columnar_format_from_name(name)
+                if file_format:
+                    return file_format
+        return None
+    return _columnar_format_from_name(file_path)
+
+
+def open_columnar_dataset(file_path: str):
+    """
+    Opens a Parquet / Arrow IPC / Feather file or a hive-partitioned directory
+    as a pyarrow dataset. Nothing is read until columns are requested.
+    """
+    try:
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise ValueError(f"pyarrow is required to read columnar file '{file_path}': {e}")
+
+    file_format = get_columnar_format(file_path)
+    if file_format is None:
+        raise ValueError(f"Not a Parquet/Arrow/Feather input: {file_path}")
+    return ds.dataset(file_path, format=file_format, partitioning="hive")
+
+
+def read_columnar_schema(file_path: str) -> Dict[str, str]:
+    """
+    Reads only the typed schema of a columnar input (no data).
+
+    Returns a dictionary mapping column names to the pandas dtype they load as.
     """
-    Reads a CSV or a specific Excel sheet and extracts its schema using extract_schema_from_df.
+    dataset = open_columnar_dataset(file_path)
+    schema_types = {}
+    for field in dataset.schema:
+        try:
+            schema_types[field.name] = str(pd.api.types.pandas_dtype(field.type.to_pandas_dtype()))
+        except Exception:
+            schema_types[field.name] = str(field.type)
+    return schema_types
+
+
+def read_columnar_file(file_path: str, columns: Optional[List[str]] = None, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """
+    Reads a columnar input into a DataFrame, keeping the file's own types.
+
+    Only `columns` are read from disk when given (column pruning). With `rows`
+    (sorted row positions, e.g. a sample), only those rows are read and the
+    frame is indexed by them.
+    """
+    dataset = open_columnar_dataset(file_path)
+    table = dataset.to_table(columns=columns) if rows is None else dataset.take(rows, columns=columns)
+    logging.info(f"Read {table.num_rows} rows x {table.num_columns} columns from columnar input: {file_path}")
+    df = table.to_pandas()
+    if rows is not None:
+        df.index = pd.Index(rows)
+    return df
+
+
+def describe_columnar_columns(file_path: str, columns: List[str], sample_rows: int = COLUMNAR_SAMPLE_ROWS) -> Dict[str, Dict[str, Any]]:
+    """
+    Builds schema-only column details for columns that were pruned from a read.
+
+    Types come from the file schema; sample values come from the first
+    `sample_rows` rows only. Null counts are unknown without a full read.
+    """
+    if not columns:
+        return {}
+    schema_types = read_columnar_schema(file_path)
+    head_df = open_columnar_dataset(file_path).head(sample_rows, columns=columns).to_pandas()
+
+    column_details = {}
+    for col in columns:
+        sample_values = head_df[col].dropna().unique().tolist()
+        sample_values = [str(s) if isinstance(s, (pd.Timestamp, datetime, date)) else s for s in sample_values]
+        column_details[str(col)] = {
+            'inferred_type': schema_types.get(col, 'object'),
+            'sample_values': sample_values[:5],
+            'null_count': None,
+            'unique_count': None,
+            'pruned_from_read': True
+        }
+    return column_details
+
+
+def _normalize_column_name(name: Any) -> str:
+    return re.sub(r'[^0-9a-z]', '', str(name).lower())
+
+
+def select_columns_for_schema(file_columns: List[str], db_schema: Dict[str, Any]) -> List[str]:
+    """
+    Picks the file columns that correspond to a DB schema column.
+
+    Matching ignores case and non-alphanumeric characters ('order_id' == 'OrderID').
+    Columns that only match semantically are left to the LLM mapping step.
+    """
+    db_columns = {_normalize_column_name(c) for c in db_schema.keys()}
+    return [c for c in file_columns if _normalize_column_name(c) in db_columns]
+
+
+# --- Schema-Directed CSV Parsing ---
+# DB base types that the fast CSV reader converts while parsing. Everything else
+# mapped to a DB column is kept as a string, like the default pandas parser does.
+CSV_TYPE_HINTS = {
+    'INTEGER': 'int', 'INT': 'int', 'BIGINT': 'int', 'SMALLINT': 'int',
+    'REAL': 'float', 'FLOAT': 'float', 'NUMERIC': 'float', 'DOUBLE': 'float', 'DECIMAL': 'float',
+    'DATE': 'timestamp', 'DATETIME': 'timestamp', 'TIMESTAMP': 'timestamp',
+}
+
+
+def _coerce_column(series: pd.Series, hint: str):
+    """
+    Vectorized conversion of a string column to the hinted kind.
+
+    Returns the converted series and a boolean mask of values that failed to convert.
+    """
+    present = series.notna()
+    if hint == 'timestamp':
+        converted = pd.to_datetime(series, errors='coerce')
+        return converted, present & converted.isna()
+
+    numeric = pd.to_numeric(series, errors='coerce')
+    failed = present & numeric.isna()
+    if hint == 'int':
+        failed = failed | (numeric.notna() & (numeric % 1 != 0))
+        if not failed.any():
+            numeric = numeric.astype('int64') if not numeric.isna().any() else numeric.astype('Int64')
+    elif not failed.any():
+        numeric = numeric.astype('float64')
+    return numeric, failed
+
+
+def read_csv_with_schema(
+    file_path,
+    db_schema: Optional[Dict[str, Any]] = None,
+    naming_map: Optional[Dict[str, str]] = None,
+    use_threads: bool = True
+) -> (pd.DataFrame, Dict[str, Dict[str, Any]]):
+    """
+    Reads a CSV with pyarrow's multithreaded parser, using the DB schema as dtype hints.
+
+    Columns matching a DB column (see select_columns_for_schema) are read as strings
+    and converted once: INTEGER -> int, REAL -> float, DATE -> timestamp. Values that
+    fail to convert are collected here, so validate_data_types does not re-derive them.
+    A column with failures is left as strings, as the default parser would leave it.
+
+    `file_path` may also be a binary file-like object. `naming_map` (file column ->
+    DB column, e.g. the LLM's naming_mismatches) adds hints for renamed columns.
+
+    Returns the DataFrame and a dict of parse failures keyed by file column name,
+    each shaped like a data_type_mismatch entry. Falls back to pd.read_csv when
+    pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        logging.warning("pyarrow is not installed; falling back to the default pandas CSV parser.")
+        return pd.read_csv(file_path), {}
+
+    hints = {}
+    if db_schema:
+        header = pa_csv.open_csv(file_path).schema.names
+        if hasattr(file_path, 'seek'):
+            file_path.seek(0)
+        db_by_name = {_normalize_column_name(c): c for c in db_schema}
+        for col in select_columns_for_schema(header, db_schema):
+            db_col = db_by_name[_normalize_column_name(col)]
+            hints[col] = (db_col, str(db_schema[db_col]['type']).split('(')[0].upper())
+        for col, db_col in (naming_map or {}).items():
+            if col in header and db_col in db_schema:
+                hints[col] = (db_col, str(db_schema[db_col]['type']).split('(')[0].upper())
+
+    table = pa_csv.read_csv(
+        file_path,
+        read_options=pa_csv.ReadOptions(use_threads=use_threads),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={col: pa.string() for col in hints},
+            strings_can_be_null=True,
+        ),
+    )
+    df = table.to_pandas()
+    logging.debug(f"Parsed CSV with pyarrow: {file_path} ({len(df)} rows, {len(hints)} schema-typed columns)")
+
+    parse_failures = {}
+    for col, (db_col, db_type_base) in hints.items():
+        hint = CSV_TYPE_HINTS.get(db_type_base)
+        if hint is None:
+            continue
+        converted, failed = _coerce_column(df[col], hint)
+        invalid_count = int(failed.sum())
+        if invalid_count == 0:
+            df[col] = converted
+            continue
+        parse_failures[col] = {
+            "column": db_col,
+            "expected_db_type": db_type_base,
+            "found_file_type": str(df[col].dtype),
+            "sample_invalid_values": [str(v) for v in df.loc[failed, col].unique()[:5]],
+            "invalid_count": invalid_count,
+            "detected_during": "parse"
+        }
+
+    return df, parse_failures
+
+
+# --- Reading selected CSV rows ---
+# Sampling mode reads only the sampled lines of a CSV: one pass counts the data
+# lines, a second copies the chosen ones into an in-memory CSV that the usual
+# reader parses. Like sharded CSV mode, this assumes quoted fields hold no line
+# breaks. Empty lines are not rows (as for pyarrow's reader).
+CSV_SCAN_CHUNK_BYTES = 4 * 2**20 # Small enough for the newline scan to stay in cache
+
+
+def _open_binary(file_path):
+    return open(file_path, 'rb') if isinstance(file_path, (str, os.PathLike)) else nullcontext(file_path)
+
+
+def _csv_data_lines(file_path):
+    """Yields (chunk, starts, ends) for the non-empty data lines of a CSV, one chunk at a time."""
+    with _open_binary(file_path) as f:
+        f.readline() # Header
+        carry = b''
+        while True:
+            block = f.read(CSV_SCAN_CHUNK_BYTES)
+            if not block:
+                if carry.strip(b'\r\n'): # A last line without a line break
+                    yield carry + b'\n', np.array([0]), np.array([len(carry) + 1])
+                return
+            chunk = carry + block
+            ends = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 0x0A) + 1
+            if len(ends) == 0:
+                carry = chunk
+                continue
+            starts = np.concatenate(([0], ends[:-1]))
+            lengths = ends - starts
+            first_bytes = np.frombuffer(chunk, dtype=np.uint8)[starts]
+            non_empty = (lengths > 1) & ~((lengths == 2) & (first_bytes == 0x0D))
+            carry = chunk[ends[-1]:]
+            yield chunk, starts[non_empty], ends[non_empty]
+
+
+def count_csv_rows(file_path) -> int:
+    """Counts the data rows of a CSV without parsing it."""
+    return sum(len(starts) for _, starts, _ in _csv_data_lines(file_path))
+
+
+def read_csv_lines(file_path, rows: np.ndarray) -> io.BytesIO:
+    """
+    Returns the header and the data rows at `rows` (sorted positions) as an
+    in-memory CSV. `file_path` may also be a binary file-like object.
+    """
+    with _open_binary(file_path) as f:
+        header = f.readline()
+        f.seek(0)
+    parts = [header if header.endswith(b'\n') else header + b'\n']
+    offset = 0
+    for chunk, starts, ends in _csv_data_lines(file_path):
+        low, high = np.searchsorted(rows, [offset, offset + len(starts)])
+        parts.extend(chunk[starts[i]:ends[i]] for i in rows[low:high] - offset)
+        offset += len(starts)
+    return io.BytesIO(b''.join(parts))
+
+
+def read_csv_column(file_path: str, column: str) -> pd.Series:
+    """Reads one CSV column as strings (e.g. the strata of a stratified sample)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        return pd.read_csv(file_path, usecols=[column], dtype=str)[column]
+    table = pa_csv.read_csv(file_path, convert_options=pa_csv.ConvertOptions(
+        include_columns=[column], column_types={column: pa.string()}, strings_can_be_null=True
+    ))
+    return table.column(0).to_pandas()
+
+
+def extract_file_schema(file_path: str, sheet_name: Optional[str] = None, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Reads a CSV, a specific Excel sheet, or a Parquet/Arrow/Feather input and
+    extracts its schema using extract_schema_from_df.
 
     If sheet_name is None for Excel, reads the first sheet.
+    For columnar inputs, `columns` limits which columns are read; the rest are
+    described from the file schema only.
     Returns a dictionary containing metadata, column details, and sample data.
     """
     df = None
@@ -100,8 +471,13 @@ def extract_file_schema(file_path: str, sheet_name: Optional[str] = None) -> Opt
     file_type = None
 
     try:
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
+        if get_columnar_format(file_path):
+            file_type = 'columnar'
+            df = read_columnar_file(file_path, columns=columns)
+            pruned = [c for c in read_columnar_schema(file_path) if c not in df.columns]
+            return extract_schema_from_df(df, file_path, None, extra_columns=describe_columnar_columns(file_path, pruned))
+        elif file_path.endswith('.csv'):
+            df, _ = read_csv_with_schema(file_path)
             file_type = 'csv'
             current_sheet_name_for_extraction = None # CSV has no sheet name
             logging.info(f"Reading CSV file: {file_path}")
@@ -166,8 +542,9 @@ def compare_schemas(file_schema: Dict[str, Any], db_schema: Dict[str, Any]) -> D
         file_columns = set(file_schema.get('columns', {}).keys()) # Safely get keys
         db_columns = set(db_schema.keys())
 
-        missing_in_file = list(db_columns - file_columns)
-        extra_in_file = list(file_columns - db_columns)
+        # Keep schema order (not set order) so prompts built from this are identical across runs
+        missing_in_file = [c for c in db_schema if c not in file_columns]
+        extra_in_file = [c for c in file_schema['columns'] if c not in db_columns]
 
         logging.info("Schema comparison complete.")
         return {
@@ -181,14 +558,128 @@ def compare_schemas(file_schema: Dict[str, Any], db_schema: Dict[str, Any]) -> D
         return {"columns_missing_from_file": db_keys, "columns_extra_in_file": []}
 
 
-def validate_data_types(df: DataFrame, db_schema: Dict[str, Any]) -> List[Dict[str, Any]]:
+# --- Memory-Budget Helpers ---
+# A string column becomes categorical when its distinct values are at most this share of its rows
+CATEGORICAL_MAX_UNIQUE_RATIO = 0.5
+
+
+def optimize_dataframe_memory(df: DataFrame, categorical_max_unique_ratio: float = CATEGORICAL_MAX_UNIQUE_RATIO) -> DataFrame:
     """
-    Validates DataFrame dtypes against the database schema.
+    Shrinks a DataFrame in place: downcasts integers, downcasts floats when lossless,
+    and converts low-cardinality string columns to categoricals.
 
-    Provides a 'raw report' of mismatches for the LLM to analyze.
+    Columns are addressed by position, so duplicate column names are handled too.
+    """
+    row_count = len(df)
+    for position in range(df.shape[1]):
+        series = df.iloc[:, position]
+        try:
+            if pd.api.types.is_bool_dtype(series.dtype) or isinstance(series.dtype, pd.CategoricalDtype):
+                continue
+            if pd.api.types.is_integer_dtype(series.dtype):
+                df.isetitem(position, pd.to_numeric(series, downcast='integer'))
+            elif pd.api.types.is_float_dtype(series.dtype):
+                downcast = pd.to_numeric(series, downcast='float')
+                # float32 can change values (and CHECK comparisons), so only keep exact downcasts
+                if downcast.dtype != series.dtype and downcast.astype(series.dtype).equals(series):
+                    df.isetitem(position, downcast)
+            elif pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype):
+                if row_count and series.nunique(dropna=True) <= categorical_max_unique_ratio * row_count:
+                    df.isetitem(position, series.astype('category'))
+        except Exception as e:
+            logging.warning(f"Could not optimize memory for column '{df.columns[position]}': {e}")
+    return df
+
+
+def frame_memory_mb(df: DataFrame) -> float:
+    """Returns the deep memory footprint of a DataFrame in MB."""
+    return round(float(df.memory_usage(deep=True).sum()) / 2**20, 2)
+
+
+@contextmanager
+def memory_stage(memory_profile: Optional[List[Dict[str, Any]]], stage: str):
+    """
+    Records the peak traced memory of a pipeline stage into `memory_profile`.
+
+    Yields the stage entry so callers can add details such as 'frame_mb'.
+    Records nothing when `memory_profile` is None or tracemalloc is not tracing,
+    so callers can wrap stages unconditionally. The peak is process-wide: an entry
+    measured while another run held tracemalloc is marked 'shared_peak'.
     """
-    type_violations = []
+    entry = {"stage": stage}
+    if memory_profile is None or not tracemalloc.is_tracing():
+        yield entry
+        return
+    tracemalloc.reset_peak()
+    marker = tracing.peak_marker()
+    try:
+        yield entry
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        entry.update({"peak_mb": round(peak / 2**20, 2), "retained_mb": round(current / 2**20, 2)})
+        if tracing.peak_is_shared(marker):
+            entry["shared_peak"] = True
+        memory_profile.append(entry)
+
 
+def _pandas_type_category(dtype) -> str:
+    """
+    Collapses a concrete dtype onto the general categories used in validate_data_types,
+    so typed inputs (int32, float32, nullable Int64, tz-aware timestamps, Arrow strings)
+    are compared by kind rather than by exact numpy name.
+    """
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'int64'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'float64'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'datetime64[ns]'
+    return 'object'
+
+
+# --- Column-Parallel Check Execution ---
+# Per-column checks are mostly vectorized pandas/NumPy work that releases the GIL,
+# so wide tables are checked on a thread pool. Set to 1 for serial execution.
+COLUMN_CHECK_WORKERS = int(os.getenv("COLUMN_CHECK_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+
+def map_columns(func, column_tasks: List[tuple], max_workers: Optional[int] = None) -> list:
+    """
+    Runs func(*task) for every column task and returns the results in task order,
+    so merged violation lists do not depend on thread scheduling.
+    """
+    workers = COLUMN_CHECK_WORKERS if max_workers is None else max_workers
+    if tracing.is_active():
+        func = tracing.run_in_context(func) # Column spans nest under the caller's span
+    if workers <= 1 or len(column_tasks) <= 1:
+        return [func(*task) for task in column_tasks]
+    with ThreadPoolExecutor(max_workers=min(workers, len(column_tasks))) as pool:
+        return list(pool.map(lambda task: func(*task), column_tasks))
+
+
+def _checked_columns(df: DataFrame, db_schema: Dict[str, Any], context: str) -> List[tuple]:
+    """
+    Pairs each DB column with its Series, in DB schema order. Columns are pulled
+    out here, on the calling thread, so worker threads never index the DataFrame.
+    """
+    columns = []
+    for db_col_name, db_col_details in db_schema.items():
+        if db_col_name not in df.columns:
+            continue # Skip missing columns
+
+        column_data = df[db_col_name]
+        if isinstance(column_data, pd.DataFrame):
+            logging.warning(f"Duplicate column name found for '{db_col_name}' ({context}). "
+                            f"This sheet is likely mismatched with the target DB table. "
+                            f"Skipping this column.")
+            continue
+        columns.append((db_col_name, db_col_details, column_data))
+    return columns
+
+
+def _build_sql_to_pandas_map() -> Dict[str, str]:
     # --- Consider making this map more robust or configurable ---
     pandas_to_sql_map = {
         'int64': ['INTEGER', 'INT'],
@@ -204,106 +695,120 @@ def validate_data_types(df: DataFrame, db_schema: Dict[str, Any]) -> List[Dict[s
             # Handle potential multiple mappings, prioritize non-object if possible
             if sql_type not in sql_to_pandas_map or pd_type != 'object':
                  sql_to_pandas_map[sql_type.upper()] = pd_type # Use upper case for matching
+    return sql_to_pandas_map
+
+
+def _validate_column_type(
+    db_col_name: str,
+    db_col_details: Dict[str, Any],
+    column_data: pd.Series,
+    sql_to_pandas_map: Dict[str, str],
+    parse_failures: Optional[Dict[str, Dict[str, Any]]]
+) -> Optional[Dict[str, Any]]:
+    """Type check for one column; returns its violation or None."""
+    if parse_failures and db_col_name in parse_failures:
+        return {**parse_failures[db_col_name], "column": db_col_name}
+    file_dtype = _pandas_type_category(column_data.dtype)
+    db_type_base = str(db_col_details['type']).split('(')[0].upper()
+    expected_pd_type_category = sql_to_pandas_map.get(db_type_base)
+    mismatch = False
+    if expected_pd_type_category:
+        
+        if file_dtype != expected_pd_type_category:
+            is_db_date_type = db_type_base in ['DATE', 'DATETIME', 'TIMESTAMP']
+            if not (is_db_date_type and file_dtype == 'object'):
+                mismatch = True
+    else:
+        
+        logging.warning(f"DB type '{db_type_base}' for column '{db_col_name}' not in SQL-to-Pandas map. Skipping strict type check.")
 
-    file_schema_columns = df.columns
+    if not mismatch:
+        return None
 
-    for db_col_name, db_col_details in db_schema.items():
-        if db_col_name not in file_schema_columns:
-            continue 
+    sample_invalid_values = []
+    # Improved sample finding for common mismatches
+    try:
+        if expected_pd_type_category == 'int64' and file_dtype == 'object':
+            # Find non-integer strings
+            for val in column_data.dropna().unique():
+                try:
+                    pd.to_numeric(val, errors='raise') 
+                    if float(val) != int(float(val)): 
+                        sample_invalid_values.append(str(val))
+                except (ValueError, TypeError): 
+                     sample_invalid_values.append(str(val))
+                if len(sample_invalid_values) >= 5: break
+        elif expected_pd_type_category == 'float64' and file_dtype == 'object':
+             # Find non-numeric strings
+            for val in column_data.dropna().unique():
+                try:
+                    pd.to_numeric(val, errors='raise')
+                except (ValueError, TypeError):
+                     sample_invalid_values.append(str(val))
+                if len(sample_invalid_values) >= 5: break
         
-        column_data = df[db_col_name]
-        if isinstance(column_data, pd.DataFrame):
-            logging.warning(f"Duplicate column name found for '{db_col_name}' after mapping. "
-                            f"This sheet is likely mismatched with the target DB table. "
-                            f"Skipping type validation for this column.")
-
-            continue 
-        file_dtype = str(df[db_col_name].dtype)
-        db_type_base = str(db_col_details['type']).split('(')[0].upper()
-        expected_pd_type_category = sql_to_pandas_map.get(db_type_base)
-        mismatch = False
-        if expected_pd_type_category:
-            
-            if file_dtype != expected_pd_type_category:
-                is_db_date_type = db_type_base in ['DATE', 'DATETIME', 'TIMESTAMP']
-                if not (is_db_date_type and file_dtype == 'object'):
-                    mismatch = True
-        else:
-            
-            logging.warning(f"DB type '{db_type_base}' for column '{db_col_name}' not in SQL-to-Pandas map. Skipping strict type check.")
+        elif file_dtype == 'object': 
+             sample_invalid_values = [str(v) for v in column_data.dropna().unique()[:5]]
 
-        if mismatch:
-            sample_invalid_values = []
-            # Improved sample finding for common mismatches
-            try:
-                if expected_pd_type_category == 'int64' and file_dtype == 'object':
-                    # Find non-integer strings
-                    for val in df[db_col_name].dropna().unique():
-                        try:
-                            pd.to_numeric(val, errors='raise') 
-                            if float(val) != int(float(val)): 
-                                sample_invalid_values.append(str(val))
-                        except (ValueError, TypeError): 
-                             sample_invalid_values.append(str(val))
-                        if len(sample_invalid_values) >= 5: break
-                elif expected_pd_type_category == 'float64' and file_dtype == 'object':
-                     # Find non-numeric strings
-                    for val in df[db_col_name].dropna().unique():
-                        try:
-                            pd.to_numeric(val, errors='raise')
-                        except (ValueError, TypeError):
-                             sample_invalid_values.append(str(val))
-                        if len(sample_invalid_values) >= 5: break
-                
-                elif file_dtype == 'object': 
-                     sample_invalid_values = [str(v) for v in df[db_col_name].dropna().unique()[:5]]
-
-
-            except Exception as sample_err:
-                 logging.warning(f"Error collecting invalid samples for column {db_col_name}: {sample_err}")
-
-
-            violation = {
-                "column": db_col_name,
-                "expected_db_type": db_type_base, # Use base type
-                "found_file_type": file_dtype,
-                "sample_invalid_values": sample_invalid_values[:5]
-            }
-            type_violations.append(violation)
 
-    logging.info(f"Data type validation complete. Found {len(type_violations)} mismatches.")
-    return type_violations
+    except Exception as sample_err:
+         logging.warning(f"Error collecting invalid samples for column {db_col_name}: {sample_err}")
+
+
+    return {
+        "column": db_col_name,
+        "expected_db_type": db_type_base, # Use base type
+        "found_file_type": str(column_data.dtype),
+        "sample_invalid_values": sample_invalid_values[:5]
+    }
 
 
-def run_data_quality_checks(df: DataFrame, db_schema: Dict[str, Any], engine: sqlalchemy.engine.Engine, table_name: str) -> List[Dict[str, Any]]:
+def validate_data_types(
+    df: DataFrame,
+    db_schema: Dict[str, Any],
+    parse_failures: Optional[Dict[str, Dict[str, Any]]] = None,
+    max_workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
     """
-    Runs basic data quality checks based on DB schema constraints (NULL, UNIQUE/PK, CHECK).
-    Adds severity level.
-    Requires the database engine and table name to fetch check constraints.
+    Validates DataFrame dtypes against the database schema.
+
+    `parse_failures` (from read_csv_with_schema, keyed by DB column name) are
+    reported as-is for their columns instead of being re-derived from dtypes.
+    Columns are checked in parallel (see COLUMN_CHECK_WORKERS); `max_workers=1`
+    runs serially. Results are always in DB schema order.
+
+    Provides a 'raw report' of mismatches for the LLM to analyze.
     """
-    dq_violations = []
-    inspector = inspect(engine)
+    sql_to_pandas_map = _build_sql_to_pandas_map()
+    column_tasks = [
+        (db_col_name, db_col_details, column_data, sql_to_pandas_map, parse_failures)
+        for db_col_name, db_col_details, column_data in _checked_columns(df, db_schema, "type validation")
+    ]
+    with tracing.span("checks.types", rows=len(df), columns=len(column_tasks)):
+        results = map_columns(_validate_column_type, column_tasks, max_workers)
+    type_violations = [violation for violation in results if violation is not None]
 
-    try:
-        check_constraints = inspector.get_check_constraints(table_name)
-        logging.info(f"Fetched {len(check_constraints)} CHECK constraints for table '{table_name}'.")
-    except Exception as e:
-        logging.warning(f"Could not fetch CHECK constraints for table '{table_name}': {e}. Skipping CHECK constraint validation.")
-        check_constraints = []
+    logging.info(f"Data type validation complete. Found {len(type_violations)} mismatches.")
+    return type_violations
 
-    for db_col_name, db_col_details in db_schema.items():
-        if db_col_name not in df.columns:
-            continue # Skip missing columns
 
-        column_data = df[db_col_name]
-        if isinstance(column_data, pd.DataFrame):
-            logging.warning(f"Duplicate column name found for '{db_col_name}' (in data_quality). "
-                            f"This sheet is likely mismatched. "
-                            f"Skipping all data quality checks for this column.")
-            continue
+# Names accepted by run_data_quality_checks(enabled_checks=...)
+DQ_CHECKS = ('not_null', 'primary_key', 'check_constraint')
+
+
+def _check_column_quality(
+    db_col_name: str,
+    db_col_details: Dict[str, Any],
+    column_data: pd.Series,
+    check_constraints: List[Dict[str, Any]],
+    enabled_checks: set
+) -> List[Dict[str, Any]]:
+    """NULL, primary key and CHECK constraint checks for one column."""
+    dq_violations = []
 
-        # --- 1. Null Check (based on 'nullable' constraint) ---
-        if not db_col_details['nullable']:
+    # --- 1. Null Check (based on 'nullable' constraint) ---
+    if 'not_null' in enabled_checks and not db_col_details['nullable']:
+        with tracing.span("check.not_null", column=db_col_name, rows=len(column_data)):
             null_count = int(column_data.isnull().sum())
             # Add check for empty strings treated as nulls if column type is not object/string
             is_numeric_type = pd.api.types.is_numeric_dtype(column_data.dtype)
@@ -315,7 +820,7 @@ def run_data_quality_checks(df: DataFrame, db_schema: Dict[str, Any], engine: sq
                     null_count += empty_string_count # Treat empty strings as nulls for non-text columns
 
             if null_count > 0:
-                affected_rows_sample_indices = df[column_data.isnull() | ((column_data.dtype == 'object') & (column_data == ''))].index.tolist()[:5]
+                affected_rows_sample_indices = column_data.index[column_data.isnull() | ((column_data.dtype == 'object') & (column_data == ''))].tolist()[:5]
                 dq_violations.append({
                     "column": db_col_name,
                     "check": "not_null_violation",
@@ -325,13 +830,14 @@ def run_data_quality_checks(df: DataFrame, db_schema: Dict[str, Any], engine: sq
                     "details": f"Column is non-nullable but contains {null_count} nulls (or empty strings treated as nulls)."
                 })
 
-        # --- 2. Uniqueness Check (based on 'primary_key' constraint) ---
-        if db_col_details['primary_key']:
+    # --- 2. Uniqueness Check (based on 'primary_key' constraint) ---
+    if 'primary_key' in enabled_checks and db_col_details['primary_key']:
+        with tracing.span("check.primary_key", column=db_col_name, rows=len(column_data)):
             # Drop rows where PK is null before checking duplicates, as nulls aren't typically considered duplicates of each other
-            non_null_pk_df = df.dropna(subset=[db_col_name])
-            duplicates_df = non_null_pk_df[non_null_pk_df.duplicated(subset=[db_col_name], keep=False)]
-            distinct_duplicate_values = duplicates_df[db_col_name].unique()
-            duplicate_record_count = len(duplicates_df) # Total number of records involved in duplication
+            non_null_keys = column_data.dropna()
+            duplicate_keys = non_null_keys[non_null_keys.duplicated(keep=False)]
+            distinct_duplicate_values = duplicate_keys.unique()
+            duplicate_record_count = len(duplicate_keys) # Total number of records involved in duplication
             distinct_keys_duplicated = len(distinct_duplicate_values)
 
             if distinct_keys_duplicated > 0:
@@ -346,26 +852,27 @@ def run_data_quality_checks(df: DataFrame, db_schema: Dict[str, Any], engine: sq
                     "details": f"Primary key column contains duplicates for {distinct_keys_duplicated} unique key(s), affecting {duplicate_record_count} records total."
                 })
 
-        # --- 3. [NEW] Check Constraints ---
-        col_check_constraints = [
-            c for c in check_constraints if db_col_name in c.get('sqltext', '')
-        ]
+    # --- 3. [NEW] Check Constraints ---
+    col_check_constraints = [
+        c for c in check_constraints if db_col_name in c.get('sqltext', '')
+    ] if 'check_constraint' in enabled_checks else []
 
-        if col_check_constraints:
-            
+    if col_check_constraints:
+        with tracing.span("check.check_constraint", column=db_col_name, rows=len(column_data), constraints=len(col_check_constraints)):
+        
             numeric_col = pd.to_numeric(column_data, errors='coerce')
             is_numeric = numeric_col.notna().all() 
 
             for constraint in col_check_constraints:
                 sqltext = constraint.get('sqltext', '').strip()
-                
+            
                 match = re.match(rf'["`]?{re.escape(db_col_name)}["`]?\s*(>=|<=|>|<|!=|=)\s*(-?\d+(\.\d+)?)', sqltext, re.IGNORECASE)
 
                 if match and is_numeric:
                     operator = match.group(1)
                     value = float(match.group(2))
                     constraint_name = constraint.get('name')
-                    violated_rows = pd.Series(False, index=df.index) # Initialize
+                    violated_rows = pd.Series(False, index=column_data.index) # Initialize
 
                     try:
                         if operator == '>': violated_rows = numeric_col <= value
@@ -381,8 +888,8 @@ def run_data_quality_checks(df: DataFrame, db_schema: Dict[str, Any], engine: sq
 
                         violation_count = int(violated_rows.sum())
                         if violation_count > 0:
-                            affected_indices = df[violated_rows].index.tolist()[:5]
-                            sample_violating_values = df.loc[affected_indices, db_col_name].tolist()[:5]
+                            affected_indices = column_data.index[violated_rows].tolist()[:5]
+                            sample_violating_values = column_data.loc[affected_indices].tolist()[:5]
                             dq_violations.append({
                                 "column": db_col_name,
                                 "check": "check_constraint_violation",
@@ -400,6 +907,40 @@ def run_data_quality_checks(df: DataFrame, db_schema: Dict[str, Any], engine: sq
                 else:
                      logging.info(f"Skipping CHECK constraint for column '{db_col_name}' as it was complex, non-numeric, or did not match simple patterns: '{sqltext}'")
 
+    return dq_violations
+
+
+def run_data_quality_checks(
+    df: DataFrame,
+    db_schema: Dict[str, Any],
+    engine: sqlalchemy.engine.Engine,
+    table_name: str,
+    enabled_checks: Optional[List[str]] = None,
+    max_workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Runs basic data quality checks based on DB schema constraints (NULL, UNIQUE/PK, CHECK).
+    Adds severity level.
+    Requires the database engine and table name to fetch check constraints.
+    `enabled_checks` limits the run to a subset of DQ_CHECKS (default: all).
+    Columns are checked in parallel like validate_data_types; `max_workers=1` runs serially.
+    """
+    enabled_checks = set(enabled_checks or DQ_CHECKS)
+    inspector = inspect(engine)
+
+    try:
+        check_constraints = inspector.get_check_constraints(table_name)
+        logging.info(f"Fetched {len(check_constraints)} CHECK constraints for table '{table_name}'.")
+    except Exception as e:
+        logging.warning(f"Could not fetch CHECK constraints for table '{table_name}': {e}. Skipping CHECK constraint validation.")
+        check_constraints = []
+
+    column_tasks = [
+        (db_col_name, db_col_details, column_data, check_constraints, enabled_checks)
+        for db_col_name, db_col_details, column_data in _checked_columns(df, db_schema, "data quality")
+    ]
+    with tracing.span("checks.quality", rows=len(df), columns=len(column_tasks)):
+        dq_violations = [v for column_violations in map_columns(_check_column_quality, column_tasks, max_workers) for v in column_violations]
 
     logging.info(f"Data quality checks complete. Found {len(dq_violations)} violations.")
     return dq_violations
@@ -0,0 +1,321 @@
+import os
+import json
+import time
+import uuid
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+# ==============================================================
+# Lightweight tracing: nested spans with wall/CPU time, rows and peak memory
+# ==============================================================
+# Usage:
+#   tracer = tracing.Tracer()
+#   with tracing.activate(tracer):
+#       with tracing.span("load", sheet="Orders") as s:
+#           df = ...
+#           s.set(rows=len(df))
+#   tracer.write_files("report")  # report.trace.json (Chrome/Perfetto) + report.otlp.json
+#
+# With no active tracer, span() returns a shared no-op object, so instrumented code
+# pays one context variable lookup per span. Spans opened in executor threads nest
+# under their caller when the task runs in a copy of the caller's context
+# (see run_in_context).
+#
+# cpu_ms is the CPU time of the thread that ran the span. peak_mb is recorded only
+# while tracemalloc is tracing; tracemalloc's peak is process-wide, so concurrent
+# spans (other threads or jobs) share it. Runs that need tracemalloc hold a
+# tracemalloc_session(): the first holder starts tracing and the last one stops it,
+# so concurrent jobs do not stop each other's tracing. Sessions nested in one run
+# (its context, see run_in_context) count once. A span measured while another
+# run's session was open gets a 'shared_peak' attribute.
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_holders = 0
+_tracemalloc_opened = 0 # Sessions ever opened; a change during a measurement means a run overlapped it
+_tracemalloc_owned = False # Whether the sessions started tracing (and so must stop it)
+_in_tracemalloc_session: contextvars.ContextVar = contextvars.ContextVar("in_tracemalloc_session", default=False)
+
+_active_tracer: contextvars.ContextVar = contextvars.ContextVar("active_tracer", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+@contextmanager
+def tracemalloc_session():
+    """Holds tracemalloc for the block: starts tracing for the first holder, stops it after the last."""
+    global _tracemalloc_holders, _tracemalloc_opened, _tracemalloc_owned
+    if _in_tracemalloc_session.get():
+        yield # Already held by this run
+        return
+    token = _in_tracemalloc_session.set(True)
+    with _tracemalloc_lock:
+        if _tracemalloc_holders == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_owned = True
+        _tracemalloc_holders += 1
+        _tracemalloc_opened += 1
+    try:
+        yield
+    finally:
+        with _tracemalloc_lock:
+            _tracemalloc_holders -= 1
+            if _tracemalloc_holders == 0 and _tracemalloc_owned:
+                tracemalloc.stop()
+                _tracemalloc_owned = False
+        _in_tracemalloc_session.reset(token)
+
+
+def peak_marker() -> tuple:
+    """Marks the start of a peak measurement; pass it to peak_is_shared() at the end."""
+    return (_tracemalloc_holders, _tracemalloc_opened)
+
+
+def peak_is_shared(marker: tuple) -> bool:
+    """True if another tracemalloc session was open at some point since `marker`, so the peak includes its allocations."""
+    holders, opened = marker
+    return holders > 1 or _tracemalloc_holders > 1 or _tracemalloc_opened != opened
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "attributes", "span_id", "parent", "thread_id", "start_ns", "wall_ns",
+                 "cpu_ns", "peak_bytes", "error", "_token", "_perf_start", "_cpu_start", "_peak", "_memory", "_peak_marker")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent: Optional[Span] = None
+        self.peak_bytes: Optional[int] = None
+        self.error: Optional[str] = None
+        self._peak = 0
+        self._memory = False
+
+    def set(self, **attributes) -> None:
+        """Adds attributes to the span; `rows` is reported as rows processed."""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self._token = _current_span.set(self)
+        self.thread_id = threading.get_ident()
+        if self.tracer.track_memory and tracemalloc.is_tracing():
+            # Fold the peak so far into the parent before measuring this span on its own
+            if self.parent is not None and self.parent._memory:
+                self.parent._peak = max(self.parent._peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._memory = True
+            self._peak_marker = peak_marker()
+        for listener in self.tracer.listeners:
+            listener.span_started(self)
+        self.start_ns = time.time_ns()
+        self._perf_start = time.perf_counter_ns()
+        self._cpu_start = time.thread_time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_ns = time.perf_counter_ns() - self._perf_start
+        self.cpu_ns = time.thread_time_ns() - self._cpu_start
+        for listener in self.tracer.listeners:
+            listener.span_finished(self)
+        if self._memory and tracemalloc.is_tracing():
+            self.peak_bytes = max(self._peak, tracemalloc.get_traced_memory()[1])
+            if self.parent is not None and self.parent._memory:
+                self.parent._peak = max(self.parent._peak, self.peak_bytes)
+            tracemalloc.reset_peak()
+            if peak_is_shared(self._peak_marker):
+                self.attributes["shared_peak"] = True
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        self.tracer.spans.append(self) # list.append is atomic, spans may end on any thread
+        return False
+
+    def to_dict(self, origin_ns: int) -> Dict[str, Any]:
+        entry = {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "start_ms": round((self.start_ns - origin_ns) / 1e6, 3),
+            "wall_ms": round(self.wall_ns / 1e6, 3),
+            "cpu_ms": round(self.cpu_ns / 1e6, 3),
+            "rows": self.attributes.get("rows"),
+            "peak_mb": round(self.peak_bytes / (1024 * 1024), 3) if self.peak_bytes is not None else None,
+            "attributes": {k: v for k, v in self.attributes.items() if k != "rows"},
+        }
+        if self.error:
+            entry["error"] = self.error
+        return entry
+
+
+class Tracer:
+    """
+    Collects the spans of one run. `listeners` get span_started(span) and
+    span_finished(span) calls on the thread that runs the span (see profiling.py).
+    """
+
+    def __init__(self, track_memory: bool = True):
+        self.trace_id = uuid.uuid4().hex
+        self.track_memory = track_memory
+        self.spans: List[Span] = []
+        self.listeners: List[Any] = []
+        self.created_ns = time.time_ns()
+
+    def _ordered(self) -> List[Span]:
+        return sorted(self.spans, key=lambda s: s.start_ns)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Spans in start order with times relative to the tracer's creation, plus per-name totals."""
+        return {
+            "trace_id": self.trace_id,
+            "spans": [s.to_dict(self.created_ns) for s in self._ordered()],
+            "summary": self.summary(),
+        }
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        totals: Dict[str, Dict[str, Any]] = {}
+        for s in self._ordered():
+            entry = totals.setdefault(s.name, {"count": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "rows": 0, "max_peak_mb": None})
+            entry["count"] += 1
+            entry["wall_ms"] = round(entry["wall_ms"] + s.wall_ns / 1e6, 3)
+            entry["cpu_ms"] = round(entry["cpu_ms"] + s.cpu_ns / 1e6, 3)
+            entry["rows"] += s.attributes.get("rows") or 0
+            if s.peak_bytes is not None:
+                peak_mb = round(s.peak_bytes / (1024 * 1024), 3)
+                entry["max_peak_mb"] = peak_mb if entry["max_peak_mb"] is None else max(entry["max_peak_mb"], peak_mb)
+        for entry in totals.values():
+            if entry["rows"] and entry["wall_ms"]:
+                entry["rows_per_second"] = round(entry["rows"] / (entry["wall_ms"] / 1000))
+        return totals
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Chrome trace event format (chrome://tracing, Perfetto): one complete event per span."""
+        pid = os.getpid()
+        events = []
+        for s in self._ordered():
+            args = {k: v for k, v in s.attributes.items()}
+            args.update({"cpu_ms": round(s.cpu_ns / 1e6, 3)})
+            if s.peak_bytes is not None:
+                args["peak_mb"] = round(s.peak_bytes / (1024 * 1024), 3)
+            if s.error:
+                args["error"] = s.error
+            events.append({
+                "name": s.name, "cat": s.name.split(".")[0], "ph": "X", "pid": pid, "tid": s.thread_id,
+                "ts": (s.start_ns - self.created_ns) / 1000, "dur": s.wall_ns / 1000, "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"trace_id": self.trace_id}}
+
+    def to_otlp(self, service_name: str = "schema-validator") -> Dict[str, Any]:
+        """OTLP/JSON (ExportTraceServiceRequest) shape, for collectors that accept file or HTTP JSON input."""
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        spans = []
+        for s in self._ordered():
+            attributes = [attribute(k, v) for k, v in s.attributes.items() if v is not None]
+            attributes.append(attribute("cpu_ms", round(s.cpu_ns / 1e6, 3)))
+            if s.peak_bytes is not None:
+                attributes.append(attribute("peak_bytes", s.peak_bytes))
+            spans.append({
+                "traceId": self.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent.span_id if s.parent is not None else "",
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.start_ns + s.wall_ns),
+                "attributes": attributes,
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            })
+        return {"resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", service_name)]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+        }]}
+
+    def write_files(self, path_prefix: str) -> Dict[str, str]:
+        """Writes <prefix>.trace.json (Chrome) and <prefix>.otlp.json; returns their paths."""
+        paths = {"chrome_trace": f"{path_prefix}.trace.json", "otlp": f"{path_prefix}.otlp.json"}
+        with open(paths["chrome_trace"], "w") as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+        with open(paths["otlp"], "w") as f:
+            json.dump(self.to_otlp(), f, default=str)
+        return paths
+
+
+def span(name: str, **attributes):
+    """Opens a span under the current one, or returns a no-op when no tracer is active."""
+    tracer = _active_tracer.get()
+    if tracer is None:
+        return _NOOP_SPAN
+    return Span(tracer, name, attributes)
+
+
+class SpanSequence:
+    """
+    Consecutive sibling spans for code split into stages: start() ends the
+    previous stage and opens the next, end() closes the last one (pass the
+    exception to record it on the stage that failed).
+    """
+
+    def __init__(self, **attributes):
+        self.attributes = attributes
+        self._open = None
+
+    def start(self, name: str, **attributes):
+        self.end()
+        self._open = span(name, **{**self.attributes, **attributes})
+        return self._open.__enter__()
+
+    def end(self, exc: Optional[BaseException] = None) -> None:
+        if self._open is not None:
+            open_span, self._open = self._open, None
+            open_span.__exit__(type(exc) if exc is not None else None, exc, None)
+
+
+def current_span():
+    """The innermost open span (or a no-op), for adding attributes from deeper code."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def is_active() -> bool:
+    return _active_tracer.get() is not None
+
+
+@contextmanager
+def activate(tracer: Optional[Tracer]):
+    """Makes `tracer` the active tracer for this context (None disables tracing)."""
+    token = _active_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _active_tracer.reset(token)
+
+
+def run_in_context(func):
+    """Wraps func so each call runs in a copy of the caller's context (use when submitting to executors)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
@@ -1,13 +1,118 @@
 import streamlit as st
 import tempfile
 import os
-import json # Added to parse JSON strings
-
-# Import the functions from your project
-# We use mock functions here for demonstration
-from main import run_multi_sheet_validation
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# main is imported on first use (cache keys, the worker); the page itself only needs the markdown renderer
 from build_md import create_validation_markdown
 
+UI_WORKERS = int(os.getenv("UI_WORKERS", "4")) # Validations running at once, shared by all sessions
+UI_REPORT_CACHE_SIZE = int(os.getenv("UI_REPORT_CACHE_SIZE", "64"))
+UI_POLL_SECONDS = 1.0
+
+STAGE_LABELS = {
+    "schema_extraction": "Extracting schema",
+    "schema_analysis": "Mapping columns (LLM)",
+    "deep_validation": "Checking types and data quality",
+    "dynamic_rules": "Inferring rules (LLM)",
+    "final_analysis": "Writing the analysis (LLM)",
+}
+
+
+class ValidationRunner:
+    """
+    Runs validations on a background thread pool shared by every session, and
+    keeps the rendered reports of recent runs keyed by file content, table name,
+    the target table's schema version and the validator version (prompts, deployments).
+    Sessions that submit the same file and table while it is running share the job.
+    """
+
+    def __init__(self, workers: int, cache_size: int):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ui-validation")
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.reports = OrderedDict()
+        self.cache_size = cache_size
+
+    @staticmethod
+    def cache_key(file_bytes: bytes, table_name: str) -> str:
+        import main
+
+        try:
+            schema_version = main.get_target_schema_version(main.DB_URL, table_name) or ""
+        except Exception as e:
+            # The run itself will report the database error; failed runs are not cached
+            logging.warning(f"Could not read the schema version of '{table_name}': {e}")
+            schema_version = ""
+        hasher = hashlib.sha256(file_bytes)
+        for part in (table_name, schema_version, main.get_validator_version()):
+            hasher.update(b"\0" + part.encode("utf-8"))
+        return hasher.hexdigest()
+
+    def cached_report(self, key: str):
+        with self.lock:
+            if key in self.reports:
+                self.reports.move_to_end(key)
+                return self.reports[key]
+        return None
+
+    def submit(self, key: str, file_name: str, file_bytes: bytes, table_name: str) -> dict:
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is None or job["state"] == "failed":
+                job = {"state": "queued", "events": [], "markdown": None, "error": None}
+                self.jobs[key] = job
+                self.pool.submit(self._run, key, job, file_name, file_bytes, table_name)
+            return job
+
+    def job(self, key: str):
+        with self.lock:
+            return self.jobs.get(key)
+
+    def _run(self, key, job, file_name, file_bytes, table_name):
+        import main
+
+        job["state"] = "running"
+        work_dir = tempfile.mkdtemp(prefix="ui-validation-")
+        try:
+            file_path = os.path.join(work_dir, os.path.basename(file_name))
+            with open(file_path, "wb") as f:
+                f.write(file_bytes)
+            validation_data = main.run_multi_sheet_validation(
+                file_path=file_path,
+                user_provided_table_name=table_name,
+                run_dir=os.path.join(work_dir, "checkpoints"),
+                output_path=os.path.join(work_dir, "report.json"),
+                print_report=False,
+                progress_callback=job["events"].append
+            )
+            if not isinstance(validation_data, dict):
+                raise ValueError(f"The validation function returned an unexpected data type: {type(validation_data)}")
+            job["markdown"] = create_validation_markdown(validation_data)
+            with self.lock:
+                self.reports[key] = job["markdown"]
+                while len(self.reports) > self.cache_size:
+                    self.reports.popitem(last=False)
+                self.jobs.pop(key, None)
+            job["state"] = "done"
+        except Exception as e:
+            job["error"] = str(e)
+            job["state"] = "failed"
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+@st.cache_resource
+def get_validation_runner() -> ValidationRunner:
+    return ValidationRunner(UI_WORKERS, UI_REPORT_CACHE_SIZE)
+
+
 # --- Page Configuration ---
 st.set_page_config(page_title="SchemaValidator", layout="wide")
 st.title("🤖 SchemaValidator UI")
@@ -24,6 +129,8 @@ with chat_container:
         with st.chat_message(message["role"]):
             st.markdown(message["content"], unsafe_allow_html=True)
 
+# Filled with the progress of this session's running validation (see the end of the script)
+progress_placeholder = st.empty()
 
 # --- User Input Area (Fixed at bottom) ---
 # This CSS makes the input_container stick to the bottom
@@ -47,7 +154,7 @@ with input_container:
     with col1:
         uploaded_file = st.file_uploader(
             "Upload Excel File",
-            type=['xlsx', 'xls','csv'],
+            type=['xlsx', 'xls','csv', 'parquet', 'feather', 'arrow'],
             label_visibility="collapsed"
         )
         # Store uploaded file in session state immediately
@@ -66,6 +173,8 @@ with input_container:
         send_button = st.button("➤", help="Send")
 
 # --- Logic to handle submission ---
+runner = get_validation_runner()
+
 if send_button and prompt:
     # Add user message to chat
     st.session_state.messages.append({"role": "user", "content": prompt})
@@ -76,48 +185,15 @@ if send_button and prompt:
     if not file_to_process:
         st.session_state.messages.append({"role": "assistant", "content": "Please upload an Excel file first."})
     else:
-        # Process the file
-        with st.spinner(f"Validating table `{prompt}`..."):
-            temp_file_path = ""
-            try:
-                # 1. Save the uploaded file to a temporary path
-                with tempfile.NamedTemporaryFile(delete=False, suffix=file_to_process.name) as tmp:
-                    tmp.write(file_to_process.getvalue())
-                    temp_file_path = tmp.name
-
-                # 2. Call your validation function
-                validation_output = run_multi_sheet_validation(
-                    file_path=temp_file_path,
-                    user_provided_table_name=prompt
-                )
-
-                # 2a. Parse the output if it's a string (to fix the error)
-                validation_data = {}
-                if isinstance(validation_output, str):
-                    try:
-                        validation_data = json.loads(validation_output)
-                    except json.JSONDecodeError:
-                        st.session_state.messages.append({"role": "assistant", "content": "Error: The validation function returned an invalid JSON string."})
-                        st.rerun() # Stop processing
-                elif isinstance(validation_output, dict):
-                    validation_data = validation_output
-                else:
-                    st.session_state.messages.append({"role": "assistant", "content": f"Error: The validation function returned an unexpected data type: {type(validation_output)}"})
-                    st.rerun() # Stop processing
-
-
-                # 3. Call your markdown creation function
-                md_report = create_validation_markdown(validation_data)
-
-                # 4. Add report to chat
-                st.session_state.messages.append({"role": "assistant", "content": md_report})
-
-            except Exception as e:
-                st.session_state.messages.append({"role": "assistant", "content": f"An error occurred: {e}"})
-            finally:
-                # 5. Clean up the temporary file
-                if temp_file_path and os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
+        file_bytes = file_to_process.getvalue()
+        key = runner.cache_key(file_bytes, prompt)
+        md_report = runner.cached_report(key)
+        if md_report is not None:
+            st.session_state.messages.append({"role": "assistant", "content": md_report})
+        else:
+            # Validation runs in the background; this session polls it below
+            runner.submit(key, file_to_process.name, file_bytes, prompt)
+            st.session_state.active_job = {"key": key, "table": prompt, "file_name": file_to_process.name}
 
     # Clear the text input by rerunning
     st.rerun()
@@ -125,3 +201,36 @@ if send_button and prompt:
 elif send_button and not prompt:
     st.toast("Please enter a table name.")
 
+# --- Progress of this session's running validation ---
+active = st.session_state.get("active_job")
+if active:
+    job = runner.job(active["key"])
+    md_report = runner.cached_report(active["key"])
+    if md_report is not None or job is None or job["state"] in ("done", "failed"):
+        if md_report is not None:
+            st.session_state.messages.append({"role": "assistant", "content": md_report})
+        else:
+            error = job["error"] if job else "The validation was lost; please resubmit."
+            st.session_state.messages.append({"role": "assistant", "content": f"An error occurred: {error}"})
+        del st.session_state.active_job
+        st.rerun()
+
+    events = list(job["events"])
+    run_started = next((e for e in events if e["event"] == "run_started"), None)
+    sheets_total = len(run_started["sheets"]) if run_started else 0
+    finished = [e for e in events if e["event"] == "sheet_finished"]
+    stage = next((e for e in reversed(events) if e["event"] == "stage"), None)
+
+    with progress_placeholder.status(f"Validating `{active['file_name']}` against `{active['table']}`...", expanded=True):
+        st.progress(len(finished) / sheets_total if sheets_total else 0.0,
+                    text=f"{len(finished)} of {sheets_total or '?'} sheets done")
+        for e in finished:
+            sheet_label = e["sheet"] if e["sheet"] is not None else "CSV data"
+            st.write(f"✅ {sheet_label}: {e.get('status') or 'N/A'}" + (" (cached)" if e.get("source") != "validated" else ""))
+        if stage:
+            sheet_label = stage["sheet"] if stage["sheet"] is not None else "CSV data"
+            st.write(f"⏳ {sheet_label}: {STAGE_LABELS.get(stage['stage'], stage['stage'])}...")
+        elif job["state"] == "queued":
+            st.write("Waiting for a free worker...")
+    time.sleep(UI_POLL_SECONDS)
+    st.rerun()